@@ -0,0 +1,185 @@
+`timescale 1ns / 1ps
+//////////////////////////////////////////////////////////////////////////////////
+// ߶֡ƽ̨Icarus Verilog / Vivado XSim
+// ܣ
+//   1.  frames.hex ȡλɵ UART ֽlens.hex Ϊֽ֡ 00 β
+//   2. ÿ֡ǰȴ move_fsm У 8N1 λ uart_rx
+//   3.  step/dir ۼƻеλã⿪ʱλü¼ "x y  "  burn.txt
+// ɲȶԣpython benchmarks/bench_segment_encoding.py --export-vectors <Ŀ¼>
+// Icarus ÷Ŀ¼£
+//   iverilog -o tb_segment -s tb_segment <ļ> uart_rx_image.v move_fsm.v stepper_ctrl.v
+//   vvp tb_segment
+//   python benchmarks/bench_segment_encoding.py --check-burn <Ŀ¼>
+//////////////////////////////////////////////////////////////////////////////////
+
+module tb_segment;
+
+    // ٣߲ʡعʱ䣨Э״̬߼䣩
+    localparam integer CLK_FREQ    = 50_000_000;
+    localparam integer BAUD_RATE   = 2_500_000;
+    localparam integer BIT_CYCLES  = CLK_FREQ / BAUD_RATE;
+    localparam integer DWELL       = 200;
+    localparam integer MAX_BYTES   = 65536;
+    localparam integer MAX_FRAMES  = 8192;
+
+    reg clk = 1'b0;
+    reg reset_n = 1'b0;
+    reg uart_rx = 1'b1;
+    reg run_en = 1'b1;
+
+    always #10 clk = ~clk;  // 50MHz
+
+    // ---------------- ģ ----------------
+    wire [15:0] x_data, y_data, seg_len;
+    wire [7:0]  pixel;
+    wire        frame_valid;
+    wire        data_ready, step_busy, step_done;
+    wire [11:0] start_x, start_y, target_x, target_y;
+    wire        laser_en;
+    wire [9:0]  laser_power;
+    wire [11:0] cur_x, cur_y;
+    wire        fsm_busy;
+    wire        step_x, dir_x, step_y, dir_y, motor_en;
+
+    uart_rx_image #(
+        .CLK_FREQ  (CLK_FREQ),
+        .BAUD_RATE (BAUD_RATE)
+    ) u_rx_image (
+        .clk         (clk),
+        .reset_n     (reset_n),
+        .uart_rx     (uart_rx),
+        .x_data      (x_data),
+        .y_data      (y_data),
+        .pixel       (pixel),
+        .seg_len     (seg_len),
+        .frame_valid (frame_valid)
+    );
+
+    move_fsm #(
+        .DWELL_TICKS (DWELL)
+    ) u_fsm (
+        .clk         (clk),
+        .reset_n     (reset_n),
+        .run_en      (run_en),
+        .x_in        (x_data),
+        .y_in        (y_data),
+        .pixel       (pixel),
+        .len_in      (seg_len),
+        .frame_valid (frame_valid),
+        .data_ready  (data_ready),
+        .start_x     (start_x),
+        .start_y     (start_y),
+        .target_x    (target_x),
+        .target_y    (target_y),
+        .step_busy   (step_busy),
+        .step_done   (step_done),
+        .laser_en    (laser_en),
+        .laser_power (laser_power),
+        .cur_x       (cur_x),
+        .cur_y       (cur_y),
+        .busy        (fsm_busy)
+    );
+
+    stepper_ctrl u_stepper (
+        .clk        (clk),
+        .reset_n    (reset_n),
+        .data_ready (data_ready),
+        .start_x    (start_x),
+        .start_y    (start_y),
+        .target_x   (target_x),
+        .target_y   (target_y),
+        .step_x     (step_x),
+        .dir_x      (dir_x),
+        .step_y     (step_y),
+        .dir_y      (dir_y),
+        .motor_en   (motor_en),
+        .busy       (step_busy),
+        .done       (step_done)
+    );
+
+    // ---------------- еλ¼ ----------------
+    integer abs_x = 0, abs_y = 0;
+    integer burn_x = -1, burn_y = -1, burn_cycles = 0, burn_power = 0;
+    integer fd;
+
+    task flush_burn;
+        begin
+            if (burn_cycles > 0)
+                $fdisplay(fd, "%0d %0d %0d %0d", burn_x, burn_y, burn_power, burn_cycles);
+            burn_cycles = 0;
+        end
+    endtask
+
+    always @(posedge clk) begin
+        if (step_x) abs_x = abs_x + (dir_x ? -1 : 1);
+        if (step_y) abs_y = abs_y + (dir_y ? -1 : 1);
+        if (laser_en) begin
+            if (burn_cycles == 0 || abs_x != burn_x || abs_y != burn_y || laser_power != burn_power) begin
+                flush_burn;
+                burn_x = abs_x;
+                burn_y = abs_y;
+                burn_power = laser_power;
+            end
+            burn_cycles = burn_cycles + 1;
+        end else begin
+            flush_burn;
+        end
+    end
+
+    // ---------------- UART  ----------------
+    task uart_send_byte;
+        input [7:0] b;
+        integer i;
+        begin
+            uart_rx = 1'b0;                                   // ʼλ
+            repeat (BIT_CYCLES) @(posedge clk);
+            for (i = 0; i < 8; i = i + 1) begin               // λλȷ
+                uart_rx = b[i];
+                repeat (BIT_CYCLES) @(posedge clk);
+            end
+            uart_rx = 1'b1;                                   // ֹͣλ
+            repeat (BIT_CYCLES) @(posedge clk);
+        end
+    endtask
+
+    task wait_fsm_idle;
+        input integer cycles;
+        integer idle;
+        begin
+            idle = 0;
+            while (idle < cycles) begin
+                @(posedge clk);
+                idle = fsm_busy ? 0 : idle + 1;
+            end
+        end
+    endtask
+
+    reg [7:0] frames [0:MAX_BYTES-1];
+    reg [7:0] lens   [0:MAX_FRAMES-1];
+    integer f, j, pos;
+
+    initial begin
+        $readmemh("frames.hex", frames);
+        $readmemh("lens.hex", lens);
+        fd = $fopen("burn.txt", "w");
+
+        repeat (5) @(posedge clk);
+        reset_n = 1'b1;
+        repeat (50) @(posedge clk);
+
+        pos = 0;
+        for (f = 0; f < MAX_FRAMES && lens[f] != 8'h00; f = f + 1) begin
+            wait_fsm_idle(50);
+            for (j = 0; j < lens[f]; j = j + 1) begin
+                uart_send_byte(frames[pos]);
+                pos = pos + 1;
+            end
+        end
+        wait_fsm_idle(200);
+        flush_burn;
+        $fclose(fd);
+        $display("tb_segment: %0d ֡, %0d ֽ, λ (%0d, %0d)", f, pos, abs_x, abs_y);
+        $finish;
+    end
+
+endmodule
@@ -38,6 +38,7 @@ module main(
     // UARTͼ֡ģ
     wire [15:0] x_data, y_data;
     wire [7:0]  pixel;
+    wire [15:0] seg_len;
     wire        frame_valid;
     
     // ź
@@ -140,6 +141,7 @@ module main(
         .x_data      (x_data),
         .y_data      (y_data),
         .pixel       (pixel),
+        .seg_len     (seg_len),
         .frame_valid (frame_valid)
     );
 
@@ -151,6 +153,7 @@ module main(
         .x_in        (x_data),
         .y_in        (y_data),
         .pixel       (pixel),
+        .len_in      (seg_len),
         .frame_valid (frame_valid),
         .data_ready  (data_ready),
         .start_x     (start_x),
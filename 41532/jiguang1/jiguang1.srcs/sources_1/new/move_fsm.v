@@ -2,11 +2,13 @@
 // =============================================================================
 // move_fsm.v - ˶+ع״ֱ̬ڷ/
 // stepper_ctrlṩlaser_ctrlṩ
-// 룺run_enʼx/y/pixel/frame_valid
+// 룺run_enʼx/y/pixel/len/frame_valid / ߶
 //  stepper_ctrl һƶ +  laser_ctrl عſغ͹
 // Ҫframe_valid ǡذЧ塿յذһֽ 0x55 
 //       Լ 1 ʱӳߣԼ 2 ʱӿ㵱ǰʵ֣
 //        FSM ڿ̬ frame_valid ġء档
+// ߶Σlen_in > 1 ʱ (x,y)  +X  ƶ -> ع⣬ len_in أ
+//       ֮伤Ᵽֿͬһʣֻһֻ֡ڶĩصС
 // =============================================================================
 module move_fsm #(
     parameter DWELL_TICKS = 32'd50000,   // ÿعſʱ@50MHz 1ms
@@ -22,6 +24,7 @@ module move_fsm #(
     input  wire [15:0] x_in,
     input  wire [15:0] y_in,
     input  wire [7:0]  pixel,
+    input  wire [15:0] len_in,           // ߶γȣ֡Ϊ1
     input  wire        frame_valid,
 
     //  stepper_ctrl /֣ stepper_ctrl ˿ڶ룩
@@ -50,6 +53,7 @@ module move_fsm #(
     // ---------------- ڲĴ ----------------
     reg  [15:0] x_latch, y_latch;
     reg  [7:0]  pix_latch;
+    reg  [15:0] len_left;                // ʣǰأ
     reg  [31:0] dwell_cnt;
 
     //  frame_valid ͬؼ⣨"βԼ1clkҿȡ2clk"ʱ
@@ -72,7 +76,8 @@ module move_fsm #(
         S_LATCH = 3'd1,
         S_MOVE  = 3'd2,
         S_FIRE  = 3'd3,
-        S_DONE  = 3'd4;
+        S_DONE  = 3'd4,
+        S_NEXT  = 3'd5;
 
     reg [2:0] state, state_n;
 
@@ -86,15 +91,20 @@ module move_fsm #(
         end
     endfunction
 
+    // stepper_ctrl ص IDLEbusy/done Ϊ 0ܽµ data_ready
+    wire step_idle;
+    assign step_idle = ~step_busy & ~step_done;
+
     // ---------------- ߼״̬ת ----------------
     always @* begin
         state_n = state;
         case (state)
             S_IDLE:  if (run_en && fv_rise) state_n = S_LATCH; // Ӧ
-            S_LATCH:                         state_n = S_MOVE;
+            S_LATCH:  if (step_idle)         state_n = S_MOVE;
             S_MOVE:   if (step_done)         state_n = S_FIRE;
-            S_FIRE:   if (dwell_cnt == 0)    state_n = S_DONE;
-            S_DONE:                          state_n = S_IDLE;   // 㣻ص
+            S_FIRE:   if (dwell_cnt <= 1)    state_n = (len_left > 1) ? S_NEXT : S_DONE;
+            S_NEXT:                          state_n = S_LATCH;  // ߶Σһ
+            S_DONE:                          state_n = S_IDLE;   // /Σص
             default:                         state_n = S_IDLE;
         endcase
     end
@@ -106,6 +116,7 @@ module move_fsm #(
             x_latch     <= 16'd0;
             y_latch     <= 16'd0;
             pix_latch   <= 8'd0;
+            len_left    <= 16'd0;
             start_x     <= 12'd0;
             start_y     <= 12'd0;
             target_x    <= 12'd0;
@@ -130,6 +141,7 @@ module move_fsm #(
                         x_latch   <= x_in;
                         y_latch   <= y_in;
                         pix_latch <= pixel;
+                        len_left  <= (len_in == 16'd0) ? 16'd1 : len_in;
                     end
                 end
                 S_LATCH: begin
@@ -138,21 +150,28 @@ module move_fsm #(
                     start_y   <= cur_y;
                     target_x  <= x_latch[11:0];
                     target_y  <= y_latch[11:0];
-                    data_ready<= 1'b1;      //  stepper_ctrl
+                    data_ready<= step_idle; // к󴥷 stepper_ctrl
                 end
                 S_MOVE: begin
-                    // ȴ step_done
+                    // ȴ step_doneɵͬһװع
+                    if (step_done) begin
+                        // ƶɺµǰλ
+                        cur_x <= target_x;
+                        cur_y <= target_y;
+                        // ǿӳ书ʣΪ 0 ʹܼ
+                        laser_power <= pixel_to_power(pix_latch);
+                        laser_en    <= (pix_latch != 8'd0);
+                        dwell_cnt   <= DWELL_TICKS[31:0];
+                    end
                 end
                 S_FIRE: begin
-                    // ƶɺµǰλ
-                    cur_x <= target_x;
-                    cur_y <= target_y;
-                    // ǿӳ书ʣΪ 0 ʹܼ
-                    laser_power <= pixel_to_power(pix_latch);
-                    laser_en    <= (pix_latch != 8'd0);
-                    // عݼ
-                    if (dwell_cnt == 0) dwell_cnt <= DWELL_TICKS[31:0];
-                    else                dwell_cnt <= dwell_cnt - 1'b1;
+                    // عݼ DWELL_TICKS ʱ
+                    if (dwell_cnt != 0) dwell_cnt <= dwell_cnt - 1'b1;
+                end
+                S_NEXT: begin
+                    // ߶һأX+1Ᵽֿ
+                    x_latch  <= x_latch + 1'b1;
+                    len_left <= len_left - 1'b1;
                 end
                 S_DONE: begin
                     laser_en  <= 1'b0;
@@ -67,6 +67,7 @@ reg [7:0] enable_delay;        // ʹ
 
 // ʽ
 wire [11:0] abs_dx_calc, abs_dy_calc;  // ߼ľԾ
+wire [12:0] error_x_next, error_y_next;  // ȥλΪλ
 
 // ============================================================================
 // ߼ - Ծ
@@ -76,6 +77,10 @@ wire [11:0] abs_dx_calc, abs_dy_calc;  // 
 assign abs_dx_calc = (target_x >= start_x) ? (target_x - start_x) : (start_x - target_x);
 assign abs_dy_calc = (target_y >= start_y) ? (target_y - start_y) : (start_y - target_y);
 
+// BresenhamȼȥٰžǷ񲽽
+assign error_x_next = error - {1'b0, abs_dy};
+assign error_y_next = error - {1'b0, abs_dx};
+
 // ============================================================================
 // ٶȿģ
 // ============================================================================
@@ -192,18 +197,20 @@ always @(posedge clk or negedge reset_n) begin
                     if (abs_dx > abs_dy) begin
                         // XΪ
                         step_x <= 1'b1;                            // ƶX
-                        error <= error - {1'b0, abs_dy};           // ȥdy
-                        if (error[12]) begin                       // ǷΪֵλ
+                        if (error_x_next[12]) begin                // ȥdyΪֵλ
                             step_y <= 1'b1;                        // ҪƶY
-                            error <= error + {1'b0, abs_dx};       // dx
+                            error <= error_x_next + {1'b0, abs_dx}; // dx
+                        end else begin
+                            error <= error_x_next;                 // ȥdy
                         end
                     end else begin
                         // YΪ
                         step_y <= 1'b1;                            // ƶY
-                        error <= error - {1'b0, abs_dx};           // ȥdx
-                        if (error[12]) begin                       // ǷΪֵλ
+                        if (error_y_next[12]) begin                // ȥdxΪֵλ
                             step_x <= 1'b1;                        // ҪƶX
-                            error <= error + {1'b0, abs_dy};       // dy
+                            error <= error_y_next + {1'b0, abs_dy}; // dy
+                        end else begin
+                            error <= error_y_next;                 // ȥdx
                         end
                     end
                     steps_remaining <= steps_remaining - 12'h1;    // ʣಽ
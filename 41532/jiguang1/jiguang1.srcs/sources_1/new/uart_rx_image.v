@@ -3,8 +3,11 @@
 // UARTͼ֡ģ飨UART
 // ܣ
 //   1.  uart_rx ֱӽ UART ݣ9600ʣ8N1
-//   2. ͼ֡ʽ[0xAA][XH][XL][YH][YL][PIX][SUM][0x55]
-//   3.  x_data, y_data, pixel, frame_valid
+//   2. ͼ֡ʽ
+//        ֡8ֽڣ[0xAA][XH][XL][YH][YL][PIX][SUM][0x55]SUM = XH..PIX ۼӺ͵8λ
+//        ߶֡10ֽڣ[0xAA][0x80|XH][XL][YH][YL][LH][LL][PIX][SUM][0x55]SUM = ֽ1..7 ۼӺ͵8λ
+//        Ϊ12λXH λ1ʾ߶֡ (X,Y)  +X  LEN ͬһǿ
+//   3.  x_data, y_data, pixel, seg_len, frame_valid֡ seg_len = 1
 //////////////////////////////////////////////////////////////////////////////////
 
 module uart_rx_image #(
@@ -18,6 +21,7 @@ module uart_rx_image #(
     output reg  [15:0] x_data,          // X
     output reg  [15:0] y_data,          // Y
     output reg  [7:0]  pixel,           // ػҶȻ򼤹ǿ
+    output reg  [15:0] seg_len,         // ߶γȣ֡Ϊ1
     output reg         frame_valid      // һ֡ݽɱ־
 );
 
@@ -61,10 +65,16 @@ module uart_rx_image #(
     // ֡ڲź
     // ============================================================
     reg  [2:0] frame_state;
-    reg  [7:0] rx_buf [1:7];
+    reg  [7:0] rx_buf [1:9];
     reg  [3:0] byte_cnt;
     reg  [7:0] checksum;
     reg  [1:0] valid_cnt;
+    reg        is_seg;                  // ǰ֡Ϊ߶ֽ֡1λ
+
+    // ֽ1ͬһļж֮֡ͣʹֵ
+    wire       seg_now  = (byte_cnt == 4'd1) ? rx_byte[7] : is_seg;
+    wire [3:0] last_idx = seg_now ? 4'd9 : 4'd7;   // ֡β 0x55 
+    wire [3:0] sum_idx  = seg_now ? 4'd7 : 4'd5;   // Уһֽ
 
     // ============================================================
     // һ֣UART uart_rx Žֽڣ
@@ -161,9 +171,11 @@ module uart_rx_image #(
             checksum    <= 8'd0;
             frame_valid <= 1'b0;
             valid_cnt   <= 2'd0;
+            is_seg      <= 1'b0;
             x_data      <= 16'd0;
             y_data      <= 16'd0;
             pixel       <= 8'd0;
+            seg_len     <= 16'd1;
             rx_buf[1]   <= 8'd0;
             rx_buf[2]   <= 8'd0;
             rx_buf[3]   <= 8'd0;
@@ -171,6 +183,8 @@ module uart_rx_image #(
             rx_buf[5]   <= 8'd0;
             rx_buf[6]   <= 8'd0;
             rx_buf[7]   <= 8'd0;
+            rx_buf[8]   <= 8'd0;
+            rx_buf[9]   <= 8'd0;
         end else begin
             frame_valid <= 1'b0;
 
@@ -191,20 +205,23 @@ module uart_rx_image #(
                 //--------------------------------------------------
                 FRAME_RECV: begin
                     if (rx_done) begin
-                        // 洢ݵ1-7
-                        if (byte_cnt >= 4'd1 && byte_cnt <= 4'd7) begin
+                        // 洢ݵ֡1-7߶֡1-9
+                        if (byte_cnt >= 4'd1 && byte_cnt <= 4'd9) begin
                             rx_buf[byte_cnt] <= rx_byte;
                         end
+                        if (byte_cnt == 4'd1) begin
+                            is_seg <= rx_byte[7];
+                        end
                         
                         byte_cnt <= byte_cnt + 1'b1;
 
-                        // ۼУֵֻۼ1-5ݣ
-                        if (byte_cnt >= 4'd1 && byte_cnt <= 4'd5) begin
+                        // ۼУֵ֡ۼ1-5߶֡ۼ1-7
+                        if (byte_cnt >= 4'd1 && byte_cnt <= sum_idx) begin
                             checksum <= checksum + rx_byte;
                         end
 
-                        // 8ֽ
-                        if (byte_cnt == 4'd7) begin
+                        // һ֡8ֽڻ10ֽڣ
+                        if (byte_cnt == last_idx) begin
                             frame_state <= FRAME_DONE;
                         end
                     end
@@ -215,9 +232,19 @@ module uart_rx_image #(
                 //--------------------------------------------------
                 FRAME_DONE: begin
                     // ֤֡β0x55У
-                    if (rx_buf[7] == 8'h55 && rx_buf[6] == checksum) begin
+                    if (is_seg) begin
+                        if (rx_buf[9] == 8'h55 && rx_buf[8] == checksum) begin
+                            x_data      <= {1'b0, rx_buf[1][6:0], rx_buf[2]};
+                            y_data      <= {rx_buf[3], rx_buf[4]};
+                            seg_len     <= {rx_buf[5], rx_buf[6]};
+                            pixel       <= rx_buf[7];
+                            frame_valid <= 1'b1;
+                            valid_cnt   <= 2'd2;
+                        end
+                    end else if (rx_buf[7] == 8'h55 && rx_buf[6] == checksum) begin
                         x_data      <= {rx_buf[1], rx_buf[2]};
                         y_data      <= {rx_buf[3], rx_buf[4]};
+                        seg_len     <= 16'd1;
                         pixel       <= rx_buf[5];
                         frame_valid <= 1'b1;
                         valid_cnt   <= 2'd2;
@@ -1,8 +1,14 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Request, Response, render_template, request, jsonify, session, redirect, url_for
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import base64
+import bisect
+import hashlib
+import hmac
 import json
 import secrets
+import sys
 import os
 import time
 from openai import OpenAI
@@ -11,21 +17,203 @@ import numpy as np
 import io
 from functools import wraps
 import logging
+import logging.handlers
+import atexit
 import serial
 import serial.tools.list_ports
 import threading
 import queue
+import select
+import collections
+import itertools
+import concurrent.futures
+import tempfile
+import wave
 
 app = Flask(__name__)
 
 # ====== 日志配置 ======
-logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+# 业务线程只把日志记录放进有界队列，格式化与输出都在后台线程（QueueListener）完成；
+# 高频日志按类别采样（LOG_SAMPLING），错误日志不采样；串口任务明细写入单独的滚动文件
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = '[%(asctime)s] %(levelname)s: %(message)s'
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))      # 队列满时丢弃并计数，不阻塞业务线程
+LOG_PAYLOAD_PREVIEW = int(os.getenv("LOG_PAYLOAD_PREVIEW", "800"))  # 载荷预览最多字符数
+# 采样规则（逗号分隔）：类别=N 每 N 条记 1 条；类别=N/s 每秒最多 N 条；未列出的类别全部记录
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "serial_chunk=50,payload=10/s")
+LOG_DIR = os.getenv("LOG_DIR", os.path.join(tempfile.gettempdir(), "jarvis_logs"))
+JOB_TRACE_FILE = os.getenv("JOB_TRACE_FILE", os.path.join(LOG_DIR, "serial_jobs.log"))  # 置空关闭任务明细
+JOB_TRACE_LEVEL = os.getenv("JOB_TRACE_LEVEL", "INFO").upper()  # DEBUG 时额外记录每个写入块的十六进制数据
+JOB_TRACE_MAX_BYTES = int(os.getenv("JOB_TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+JOB_TRACE_BACKUPS = int(os.getenv("JOB_TRACE_BACKUPS", "5"))
+JOB_TRACE_LOGGER = "jarvis.jobs"
+
+
+class _AsyncLogHandler(logging.handlers.QueueHandler):
+    """只入队不格式化：消息拼接与载荷预览都推迟到后台线程；队列满时丢弃并计数"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 同进程队列无需像默认实现那样提前格式化、去掉 args / exc_info 以便序列化
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSampler:
+    """按类别采样高频日志，线程安全；每个类别累计省略条数，下一条被记录时一并报告"""
+
+    def __init__(self, spec=""):
+        self.rules = {}
+        self._state = {}  # 类别 -> [已见条数, 限速窗口起点, 窗口内已记录, 待报告省略数, 累计省略数]
+        self._lock = threading.Lock()
+        for item in filter(None, (part.strip() for part in spec.split(','))):
+            category, _, rule = item.partition('=')
+            rule = rule.strip()
+            per_second = rule.endswith('/s')
+            self.rules[category.strip()] = (max(int(rule[:-2] if per_second else rule), 1), per_second)
+
+    def sample(self, category):
+        """返回 None 表示本条应省略，否则返回自上次记录以来省略的条数"""
+        rule = self.rules.get(category)
+        if rule is None:
+            return 0
+        limit, per_second = rule
+        with self._lock:
+            state = self._state.get(category)
+            if state is None:
+                state = self._state[category] = [0, 0.0, 0, 0, 0]
+            if per_second:
+                now = time.monotonic()
+                if now - state[1] >= 1.0:
+                    state[1], state[2] = now, 0
+                allowed = state[2] < limit
+                state[2] += allowed
+            else:
+                allowed = state[0] % limit == 0
+            state[0] += 1
+            if not allowed:
+                state[3] += 1
+                state[4] += 1
+                return None
+            skipped, state[3] = state[3], 0
+            return skipped
+
+    def stats(self):
+        with self._lock:
+            return {category: {"seen": state[0], "suppressed": state[4]}
+                    for category, state in self._state.items()}
+
+
+class LazyPreview:
+    """
+    日志参数：真正输出时（后台线程）才序列化为 JSON。
+    构造时即截断长字符串（如 base64 图片）并复制容器，之后请求线程修改原对象不影响日志内容。
+    """
+    __slots__ = ('obj', 'limit')
+
+    def __init__(self, obj, limit=None):
+        self.obj = self._shorten(obj)
+        self.limit = limit or LOG_PAYLOAD_PREVIEW
+
+    @staticmethod
+    def _shorten(obj, limit=200):
+        if isinstance(obj, str):
+            return obj if len(obj) <= limit else f"{obj[:limit]}...<共 {len(obj)} 字符>"
+        if isinstance(obj, dict):
+            return {k: LazyPreview._shorten(v, limit) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            items = [LazyPreview._shorten(v, limit) for v in obj[:50]]
+            return items + [f"...<共 {len(obj)} 项>"] if len(obj) > 50 else items
+        return obj
+
+    def __str__(self):
+        try:
+            text = json.dumps(self.obj, ensure_ascii=False)
+        except Exception:
+            try:
+                text = repr(self.obj)
+            except Exception as e:
+                text = f"<无法格式化: {type(e).__name__}>"
+        return text if len(text) <= self.limit else f"{text[:self.limit]}...<共 {len(text)} 字符>"
+
+
+class LazyHex:
+    """日志参数：输出时才把字节转成十六进制，超过 limit 字节只显示开头"""
+    __slots__ = ('data', 'limit')
+
+    def __init__(self, data, limit=64):
+        self.data = data
+        self.limit = limit
+
+    def __str__(self):
+        head = bytes(self.data[:self.limit]).hex(' ')
+        return head if len(self.data) <= self.limit else f"{head} ...<共 {len(self.data)} 字节>"
+
+
+def _setup_logging():
+    """根日志器只挂一个队列处理器；后台监听线程把记录分发到控制台与任务明细文件"""
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = _AsyncLogHandler(log_queue)
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    console.addFilter(lambda record: not record.name.startswith(JOB_TRACE_LOGGER))
+    handlers = [console]
+
+    trace = logging.getLogger(JOB_TRACE_LOGGER)
+    trace.setLevel(logging.CRITICAL + 1)  # 未启用明细文件时连日志记录都不创建
+    if JOB_TRACE_FILE:
+        try:
+            os.makedirs(os.path.dirname(JOB_TRACE_FILE) or '.', exist_ok=True)
+            trace_file = logging.handlers.RotatingFileHandler(
+                JOB_TRACE_FILE, maxBytes=JOB_TRACE_MAX_BYTES, backupCount=JOB_TRACE_BACKUPS,
+                encoding='utf-8', delay=True)
+            trace_file.setFormatter(formatter)
+            trace_file.addFilter(logging.Filter(JOB_TRACE_LOGGER))
+            handlers.append(trace_file)
+            trace.setLevel(JOB_TRACE_LEVEL)
+        except OSError as e:
+            # 此时日志监听尚未启动，经 logging.lastResort 直接写 stderr
+            logging.lastResort.handle(logging.makeLogRecord({
+                "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "无法创建任务明细日志 %s: %s", "args": (JOB_TRACE_FILE, e)}))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # 退出时把队列中剩余的记录写完
+    return handler, trace
+
+
+log_handler, job_trace = _setup_logging()
+log_sampler = LogSampler(LOG_SAMPLING)
 logger = app.logger
 
-# ====== 串口通信配置 ======
-serial_connection = None
-serial_queue = queue.Queue()
-transmission_log = []
+
+def log_sampled(category, msg, *args, level=logging.INFO, target=None):
+    """按类别采样记录日志；被记录的那条附带此前省略的条数。错误请直接用 logger.error，不经过采样"""
+    target = target or logger
+    if not target.isEnabledFor(level):
+        return
+    skipped = log_sampler.sample(category)
+    if skipped is None:
+        return
+    if skipped:
+        msg += "（同类已省略 %d 条）"
+        args += (skipped,)
+    target.log(level, msg, *args)
+
 
 # 设置会话密钥（可通过环境变量覆盖）
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "static_dev_secret_key")
@@ -66,12 +254,321 @@ QWQ_API_KEY = os.getenv("QWQ_API_KEY", "sk-Hga8t11MnLJv7dfsjayvC1jvnJ3mZRdvSlNZp
 QWQ_API_URL = "https://api.suanli.cn/v1/chat/completions"
 
 
-# OpenRouter / OpenAI (用于通用对话)
-def get_openrouter_client():
-    return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=os.getenv("OPENROUTER_API_KEY", "")
+# ====== 运行指标（Prometheus 文本格式，GET /metrics）======
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # 非空时 /metrics 需要 Authorization: Bearer <token>
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "").lower() in ('1', 'true', 'yes')  # 显式允许无令牌的远程抓取
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric:
+    """指标基类：按标签值元组保存数据，更新只做一次字典查找 + 加锁自增"""
+    kind = ''
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _label_text(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+    def samples(self):
+        """[(后缀, 标签文本, 值)]"""
+        with self._lock:
+            items = list(self._values.items())
+        return [('', self._label_text(labels), value) for labels, value in items]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {value:.17g}" if isinstance(value, float)
+                         else f"{self.name}{suffix}{labels} {value}")
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """取值在抓取时由 fn() 计算（返回 {标签值元组: 值}），不在业务路径上维护"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), fn=None):
+        super().__init__(name, help_text, labelnames)
+        self._fn = fn
+
+    def samples(self):
+        return [('', self._label_text(labels), value) for labels, value in self._fn().items()]
+
+
+class CounterFunc(Gauge):
+    """抓取时读取已有的单调计数（如日志丢弃数），避免在业务路径上重复计数"""
+    kind = 'counter'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, (list(counts), total, n)) for labels, (counts, total, n) in self._values.items()]
+        result = []
+        for labels, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                result.append(('_bucket', self._label_text(labels, [('le', le)]), cumulative))
+            result.append(('_sum', self._label_text(labels), total))
+            result.append(('_count', self._label_text(labels), n))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(m.render() for m in self._metrics) + '\n'
+
+
+metrics = MetricsRegistry()
+HTTP_REQUEST_SECONDS = metrics.register(Histogram(
+    "jarvis_http_request_duration_seconds", "Flask 路由处理耗时（流式响应为首字节时间）", ("route", "method")))
+HTTP_REQUESTS_TOTAL = metrics.register(Counter(
+    "jarvis_http_requests_total", "Flask 路由请求数", ("route", "method", "status")))
+PROVIDER_REQUEST_SECONDS = metrics.register(Histogram(
+    "jarvis_provider_request_duration_seconds", "第三方服务调用耗时", ("provider",)))
+PROVIDER_REQUESTS_TOTAL = metrics.register(Counter(
+    "jarvis_provider_requests_total", "第三方服务调用次数（outcome: ok / error / timeout）", ("provider", "outcome")))
+IMAGE_CONVERSION_SECONDS = metrics.register(Histogram(
+    "jarvis_image_conversion_duration_seconds", "图片转换各阶段耗时（缓存未命中时）", ("stage",)))
+SERIAL_BYTES_TOTAL = metrics.register(Counter(
+    "jarvis_serial_bytes_written_total", "写入串口的字节数", ("port",)))
+SERIAL_FRAMES_TOTAL = metrics.register(Counter(
+    "jarvis_serial_frames_total", "串口传输帧数（result: sent / failed）", ("port", "result")))
+SERIAL_JOBS_TOTAL = metrics.register(Counter(
+    "jarvis_serial_jobs_total", "结束的串口传输任务数", ("status",)))
+metrics.register(CounterFunc(
+    "jarvis_log_records_dropped_total", "日志队列已满而丢弃的记录数", (),
+    lambda: {(): log_handler.dropped}))
+metrics.register(CounterFunc(
+    "jarvis_log_records_sampled_out_total", "按类别采样省略的日志条数", ("category",),
+    lambda: {(category,): s["suppressed"] for category, s in log_sampler.stats().items()}))
+
+
+def _is_timeout_error(exc, _depth=0):
+    """requests / urllib3 / openai 的超时异常都以 Timeout(Error) 结尾命名；
+    重试耗尽时超时被包在 ConnectionError(MaxRetryError(reason=ReadTimeoutError)) 里，需逐层展开。
+    只看具体类名：urllib3 的 NewConnectionError（连接被拒）继承自 ConnectTimeoutError"""
+    if exc is None or _depth > 4:
+        return False
+    if type(exc).__name__.endswith(('Timeout', 'TimeoutError')):
+        return True
+    inner = [getattr(exc, 'reason', None), exc.__cause__, exc.__context__]
+    inner += [arg for arg in getattr(exc, 'args', ()) if isinstance(arg, BaseException)]
+    return any(_is_timeout_error(e, _depth + 1) for e in inner if isinstance(e, BaseException))
+
+
+@app.before_request
+def _metrics_request_started():
+    request.environ['jarvis.started'] = time.perf_counter()
+
+
+@app.after_request
+def _metrics_request_finished(response):
+    started = request.environ.get('jarvis.started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method)
+        HTTP_REQUESTS_TOTAL.inc(1, route, request.method, str(response.status_code))
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 抓取接口（文本格式 0.0.4）"""
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+            return Response("unauthorized\n", status=401, mimetype='text/plain')
+    elif not METRICS_PUBLIC and request.remote_addr not in ('127.0.0.1', '::1'):
+        # 未配置令牌时只允许本机抓取（指标含串口名、路由与第三方服务调用情况）
+        return Response("forbidden: set METRICS_TOKEN or METRICS_PUBLIC=1\n", status=403, mimetype='text/plain')
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ====== 第三方接口 HTTP 连接池（长连接 + 重试 + 分服务超时）======
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "16"))  # 缓存的主机连接池个数
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))          # 每个主机保持的长连接数
+HTTP_RETRY_TOTAL = int(os.getenv("HTTP_RETRY_TOTAL", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))     # 退避：0.5s, 1s, 2s...
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# 各服务的 (连接超时, 读取超时) 秒，可用 HTTP_TIMEOUT_<服务名大写>=连接,读取 覆盖
+PROVIDER_TIMEOUTS = {
+    "baidu": (5, 60),
+    "qwq": (5, 60),
+    "openrouter": (5, 60),
+    "xunfei_tts": (5, 30),
+    "siliconflow_tts": (5, 60),
+    "siliconflow_asr": (5, 30),
+    "doubao": (5, 60),
+    "picsum": (5, 15),
+    "image_download": (5, 20),
+}
+for _name in PROVIDER_TIMEOUTS:
+    _override = os.getenv(f"HTTP_TIMEOUT_{_name.upper()}", "")
+    if _override:
+        PROVIDER_TIMEOUTS[_name] = tuple(float(v) for v in _override.split(','))
+
+
+class _ProviderRetry(Retry):
+    """
+    重试策略：连接失败对所有方法都重试（请求尚未发出）；GET 另外重试读错误和 429/5xx。
+    POST（对话、生成图片、TTS、ASR，均按次计费且非幂等）不重试读超时 / 读错误 / 5xx，
+    只在 429 时（服务端明确未处理）按 Retry-After 退避重试。
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST":
+            return bool(self.total) and status_code == 429
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def _build_http_session():
+    """所有第三方接口共用的 Session：按主机维护连接池，重试策略见 _ProviderRetry"""
+    retry = _ProviderRetry(
+        total=HTTP_RETRY_TOTAL,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=HTTP_RETRY_STATUS,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # 不含 POST：POST 的读错误不重试
+        raise_on_status=False,
+        respect_retry_after_header=True,
     )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+http_session = _build_http_session()
+_http_stats = collections.defaultdict(lambda: {"calls": 0, "errors": 0, "total_ms": 0.0})
+_http_stats_lock = threading.Lock()
+
+
+def _record_provider_call(provider, started, ok, timeout=False):
+    elapsed = time.perf_counter() - started
+    with _http_stats_lock:
+        entry = _http_stats[provider]
+        entry["calls"] += 1
+        entry["errors"] += 0 if ok else 1
+        entry["total_ms"] += elapsed * 1000
+    PROVIDER_REQUEST_SECONDS.observe(elapsed, provider)
+    PROVIDER_REQUESTS_TOTAL.inc(1, provider, 'ok' if ok else 'timeout' if timeout else 'error')
+
+
+def http_request(provider, method, url, record=True, **kwargs):
+    """
+    经共享连接池发起请求，未指定 timeout 时使用该服务的默认超时。
+    record=False 时不计入调用统计，由调用方在读完流式响应后自行记录一次（整段耗时与最终结果）
+    """
+    kwargs.setdefault("timeout", PROVIDER_TIMEOUTS.get(provider, (5, 30)))
+    started = time.perf_counter()
+    ok = timeout = False
+    try:
+        response = http_session.request(method, url, **kwargs)
+        ok = response.status_code < 400
+        return response
+    except requests.RequestException as e:
+        timeout = _is_timeout_error(e)
+        raise
+    finally:
+        if record:
+            _record_provider_call(provider, started, ok, timeout)
+
+
+def http_pool_stats():
+    """连接复用统计：requests 为实际发出的 HTTP 请求数（含重试），connections 为新建连接数"""
+    hosts = []
+    for prefix in ("https://", "http://"):
+        pools = http_session.get_adapter(prefix).poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None or pool.scheme != prefix[:-3]:
+                continue
+            hosts.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "requests": pool.num_requests,
+                "connections": pool.num_connections,
+                "reuse_rate": round(1 - pool.num_connections / pool.num_requests, 3) if pool.num_requests else None,
+            })
+    total_requests = sum(h["requests"] for h in hosts)
+    total_connections = sum(h["connections"] for h in hosts)
+    with _http_stats_lock:
+        providers = {
+            name: dict(v, avg_ms=round(v["total_ms"] / v["calls"], 1) if v["calls"] else None,
+                       total_ms=round(v["total_ms"], 1))
+            for name, v in _http_stats.items()
+        }
+    return {
+        "requests": total_requests,
+        "connections": total_connections,
+        "reuse_rate": round(1 - total_connections / total_requests, 3) if total_requests else None,
+        "hosts": hosts,
+        "providers": providers,
+        "openai_clients": len(_openai_clients),
+    }
+
+
+# OpenRouter / OpenAI (用于通用对话)，客户端按 API Key 缓存复用其内部连接池
+_openai_clients = {}
+_openai_clients_lock = threading.Lock()
+
+
+def get_openrouter_client():
+    api_key = os.getenv("OPENROUTER_API_KEY", "")
+    with _openai_clients_lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            client = OpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=api_key,
+                timeout=PROVIDER_TIMEOUTS["openrouter"][1],
+                max_retries=0  # SDK 会对超时和 5xx 重试计费的 POST；失败交给对冲路由切换服务商
+            )
+            _openai_clients[api_key] = client
+        return client
 
 
 # ====== 百度文心 AccessToken 缓存 ======
@@ -92,7 +589,7 @@ def _get_baidu_access_token():
         "client_secret": BAIDU_SECRET_KEY,
     }
     try:
-        r = requests.post(token_url, params=params, timeout=30)
+        r = http_request("baidu", "POST", token_url, params=params)
         r.raise_for_status()
     except Exception as e:
         logger.error(f"获取Baidu AccessToken失败: {e}")
@@ -114,8 +611,8 @@ def chat_with_baidu(message: str) -> str:
     }
     headers = {"Content-Type": "application/json"}
     try:
-        logger.info(f"BaiduChat 请求: payload={json.dumps(payload, ensure_ascii=False)}")
-        resp = requests.post(url, headers=headers, data=json.dumps(payload), timeout=60)
+        log_sampled("payload", "BaiduChat 请求: payload=%s", LazyPreview(payload))
+        resp = http_request("baidu", "POST", url, headers=headers, data=json.dumps(payload))
         logger.info(f"BaiduChat 响应: status={resp.status_code}")
         resp.raise_for_status()
         data = resp.json()
@@ -129,7 +626,9 @@ def chat_with_baidu(message: str) -> str:
     return json.dumps(data, ensure_ascii=False)
 
 
-def chat_with_openrouter(message: str) -> str:
+def _openrouter_chat(message: str) -> str:
+    """OpenRouter 对话，失败时抛出异常"""
+    started = time.perf_counter()
     try:
         client = get_openrouter_client()
         logger.info(f"OpenRouter 请求: message={message[:200]}")
@@ -138,29 +637,43 @@ def chat_with_openrouter(message: str) -> str:
             messages=[{"role": "user", "content": message}]
         )
         logger.info("OpenRouter 响应成功")
+        _record_provider_call("openrouter", started, True)
         return response.choices[0].message.content
+    except Exception as e:
+        _record_provider_call("openrouter", started, False, _is_timeout_error(e))
+        raise
+
+
+def chat_with_openrouter(message: str) -> str:
+    try:
+        return _openrouter_chat(message)
     except Exception as e:
         logger.error(f"OpenRouter 调用失败: {e}")
         return f"OpenRouter 调用失败: {e}"
 
 
+def _qwq_chat(message: str) -> str:
+    """QwQ-32B 对话，失败时抛出异常"""
+    headers = {
+        "Authorization": f"Bearer {QWQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": "free:QwQ-32B",
+        "messages": [{"role": "user", "content": message}]
+    }
+    log_sampled("payload", "QwQ-32B 请求: headers=Authorization ****, payload=%s", LazyPreview(payload))
+    response = http_request("qwq", "POST", QWQ_API_URL, headers=headers, json=payload)
+    logger.info(f"QwQ-32B 响应: status={response.status_code}")
+    response.raise_for_status()
+    data = response.json()
+    return data["choices"][0]["message"]["content"]
+
+
 def chat_with_qwq(message: str) -> str:
     """使用QwQ-32B模型进行对话"""
     try:
-        headers = {
-            "Authorization": f"Bearer {QWQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "free:QwQ-32B",
-            "messages": [{"role": "user", "content": message}]
-        }
-        logger.info(f"QwQ-32B 请求: headers=Authorization ****, payload={json.dumps(payload, ensure_ascii=False)}")
-        response = requests.post(QWQ_API_URL, headers=headers, json=payload, timeout=60)
-        logger.info(f"QwQ-32B 响应: status={response.status_code}")
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+        return _qwq_chat(message)
     except Exception as e:
         logger.error(f"QwQ-32B 调用失败: {e}")
         return f"QwQ-32B 调用失败: {e}"
@@ -170,10 +683,294 @@ def chat_with_xfy_placeholder(message: str) -> str:
     return "[提示] 讯飞星火尚未完成直连接入（需 WebSocket/SDK）。请先使用百度或OpenRouter。"
 
 
-def tts_with_xunfei(text: str) -> bytes:
-    """使用讯飞语音合成API生成语音"""
-    import hashlib, hmac
-    from urllib.parse import urlencode
+# ====== 多服务商对冲路由（provider=auto）======
+CHAT_HEDGE_PERCENTILE = float(os.getenv("CHAT_HEDGE_PERCENTILE", "0.9"))   # 首选服务商超过该分位延迟即发起对冲
+CHAT_HEDGE_DEFAULT_DELAY = float(os.getenv("CHAT_HEDGE_DEFAULT_DELAY", "3.0"))  # 样本不足时的对冲等待（秒）
+CHAT_HEDGE_MIN_DELAY = 0.2
+CHAT_HEDGE_MAX_DELAY = 20.0
+CHAT_HEDGE_MAX_PROVIDERS = int(os.getenv("CHAT_HEDGE_MAX_PROVIDERS", "2"))  # 单次请求最多同时调用的服务商数
+CHAT_HEDGE_TIMEOUT = float(os.getenv("CHAT_HEDGE_TIMEOUT", "60"))
+CHAT_LATENCY_WINDOW = 100     # 每个服务商保留的最近延迟样本数
+CHAT_EWMA_ALPHA = 0.2
+CHAT_MIN_SAMPLES = 5          # 低于该样本数时使用默认对冲等待
+CHAT_ERROR_PENALTY = 4.0      # 评分 = 平均延迟 × (1 + 错误率 × 惩罚系数)
+
+
+class ChatProviderRouter:
+    """
+    按滑动平均延迟与错误率为服务商评分，优先调用评分最好的服务商；
+    首选服务商超过其历史延迟分位仍未返回时，向次优服务商发起对冲请求，
+    先成功返回者胜出，落败请求不再等待（结果丢弃，但仍计入延迟统计）。
+    """
+
+    def __init__(self, providers, max_workers=8):
+        self.providers = dict(providers)  # 名称 -> 可调用对象(message) -> str，失败抛异常
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix="chat-hedge")
+        self._lock = threading.Lock()
+        self._stats = {name: self._new_stats() for name in self.providers}
+
+    @staticmethod
+    def _new_stats():
+        return {"calls": 0, "errors": 0, "wins": 0, "hedges": 0, "ewma_latency": None,
+                "error_rate": 0.0, "latencies": collections.deque(maxlen=CHAT_LATENCY_WINDOW)}
+
+    def _record(self, name, latency, ok):
+        with self._lock:
+            st = self._stats.setdefault(name, self._new_stats())
+            st["calls"] += 1
+            st["errors"] += 0 if ok else 1
+            st["error_rate"] += CHAT_EWMA_ALPHA * ((0.0 if ok else 1.0) - st["error_rate"])
+            if ok:
+                st["latencies"].append(latency)
+                prev = st["ewma_latency"]
+                st["ewma_latency"] = latency if prev is None else prev + CHAT_EWMA_ALPHA * (latency - prev)
+
+    def _score(self, st):
+        # 尚无成功样本（未调用过或只失败过）的服务商按默认对冲等待估计延迟，而不是按 0：
+        # 只会在已知服务商都比它慢时才被优先尝试，一直失败的服务商随错误率上升持续排在后面
+        latency = st["ewma_latency"]
+        if latency is None:
+            latency = CHAT_HEDGE_DEFAULT_DELAY
+        return latency * (1 + st["error_rate"] * CHAT_ERROR_PENALTY) + st["error_rate"]
+
+    def ranked(self):
+        with self._lock:
+            return sorted(self.providers, key=lambda n: self._score(self._stats[n]))
+
+    def hedge_delay(self, name):
+        """该服务商最近延迟的 CHAT_HEDGE_PERCENTILE 分位，作为发起对冲前的等待时间"""
+        with self._lock:
+            samples = sorted(self._stats[name]["latencies"])
+        if len(samples) < CHAT_MIN_SAMPLES:
+            return CHAT_HEDGE_DEFAULT_DELAY
+        idx = min(len(samples) - 1, int(len(samples) * CHAT_HEDGE_PERCENTILE))
+        return min(CHAT_HEDGE_MAX_DELAY, max(CHAT_HEDGE_MIN_DELAY, samples[idx]))
+
+    def _call(self, name, message):
+        started = time.perf_counter()
+        try:
+            reply = self.providers[name](message)
+        except Exception:
+            self._record(name, time.perf_counter() - started, False)
+            raise
+        self._record(name, time.perf_counter() - started, True)
+        return reply
+
+    def chat(self, message, timeout=CHAT_HEDGE_TIMEOUT):
+        """
+        返回：(reply, info) info 含 provider（胜出者）、hedged、attempts、latency
+        所有服务商均失败或超时时抛出最后一个异常
+        """
+        started = time.perf_counter()
+        deadline = started + timeout
+        candidates = self.ranked()
+        if not candidates:
+            raise RuntimeError("没有可用的对话服务商")
+        pending = {}
+        attempts = []
+        last_error = None
+
+        def launch():
+            name = candidates.pop(0)
+            attempts.append(name)
+            pending[self._executor.submit(self._call, name, message)] = name
+            return name
+
+        primary = launch()
+        wait_for = self.hedge_delay(primary)
+        while pending:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, _ = concurrent.futures.wait(pending, timeout=min(wait_for, remaining),
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    reply = future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"对冲路由: {name} 调用失败: {e}")
+                    continue
+                for loser in pending:
+                    loser.cancel()  # 尚未开始的直接取消，已在执行的结果将被丢弃
+                with self._lock:
+                    self._stats[name]["wins"] += 1
+                return reply, {
+                    "provider": name,
+                    "hedged": len(attempts) > 1,
+                    "attempts": attempts,
+                    "latency": round(time.perf_counter() - started, 3),
+                }
+            # 超过对冲等待仍无结果，或有请求失败腾出名额：启用下一个服务商
+            if candidates and len(pending) < CHAT_HEDGE_MAX_PROVIDERS:
+                name = launch()
+                if len(pending) > 1:
+                    with self._lock:
+                        self._stats[name]["hedges"] += 1
+                    logger.info(f"对冲路由: {attempts[0]} 超过 {wait_for:.2f}s 未返回，对冲请求 {name}")
+                wait_for = self.hedge_delay(name)
+            elif not done:
+                wait_for = deadline - time.perf_counter()
+        for future in pending:
+            future.cancel()
+        if last_error is not None:
+            raise last_error
+        raise TimeoutError(f"所有服务商均未在 {timeout:.0f}s 内返回")
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for name in self.providers:
+                st = self._stats[name]
+                samples = sorted(st["latencies"])
+                pct = (lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))], 3)
+                       if samples else None)
+                result[name] = {
+                    "calls": st["calls"],
+                    "errors": st["errors"],
+                    "wins": st["wins"],
+                    "hedges": st["hedges"],
+                    "error_rate": round(st["error_rate"], 3),
+                    "ewma_latency": round(st["ewma_latency"], 3) if st["ewma_latency"] is not None else None,
+                    "p50": pct(0.5),
+                    "p90": pct(0.9),
+                    "score": round(self._score(st), 3),
+                }
+            return result
+
+
+chat_router = ChatProviderRouter({
+    "qwq": _qwq_chat,
+    "openrouter": _openrouter_chat,
+    "baidu": chat_with_baidu,
+})
+
+
+# ====== 对话流式输出（SSE 逐 token 转发）======
+def _sse_message(event_type, data, event_id=None):
+    """格式化一条 SSE 消息"""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _iter_sse_data(response):
+    """逐行解析 OpenAI 兼容接口的 SSE 响应，产出每个 data 字段解析后的 JSON"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return
+        try:
+            yield json.loads(payload)
+        except ValueError:
+            logger.warning(f"无法解析的流式数据: {payload[:200]}")
+
+
+def _qwq_chat_stream(message: str):
+    """QwQ-32B 流式对话，产出 (类型, 文本)：reasoning 为推理过程，token 为回答内容"""
+    headers = {
+        "Authorization": f"Bearer {QWQ_API_KEY}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
+    }
+    payload = {
+        "model": "free:QwQ-32B",
+        "messages": [{"role": "user", "content": message}],
+        "stream": True
+    }
+    log_sampled("payload", "QwQ-32B 流式请求: payload=%s", LazyPreview(payload))
+    # 调用统计由 _chat_stream_events 在流结束后记为 qwq_stream，这里不重复计数
+    response = http_request("qwq", "POST", QWQ_API_URL, record=False, headers=headers, json=payload, stream=True)
+    try:
+        response.raise_for_status()
+        for chunk in _iter_sse_data(response):
+            delta = (chunk.get("choices") or [{}])[0].get("delta") or {}
+            if delta.get("reasoning_content"):
+                yield "reasoning", delta["reasoning_content"]
+            if delta.get("content"):
+                yield "token", delta["content"]
+    finally:
+        response.close()
+
+
+def _openrouter_chat_stream(message: str):
+    """OpenRouter 流式对话，产出 (类型, 文本)"""
+    client = get_openrouter_client()
+    logger.info(f"OpenRouter 流式请求: message={message[:200]}")
+    stream = client.chat.completions.create(
+        model="moonshotai/moonlight-16b-a3b-instruct:free",
+        messages=[{"role": "user", "content": message}],
+        stream=True
+    )
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield "token", chunk.choices[0].delta.content
+    finally:
+        stream.close()
+
+
+# 支持流式输出的服务商；其余（百度、讯飞占位、auto 对冲）整段返回后一次性推送
+CHAT_STREAMERS = {
+    "qwq": _qwq_chat_stream,
+    "openrouter": _openrouter_chat_stream,
+}
+
+
+def _buffered_chat(provider, message):
+    """不支持流式的服务商：返回 (实际服务商, 完整回复)"""
+    if provider == "auto":
+        reply, info = chat_router.chat(message)
+        return info["provider"], reply
+    if provider == "baidu":
+        return provider, chat_with_baidu(message)
+    if provider == "xfy":
+        return provider, chat_with_xfy_placeholder(message)
+    return provider, chat_router.providers.get(provider, _openrouter_chat)(message)
+
+
+def _chat_stream_events(provider, message):
+    """生成 /chat/stream 的 SSE 事件：meta -> reasoning/token... -> done，失败时 error"""
+    started = time.perf_counter()
+    first_token = None
+    parts = []
+    streamer = CHAT_STREAMERS.get(provider)
+    yield _sse_message("meta", {"provider": provider, "streaming": streamer is not None})
+    try:
+        if streamer is not None:
+            for kind, text in streamer(message):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                if kind == "token":
+                    parts.append(text)
+                yield _sse_message(kind, {"text": text})
+            _record_provider_call(f"{provider}_stream", started, True)
+        else:
+            provider, reply = _buffered_chat(provider, message)
+            first_token = time.perf_counter() - started
+            parts.append(reply)
+            yield _sse_message("token", {"text": reply})
+    except Exception as e:
+        if streamer is not None:
+            _record_provider_call(f"{provider}_stream", started, False, _is_timeout_error(e))
+        logger.error(f"/chat/stream 调用失败: {e}")
+        yield _sse_message("error", {"error": f"调用失败: {str(e)}"})
+        return
+    total = time.perf_counter() - started
+    logger.info(f"/chat/stream 完成: provider={provider}, 首 token {first_token or 0:.2f}s, 总耗时 {total:.2f}s")
+    yield _sse_message("done", {
+        "provider": provider,
+        "reply": "".join(parts),
+        "first_token_s": round(first_token, 3) if first_token is not None else None,
+        "total_s": round(total, 3)
+    })
+
+
+def tts_with_xunfei(text: str, voice: str = "xiaoyan", speed: int = 50) -> bytes:
+    """使用讯飞语音合成API生成语音（16kHz 16bit 单声道 PCM）"""
     from datetime import datetime
     from time import mktime
     from wsgiref.handlers import format_date_time
@@ -195,13 +992,13 @@ def tts_with_xunfei(text: str) -> bytes:
 
     payload = {
         "common": {"app_id": XFY_TTS_APP_ID},
-        "business": {"aue": "raw", "auf": "audio/L16;rate=16000", "vcn": "xiaoyan", "speed": 50, "volume": 50,
+        "business": {"aue": "raw", "auf": "audio/L16;rate=16000", "vcn": voice, "speed": speed, "volume": 50,
                      "pitch": 50, "bgs": 0},
         "data": {"status": 2, "text": base64.b64encode(text.encode('utf-8')).decode('utf-8')}
     }
 
     try:
-        response = requests.post(url, params=params, json=payload, timeout=30)
+        response = http_request("xunfei_tts", "POST", url, params=params, json=payload)
         response.raise_for_status()
     except Exception as e:
         logger.error(f"讯飞TTS请求失败: {e}")
@@ -213,20 +1010,223 @@ def tts_with_xunfei(text: str) -> bytes:
         raise Exception(f"讯飞TTS错误: {result.get('message', '未知错误')}")
 
 
-def asr_with_siliconflow(audio_file_path: str) -> str:
+# ====== 语音识别（上传内存直传 + 可选分段并发识别）======
+ASR_URL = "https://api.siliconflow.cn/v1/audio/transcriptions"
+ASR_MODEL = "FunAudioLLM/SenseVoiceSmall"
+ASR_MAX_UPLOAD_BYTES = int(os.getenv("ASR_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+ASR_CHUNK_SECONDS = float(os.getenv("ASR_CHUNK_SECONDS", "30"))
+ASR_CHUNK_CONCURRENCY = int(os.getenv("ASR_CHUNK_CONCURRENCY", "4"))
+ASR_SPLIT_SEARCH_SECONDS = 0.5   # 在分段点前后该范围内寻找最安静的位置切分，避免切断字词
+ASR_SPLIT_WINDOW_SECONDS = 0.02  # 能量计算窗口
+
+
+class _InMemoryUploadRequest(Request):
+    """
+    仅 /asr：总大小不超过 ASR_MAX_UPLOAD_BYTES 的上传文件保存在内存中，不再落临时文件。
+    其他路由保持 werkzeug 默认行为（超过 500KB 的文件落临时文件），不会各自占用最多 25MB 内存。
+    """
+    in_memory_endpoints = ('asr',)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if (self.endpoint in self.in_memory_endpoints and total_content_length is not None
+                and total_content_length <= ASR_MAX_UPLOAD_BYTES):
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+app.request_class = _InMemoryUploadRequest
+
+
+class _MultipartBody:
+    """
+    按需读取的 multipart/form-data 请求体：表单字段 + 文件内容 + 结束分隔符。
+    文件部分直接从上传流中读取，不复制整段音频；可 seek(0) 供连接失败时重试。
+    """
+
+    def __init__(self, fields, file_field, filename, content_type, fileobj, size):
+        self.boundary = secrets.token_hex(16)
+        head = b"".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+            for name, value in fields.items()
+        )
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                 f'filename="{filename}"\r\nContent-Type: {content_type}\r\n\r\n').encode('utf-8')
+        tail = f"\r\n--{self.boundary}--\r\n".encode('utf-8')
+        self._parts = [io.BytesIO(head), fileobj, io.BytesIO(tail)]
+        self._file_start = fileobj.tell() if fileobj.seekable() else 0
+        self._length = len(head) + size + len(tail)
+        self._index = 0
+        self._pos = 0
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, n=-1):
+        out = []
+        while self._index < len(self._parts) and n != 0:
+            chunk = self._parts[self._index].read(n)
+            if not chunk:
+                self._index += 1
+                continue
+            out.append(chunk)
+            self._pos += len(chunk)
+            if n > 0:
+                n -= len(chunk)
+        return b"".join(out)
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise io.UnsupportedOperation("只支持回到开头")
+        self._parts[0].seek(0)
+        self._parts[1].seek(self._file_start)
+        self._parts[2].seek(0)
+        self._index = 0
+        self._pos = 0
+        return 0
+
+
+def _stream_size(fileobj):
+    """可 seek 的流：返回从当前位置到结尾的字节数"""
+    start = fileobj.tell()
+    end = fileobj.seek(0, io.SEEK_END)
+    fileobj.seek(start)
+    return end - start
+
+
+def asr_with_siliconflow(audio, filename: str = "audio.wav", content_type: str = "application/octet-stream",
+                         size: int = None) -> str:
+    """
+    SiliconFlow 语音识别。audio 可以是 bytes、可读流（如上传的 FileStorage.stream）或文件路径；
+    流式构造 multipart 请求体，上传内容不在内存中再复制一份。
+    """
     if not SILICONFLOW_ASR_KEY:
         raise ValueError("SiliconFlow ASR密钥未配置")
-    url = "https://api.siliconflow.cn/v1/audio/transcriptions"
-    headers = {"Authorization": f"Bearer {SILICONFLOW_ASR_KEY}"}
-    with open(audio_file_path, 'rb') as audio_file:
-        files = {'file': audio_file, 'model': (None, 'FunAudioLLM/SenseVoiceSmall')}
-        try:
-            response = requests.post(url, headers=headers, files=files, timeout=30)
-            response.raise_for_status()
-        except Exception as e:
-            app.logger.error(f"SiliconFlow ASR 请求失败: {e}")
-            raise
-        return response.json().get("text", "")
+    if isinstance(audio, str):
+        with open(audio, 'rb') as f:
+            return asr_with_siliconflow(f, os.path.basename(audio), content_type)
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        audio = io.BytesIO(audio)
+    if size is None:
+        size = _stream_size(audio)
+    body = _MultipartBody({"model": ASR_MODEL}, "file", filename, content_type, audio, size)
+    headers = {"Authorization": f"Bearer {SILICONFLOW_ASR_KEY}", "Content-Type": body.content_type}
+    try:
+        response = http_request("siliconflow_asr", "POST", ASR_URL, headers=headers, data=body)
+        response.raise_for_status()
+    except Exception as e:
+        app.logger.error(f"SiliconFlow ASR 请求失败: {e}")
+        raise
+    return response.json().get("text", "")
+
+
+def _split_wav(data: bytes, chunk_seconds: float):
+    """
+    将 WAV 按约 chunk_seconds 切分为多段 WAV，切分点取名义分段点附近能量最低的位置。
+    返回 [wav_bytes, ...]；不足一段时原样返回
+    """
+    with wave.open(io.BytesIO(data), 'rb') as wav:
+        channels, sample_width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        pcm = wav.readframes(wav.getnframes())
+    frame_bytes = channels * sample_width
+    n_frames = len(pcm) // frame_bytes
+    chunk_frames = int(chunk_seconds * rate)
+    if chunk_frames <= 0 or n_frames <= chunk_frames:
+        return [data]
+
+    window = max(1, int(ASR_SPLIT_WINDOW_SECONDS * rate))
+    search = int(ASR_SPLIT_SEARCH_SECONDS * rate)
+    energy = None
+    if sample_width == 2:
+        samples = np.frombuffer(pcm[:n_frames * frame_bytes], dtype='<i2').reshape(-1, channels)
+        n_windows = n_frames // window
+        blocks = samples[:n_windows * window].astype(np.float32).reshape(n_windows, window * channels)
+        energy = np.mean(blocks * blocks, axis=1)
+
+    cuts = [0]
+    nominal = chunk_frames
+    while nominal < n_frames - chunk_frames // 4:  # 末段过短时并入上一段
+        cut = nominal
+        if energy is not None:
+            lo = max((nominal - search) // window, cuts[-1] // window + 1)
+            hi = min((nominal + search) // window, len(energy))
+            if hi > lo:
+                cut = (lo + int(np.argmin(energy[lo:hi]))) * window
+        cuts.append(cut)
+        nominal = cut + chunk_frames
+    cuts.append(n_frames)
+    return [_pcm_to_wav(pcm[a * frame_bytes:b * frame_bytes], rate, channels, sample_width)
+            for a, b in zip(cuts, cuts[1:])]
+
+
+def _stitch_transcripts(texts):
+    """按顺序拼接分段识别结果；两侧都是字母数字时补一个空格"""
+    result = ""
+    for text in (t.strip() for t in texts):
+        if not text:
+            continue
+        if result and result[-1].isascii() and result[-1].isalnum() and text[0].isascii() and text[0].isalnum():
+            result += " "
+        result += text
+    return result
+
+
+def asr_chunked(data: bytes, chunk_seconds: float = ASR_CHUNK_SECONDS):
+    """长录音分段并发识别后按顺序拼接，返回 (text, 分段数)"""
+    chunks = _split_wav(data, chunk_seconds)
+    if len(chunks) == 1:
+        return asr_with_siliconflow(chunks[0], "audio.wav", "audio/wav"), 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(ASR_CHUNK_CONCURRENCY, len(chunks)),
+                                               thread_name_prefix="asr-chunk") as pool:
+        texts = list(pool.map(lambda c: asr_with_siliconflow(c, "audio.wav", "audio/wav"), chunks))
+    return _stitch_transcripts(texts), len(chunks)
+
+
+# ====== 豆包图片生成 ======
+DOUBAO_IMAGE_URL = "https://ark.cn-beijing.volces.com/api/v3/images/generations"
+PLACEHOLDER_IMAGE_URL = "https://picsum.photos/1024"
+
+
+def _doubao_generate_image(prompt: str) -> str:
+    """调用豆包生成图片，返回图片 URL；失败抛出异常"""
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {DOUBAO_API_KEY}"}
+    payload = {
+        "model": "doubao-seedream-4-0-250828",
+        "prompt": prompt,
+        "response_format": "url",
+        "size": "2K",
+        "stream": False,
+        "watermark": False
+    }
+    log_sampled("payload", "调用豆包生成图片 payload=%s", LazyPreview(payload))
+    r = http_request("doubao", "POST", DOUBAO_IMAGE_URL, headers=headers, data=json.dumps(payload))
+    logger.info(f"豆包响应状态: {r.status_code}")
+    r.raise_for_status()
+    data_resp = r.json()
+    image_url = data_resp.get("data", [{}])[0].get("url") or data_resp.get("url")
+    if not image_url:
+        raise RuntimeError("豆包API未返回图片URL")
+    return image_url
+
+
+def _placeholder_image_bytes() -> bytes:
+    """豆包失败时的占位图（每次随机，不走 URL 缓存）"""
+    placeholder = http_request("picsum", "GET", PLACEHOLDER_IMAGE_URL)
+    placeholder.raise_for_status()
+    return placeholder.content
 
 
 # ====== 登录验证装饰器 ======
@@ -276,36 +1276,25 @@ def index():
 @login_required
 def chat():
     data = request.get_json()
-    app.logger.info(f"/chat payload={json.dumps(data, ensure_ascii=False)}")
+    log_sampled("payload", "/chat payload=%s", LazyPreview(data))
     message = data.get("message", "").strip()
     mode = data.get("mode", "chat").strip()
     provider = data.get("provider", "openrouter").strip()
 
     if mode == "image":
+        if _as_bool(data.get("async"), default=False):
+            return _submit_image_job_response(message, data)
         try:
-            headers = {"Content-Type": "application/json", "Authorization": f"Bearer {DOUBAO_API_KEY}"}
-            payload = {
-                "model": "doubao-seedream-4-0-250828",
-                "prompt": message,
-                "response_format": "url",
-                "size": "2K",
-                "stream": False,
-                "watermark": False
-            }
-            app.logger.info(f"调用豆包(聊天) 生成图片 payload={json.dumps(payload, ensure_ascii=False)}")
-            r = requests.post("https://ark.cn-beijing.volces.com/api/v3/images/generations",
-                              headers=headers, data=json.dumps(payload), timeout=60)
-            app.logger.info(f"豆包(聊天) 响应状态: {r.status_code}")
-            r.raise_for_status()
-            data_resp = r.json()
-            image_url = data_resp.get("data", [{}])[0].get("url") or data_resp.get("url")
-            if not image_url:
-                return jsonify({"success": False, "error": "豆包API未返回图片URL"}), 502
+            image_url = _doubao_generate_image(message)
             return jsonify({"success": True, "imageUrl": image_url})
         except Exception as e:
             return jsonify({"success": False, "error": f"豆包生成失败: {str(e)}"}), 500
 
     try:
+        if provider == "auto":
+            reply, info = chat_router.chat(message)
+            app.logger.info(f"/chat 对冲路由结果: {info}")
+            return jsonify({"reply": reply, "provider": info["provider"], "hedged": info["hedged"]})
         if provider == "baidu":
             reply = chat_with_baidu(message)
         elif provider == "xfy":
@@ -320,94 +1309,374 @@ def chat():
         return jsonify({"reply": f"调用失败: {str(e)}"}), 500
 
 
-@app.route('/tts', methods=['POST'])
+@app.route('/chat/stream', methods=['POST'])
 @login_required
-def tts():
-    data = request.get_json()
-    app.logger.info(f"/tts payload={json.dumps(data, ensure_ascii=False)}")
-    text = data.get("text", "")
-    provider = data.get("provider", "xunfei")
+def chat_stream():
+    """流式对话：以 SSE 逐 token 转发服务商输出，首字节时间即服务商首 token 时间"""
+    data = request.get_json() or {}
+    log_sampled("payload", "/chat/stream payload=%s", LazyPreview(data))
+    message = data.get("message", "").strip()
+    provider = data.get("provider", "openrouter").strip()
+    if not message:
+        return jsonify({"success": False, "error": "消息不能为空"}), 400
+    return Response(_chat_stream_events(provider, message), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    try:
-        if provider == "xunfei":
-            audio_data = tts_with_xunfei(text)
-            audio_base64 = base64.b64encode(audio_data).decode()
-        else:
-            headers = {"Authorization": f"Bearer {SILICONFLOW_TTS_KEY}"}
-            payload = {"model": "gpt-4o-mini-tts", "input": text, "voice": "alloy"}
-            r = requests.post("https://api.siliconflow.cn/v1/audio/speech", headers=headers, json=payload)
-            r.raise_for_status()
-            audio_base64 = base64.b64encode(r.content).decode()
-        return jsonify({"audio": audio_base64, "provider": provider})
-    except Exception as e:
-        app.logger.error(f"TTS错误: {str(e)}")
-        return jsonify({"error": f"TTS失败: {str(e)}"}), 500
 
+# ====== 语音合成缓存（内存 LRU + 磁盘，按字节预算淘汰）======
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "jarvis_tts_cache"))  # 为空则不落盘
+TTS_CACHE_DISK_MAX_BYTES = int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+TTS_STREAM_CHUNK = 4 * 1024  # 小块转发，尽快送出首段音频
+TTS_DEFAULTS = {
+    "xunfei": {"voice": "xiaoyan", "speed": 50},
+    "siliconflow": {"voice": "alloy", "speed": 1.0},
+}
+_AUDIO_EXTENSIONS = {"audio/wav": ".wav", "audio/mpeg": ".mp3"}
 
-@app.route('/asr', methods=['POST'])
-@login_required
-def asr():
-    if 'audio' not in request.files:
-        return jsonify({"error": "未找到音频文件"}), 400
-    audio_file = request.files['audio']
-    if audio_file.filename == '':
-        return jsonify({"error": "未选择文件"}), 400
-    import tempfile
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
-        audio_file.save(tmp_file.name)
-    try:
-        text = asr_with_siliconflow(tmp_file.name)
-        return jsonify({"text": text})
-    finally:
-        os.unlink(tmp_file.name)
 
+class TTSCache:
+    """
+    语音合成结果缓存，键为 (服务商, 音色, 语速, 文本哈希)。
+    内存层按字节预算 LRU 淘汰；磁盘层按文件访问时间淘汰最久未用的音频，进程重启后仍可命中。
+    """
 
-@app.route('/api/generate-image', methods=['POST'])
-@login_required
-def generate_image():
-    data = request.get_json()
-    app.logger.info(f"/api/generate-image payload={json.dumps(data, ensure_ascii=False)}")
-    prompt = data.get('prompt', '')
-    
-    if not prompt:
-        return jsonify({"success": False, "error": "缺少图片描述"}), 400
-    
-    try:
-        # 使用豆包API生成图片
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {DOUBAO_API_KEY}"}
-        payload = {
-            "model": "doubao-seedream-4-0-250828",
-            "prompt": prompt,
-            "response_format": "url",
-            "size": "2K",
-            "stream": False,
-            "watermark": False
-        }
-        print(f"调用豆包API，prompt: {prompt}")  # 调试日志
-        r = requests.post("https://ark.cn-beijing.volces.com/api/v3/images/generations",
-                          headers=headers, data=json.dumps(payload), timeout=60)
-        print(f"豆包API响应状态: {r.status_code}")  # 调试日志
-        r.raise_for_status()
-        data_resp = r.json()
-        print(f"豆包API响应数据: {data_resp}")  # 调试日志
-        image_url = data_resp.get("data", [{}])[0].get("url") or data_resp.get("url")
-        
-        if not image_url:
-            return jsonify({"success": False, "error": "豆包API未返回图片URL"}), 502
-            
-        return jsonify({
-            "success": True,
+    def __init__(self, max_bytes=TTS_CACHE_MAX_BYTES, disk_dir=TTS_CACHE_DIR,
+                 disk_max_bytes=TTS_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = collections.OrderedDict()  # key -> (audio, content_type)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(provider, voice, speed, text):
+        text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return hashlib.sha256(f"{provider}|{voice}|{speed}|{text_hash}".encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key, content_type):
+        return os.path.join(self.disk_dir, key + _AUDIO_EXTENSIONS.get(content_type, ".bin"))
+
+    def _find_disk(self, key):
+        for content_type in _AUDIO_EXTENSIONS:
+            path = self._disk_path(key, content_type)
+            if os.path.exists(path):
+                return path, content_type
+        return None, None
+
+    def get(self, key):
+        """返回 (audio, content_type)；未命中返回 None"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return item
+        if self.disk_dir:
+            path, content_type = self._find_disk(key)
+            if path is not None:
+                try:
+                    with open(path, 'rb') as f:
+                        audio = f.read()
+                    os.utime(path)  # 刷新访问时间，作为磁盘层 LRU 依据
+                except OSError as e:
+                    app.logger.warning(f"读取语音磁盘缓存失败: {path}: {e}")
+                else:
+                    with self._lock:
+                        self.disk_hits += 1
+                    self._put_memory(key, audio, content_type)
+                    return audio, content_type
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, audio, content_type):
+        self._put_memory(key, audio, content_type)
+        if self.disk_dir:
+            path = self._disk_path(key, content_type)
+            tmp = path + '.tmp'
+            try:
+                with open(tmp, 'wb') as f:
+                    f.write(audio)
+                os.replace(tmp, path)
+            except OSError as e:
+                app.logger.warning(f"写入语音磁盘缓存失败: {path}: {e}")
+                return
+            self._evict_disk()
+
+    def _put_memory(self, key, audio, content_type):
+        size = len(audio)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = (audio, content_type)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def _disk_files(self):
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+        return files
+
+    def _evict_disk(self):
+        try:
+            files = self._disk_files()
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.disk_max_bytes:
+                    break
+                os.remove(path)
+                total -= size
+                with self._lock:
+                    self.disk_evictions += 1
+        except OSError as e:
+            app.logger.warning(f"清理语音磁盘缓存失败: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        disk_files, disk_bytes = 0, 0
+        if self.disk_dir:
+            try:
+                files = self._disk_files()
+                disk_files, disk_bytes = len(files), sum(size for _, size, _ in files)
+            except OSError:
+                pass
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_dir": self.disk_dir or None,
+                "disk_files": disk_files,
+                "disk_bytes": disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
+
+
+tts_cache = TTSCache()
+
+
+def _pcm_to_wav(pcm, rate=16000, channels=1, sample_width=2):
+    """讯飞返回裸 PCM，加上 WAV 头后浏览器可直接播放"""
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(rate)
+        wav.writeframes(pcm)
+    return buf.getvalue()
+
+
+def _parse_tts_options(data):
+    """解析服务商/音色/语速参数，返回 (provider, voice, speed)"""
+    provider = data.get("provider", "xunfei")
+    if provider != "xunfei":
+        provider = "siliconflow"
+    defaults = TTS_DEFAULTS[provider]
+    voice = data.get("voice") or defaults["voice"]
+    speed = type(defaults["speed"])(data.get("speed") or defaults["speed"])
+    return provider, voice, speed
+
+
+def _siliconflow_tts_request(text, voice, speed, stream=False):
+    headers = {"Authorization": f"Bearer {SILICONFLOW_TTS_KEY}"}
+    payload = {"model": "gpt-4o-mini-tts", "input": text, "voice": voice, "speed": speed,
+               "response_format": "mp3"}
+    r = http_request("siliconflow_tts", "POST", "https://api.siliconflow.cn/v1/audio/speech",
+                     headers=headers, json=payload, stream=stream)
+    r.raise_for_status()
+    return r
+
+
+def synthesize_speech(provider, text, voice, speed):
+    """带缓存的语音合成，返回 (audio, content_type, 是否命中缓存)"""
+    key = TTSCache.make_key(provider, voice, speed, text)
+    cached = tts_cache.get(key)
+    if cached is not None:
+        return cached[0], cached[1], True
+    if provider == "xunfei":
+        audio, content_type = _pcm_to_wav(tts_with_xunfei(text, voice, speed)), "audio/wav"
+    else:
+        audio, content_type = _siliconflow_tts_request(text, voice, speed).content, "audio/mpeg"
+    tts_cache.put(key, audio, content_type)
+    return audio, content_type, False
+
+
+@app.route('/tts', methods=['POST'])
+@login_required
+def tts():
+    data = request.get_json()
+    log_sampled("payload", "/tts payload=%s", LazyPreview(data))
+    text = data.get("text", "")
+
+    try:
+        provider, voice, speed = _parse_tts_options(data)
+        audio_data, content_type, cached = synthesize_speech(provider, text, voice, speed)
+        audio_base64 = base64.b64encode(audio_data).decode()
+        return jsonify({"audio": audio_base64, "provider": provider, "content_type": content_type,
+                        "cached": cached})
+    except Exception as e:
+        app.logger.error(f"TTS错误: {str(e)}")
+        return jsonify({"error": f"TTS失败: {str(e)}"}), 500
+
+
+@app.route('/tts/audio', methods=['GET', 'POST'])
+@login_required
+def tts_audio():
+    """
+    直接返回音频字节（audio/wav 或 audio/mpeg），可作为 <audio> 的 src 边下边播。
+    缓存命中时支持 Range 请求；SiliconFlow 未命中时边转发上游音频边写入缓存。
+    """
+    data = request.get_json(silent=True) or request.values.to_dict()
+    text = data.get("text", "")
+    if not text:
+        return jsonify({"error": "缺少 text"}), 400
+    try:
+        provider, voice, speed = _parse_tts_options(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"参数错误: {str(e)}"}), 400
+    key = TTSCache.make_key(provider, voice, speed, text)
+
+    try:
+        cached = tts_cache.get(key)
+        if cached is None and provider == "xunfei":
+            # 讯飞接口一次性返回整段 PCM，无法流式转发
+            audio, content_type, _ = synthesize_speech(provider, text, voice, speed)
+            cached = (audio, content_type)
+        if cached is not None:
+            response = Response(cached[0], mimetype=cached[1])
+            response.headers["Cache-Control"] = "private, max-age=86400"
+            return response.make_conditional(request, accept_ranges=True, complete_length=len(cached[0]))
+
+        upstream = _siliconflow_tts_request(text, voice, speed, stream=True)
+    except Exception as e:
+        app.logger.error(f"TTS错误: {str(e)}")
+        return jsonify({"error": f"TTS失败: {str(e)}"}), 500
+
+    def relay():
+        parts = []
+        try:
+            for chunk in upstream.iter_content(TTS_STREAM_CHUNK):
+                parts.append(chunk)
+                yield chunk
+        finally:
+            upstream.close()
+        tts_cache.put(key, b"".join(parts), "audio/mpeg")  # 完整转发后才写入缓存
+
+    return Response(relay(), mimetype="audio/mpeg", headers={"Cache-Control": "no-cache"})
+
+
+@app.route('/api/tts-cache', methods=['GET'])
+@login_required
+def tts_cache_stats():
+    """语音合成缓存统计"""
+    return jsonify({"success": True, "stats": tts_cache.stats()})
+
+
+@app.route('/api/tts-cache', methods=['DELETE'])
+@login_required
+def tts_cache_clear():
+    """清空内存中的语音缓存（磁盘层保留）"""
+    tts_cache.clear()
+    return jsonify({"success": True})
+
+
+@app.route('/asr', methods=['POST'])
+@login_required
+def asr():
+    """
+    语音识别。支持 multipart 表单字段 audio，或直接以 audio/* / application/octet-stream 请求体上传。
+    上传保存在内存中并直接流式转发给识别服务；?chunked=1 时按 WAV 分段并发识别（长录音）。
+    """
+    if request.content_length is not None and request.content_length > ASR_MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"音频过大，上限 {ASR_MAX_UPLOAD_BYTES // (1024 * 1024)}MB"}), 413
+    chunked = _as_bool(request.args.get('chunked'), default=False)
+
+    if request.mimetype.startswith('audio/') or request.mimetype == 'application/octet-stream':
+        # 原始请求体不可回退，读入内存（受大小上限约束）以便连接失败时重试
+        stream = io.BytesIO(request.stream.read(ASR_MAX_UPLOAD_BYTES + 1))
+        filename = request.args.get('filename', 'audio.wav')
+        content_type = request.mimetype
+    else:
+        if 'audio' not in request.files:
+            return jsonify({"error": "未找到音频文件"}), 400
+        audio_file = request.files['audio']
+        if audio_file.filename == '':
+            return jsonify({"error": "未选择文件"}), 400
+        stream = audio_file.stream
+        filename = audio_file.filename
+        content_type = audio_file.mimetype or 'application/octet-stream'
+    size = _stream_size(stream)
+    if size > ASR_MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"音频过大，上限 {ASR_MAX_UPLOAD_BYTES // (1024 * 1024)}MB"}), 413
+
+    try:
+        if chunked:
+            chunk_seconds = float(request.args.get('chunk_seconds', ASR_CHUNK_SECONDS))
+            text, n_chunks = asr_chunked(stream.read(), chunk_seconds)
+            return jsonify({"text": text, "chunks": n_chunks})
+        text = asr_with_siliconflow(stream, filename, content_type, size)
+        return jsonify({"text": text})
+    except (wave.Error, EOFError) as e:
+        return jsonify({"error": f"分段识别仅支持 WAV 音频: {str(e) or '文件不完整'}"}), 400
+    except Exception as e:
+        app.logger.error(f"ASR错误: {str(e)}")
+        return jsonify({"error": f"ASR失败: {str(e)}"}), 500
+
+
+@app.route('/api/generate-image', methods=['POST'])
+@login_required
+def generate_image():
+    data = request.get_json()
+    log_sampled("payload", "/api/generate-image payload=%s", LazyPreview(data))
+    prompt = data.get('prompt', '')
+    
+    if not prompt:
+        return jsonify({"success": False, "error": "缺少图片描述"}), 400
+    
+    # 异步模式：立即返回任务ID，生成与后续预处理在后台完成
+    if _as_bool(data.get('async'), default=False):
+        return _submit_image_job_response(prompt, data)
+
+    try:
+        image_url = _doubao_generate_image(prompt)
+        return jsonify({
+            "success": True,
             "imageUrl": image_url,
             "imageData": "",  # 豆包返回的是URL，不是base64
             "fallback": False
         })
     except Exception as e:
-        print(f"图片生成错误: {str(e)}")  # 添加日志
+        app.logger.error(f"图片生成错误: {str(e)}")
         # 如果豆包API失败，回退到占位图
         try:
-            placeholder = requests.get("https://picsum.photos/1024", timeout=15)
-            placeholder.raise_for_status()
-            image_base64 = base64.b64encode(placeholder.content).decode()
+            image_base64 = base64.b64encode(_placeholder_image_bytes()).decode()
             image_url = f"data:image/jpeg;base64,{image_base64}"
             return jsonify({
                 "success": True,
@@ -423,40 +1692,213 @@ def generate_image():
             }), 500
 
 
+@app.route('/api/chat-providers', methods=['GET'])
+@login_required
+def chat_provider_stats():
+    """对冲路由中各服务商的延迟、错误率与评分（评分越低越优先）"""
+    return jsonify({
+        "success": True,
+        "ranking": chat_router.ranked(),
+        "providers": chat_router.stats(),
+        "hedge_percentile": CHAT_HEDGE_PERCENTILE
+    })
+
+
+@app.route('/api/http-stats', methods=['GET'])
+@login_required
+def http_stats():
+    """第三方接口连接复用率与各服务调用耗时"""
+    return jsonify({"success": True, "stats": http_pool_stats()})
+
+
+# ====== 像素数据载荷（JSON 列表 / base64 / 原始字节）======
+def _encode_pixel_payload(np_array, mode):
+    """将像素数组编码为紧凑的 base64 载荷（原始 uint8 字节 + 形状/模式元信息）"""
+    contiguous = np.ascontiguousarray(np_array, dtype=np.uint8)
+    return {
+        "encoding": "base64",
+        "dtype": "uint8",
+        "shape": list(contiguous.shape),
+        "mode": mode,
+        "data": base64.b64encode(contiguous.data).decode('ascii'),
+    }
+
+
+def _request_pixel_payload():
+    """
+    解析请求中的像素数据，支持三种形式：
+    - JSON：{"width", "height", "array": [...]}
+    - JSON：{"width", "height", "array_b64": "<base64 编码的原始 uint8>"}
+    - application/octet-stream：请求体为原始 uint8 字节，width/height 等参数放在查询字符串
+    返回：(参数 dict, 一维像素数组)，JSON 列表形式返回原列表以保持旧行为
+    """
+    if request.mimetype == 'application/octet-stream':
+        data = request.args.to_dict()
+        return data, np.frombuffer(request.get_data(), dtype=np.uint8)
+    data = request.get_json() or {}
+    if data.get('array_b64'):
+        return data, np.frombuffer(base64.b64decode(data['array_b64']), dtype=np.uint8)
+    return data, data.get('array', [])
+
+
+def _load_request_image():
+    """
+    解析请求中的图片像素：优先按 image_id 引用服务端已保存的数组，否则读取请求载荷。
+    返回：(参数 dict, 像素数组, width, height, image_id)，直接上传时 image_id 为 None
+    image_id 不存在或已过期时抛出 LookupError
+    """
+    data, array = _request_pixel_payload()
+    image_id = data.get('image_id', '')
+    if image_id:
+        stored = artifact_store.get('image', image_id)
+        if stored is None:
+            raise LookupError(f"图片 {image_id} 不存在或已过期，请重新上传")
+        array, meta = stored
+        return data, array, meta['width'], meta['height'], image_id
+    return data, array, int(data.get('width', 0)), int(data.get('height', 0)), None
+
+
+def _encode_fpga_frames(image_id, array, width, height, encoding, path_strategy, threshold, baudrate):
+    """
+    按 (image_id, 编码参数) 记忆化生成 UART 帧集，同一图片同一参数只编码一次。
+    返回：(frames, encoding_stats, frames_id)
+    """
+    if encoding == 'dense':
+        path_strategy, threshold = '', None  # 稠密帧与阈值、路径无关
+    frames_id = ArtifactStore.make_id('frames', image_id, encoding, path_strategy, threshold, baudrate)
+    cached = artifact_store.get('frames', frames_id)
+    if cached is not None:
+        return cached[0], cached[1]['encoding_stats'], frames_id
+
+    started = time.perf_counter()
+    if encoding == 'sparse':
+        order = None
+        if path_strategy == 'auto':
+            strategies = _auto_path_strategies(_path_points(array, width, threshold).size)
+            _, path_strategy = _compare_path_plans(array, width, height, strategies, threshold, baudrate)
+        if path_strategy:
+            order = _plan_engrave_path(array, width, height, path_strategy, threshold)
+        frames = _build_sparse_fpga_frames(array, width, height, threshold, order=order)
+        n_bytes = len(frames) * DATA_FRAME_LEN
+    elif encoding == 'segment':
+        if path_strategy not in ('', 'row_major', 'serpentine'):
+            raise ValueError(f"线段编码仅支持 row_major / serpentine 路径: {path_strategy}")
+        serpentine = path_strategy == 'serpentine'
+        buf, frame_lengths, runs = _encode_segment_frames(array, width, height, threshold, serpentine)
+        frames = _segment_frames_to_list(buf, frame_lengths)
+        n_bytes = int(buf.size)
+        app.logger.info(f"线段帧格式: {width}x{height}, 阈值={threshold}, "
+                        f"线段 {int(np.count_nonzero(frame_lengths == SEGMENT_FRAME_LEN))}, "
+                        f"帧数 {len(frames)}, 覆盖像素 {int(runs[2].sum())}")
+    else:
+        frames = _build_fpga_frames_from_grayscale(array, width, height)
+        n_bytes = META_FRAME_LEN + (len(frames) - 1) * DATA_FRAME_LEN
+    encoding_stats = _encoding_stats(encoding, n_bytes, len(frames), len(array), baudrate)
+    if encoding == 'sparse':
+        encoding_stats["path_strategy"] = path_strategy or 'row_major'
+    elif encoding == 'segment':
+        # 与逐像素坐标帧（同一路径顺序）对比帧数与预计雕刻耗时
+        idx = _path_points(array, width, threshold)
+        pixel_order = _plan_serpentine(idx, width) if serpentine else idx
+        _, _, sparse_job_time = _estimate_job_time(pixel_order, width, baudrate)
+        travel_steps, _, job_time = _estimate_segment_job_time(runs, frame_lengths, baudrate)
+        encoding_stats.update({
+            "path_strategy": path_strategy or 'row_major',
+            "segment_count": int(np.count_nonzero(frame_lengths == SEGMENT_FRAME_LEN)),
+            "pixel_frame_count": int(np.count_nonzero(frame_lengths == DATA_FRAME_LEN)),
+            "sparse_frame_count": int(idx.size),
+            "travel_steps": travel_steps,
+            "estimated_job_time_s": round(job_time, 3),
+            "sparse_estimated_job_time_s": round(sparse_job_time, 3),
+        })
+    IMAGE_CONVERSION_SECONDS.observe(time.perf_counter() - started, 'frame_encode')
+    artifact_store.put('frames', frames_id, frames, {
+        "image_id": image_id, "width": width, "height": height, "encoding_stats": encoding_stats,
+    })
+    return frames, encoding_stats, frames_id
+
+
+def _dither_stored_image(image_id, array, width, height, dither):
+    """对已保存的灰度图做半色调，结果按 (image_id, dither) 另存，返回 (array, 新 image_id)"""
+    dithered_id = ArtifactStore.make_id('image', image_id, dither)
+    stored = artifact_store.get('image', dithered_id)
+    if stored is not None:
+        return stored[0], dithered_id
+    bitmap = _halftone(np.asarray(array, dtype=np.uint8).reshape(height, width), dither)
+    return bitmap.ravel(), _store_image_array(bitmap, width, height, image_id=dithered_id)
+
+
+def _as_bool(value, default=True):
+    """兼容 JSON 布尔值与查询字符串中的 'true'/'false'"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ('false', '0', 'no', '')
+    return bool(value)
+
+
 @app.route('/api/send-to-fpga', methods=['POST'])
 @login_required
 def send_to_fpga():
-    data = request.get_json()
-    width = data.get('width', 0)
-    height = data.get('height', 0)
-    array = data.get('array', [])
-    build_frames = bool(data.get('frames', True))
     try:
-        if not array or width <= 0 or height <= 0:
+        data, array, width, height, image_id = _load_request_image()
+        build_frames = _as_bool(data.get('frames'))
+        encoding = data.get('encoding', 'dense')
+        path_strategy = data.get('path_strategy', '')
+        threshold = int(data.get('threshold', 1))
+        baudrate = int(data.get('baudrate', FPGA_UART_BAUDRATE))
+        guard_time = float(data.get('guard_time', 0))
+        preview_limit = int(data.get('preview_limit', -1))  # 负数表示返回全部帧
+        simulate = _as_bool(data.get('simulate'), default=False)
+        dither = _parse_dither_option(data)
+        if len(array) == 0 or width <= 0 or height <= 0:
             return jsonify({"success": False, "error": "无效的数据格式"})
         if len(array) != width * height:
             return jsonify({
                 "success": False,
                 "error": f"数组长度不匹配: 期望 {width * height}, 实际 {len(array)}"
             })
+        if encoding not in ('dense', 'sparse', 'segment'):
+            return jsonify({"success": False, "error": f"不支持的编码方式: {encoding}"})
+        if image_id is None:
+            image_id = _store_image_array(array, width, height)
+        if dither != 'none':
+            array, image_id = _dither_stored_image(image_id, array, width, height, dither)
         frames_preview = []
+        encoding_stats = None
+        frames_id = None
         if build_frames:
-            # 获取完整的帧数据，不限制预览数量
-            frames_preview = _build_fpga_frames_from_grayscale(array, width, height)
+            frames_preview, encoding_stats, frames_id = _encode_fpga_frames(
+                image_id, array, width, height, encoding, path_strategy, threshold, baudrate)
+            app.logger.info(f"编码统计: {encoding_stats}")
 
         # 记录FPGA帧格式数据
-        if frames_preview:
+        if frames_preview and encoding == 'segment':
+            app.logger.info("=== FPGA 线段 UART 协议数据 ===")
+            for i, (x, y, length, pixel) in enumerate(_decode_coordinate_frames(
+                    bytes(itertools.chain.from_iterable(frames_preview[:10])))):
+                app.logger.info(f"  帧{i+1} [{'线段' if length > 1 else '坐标'}]: X={x}, Y={y}, 长度={length}, 像素={pixel:02X}")
+            app.logger.info("=== 协议传输完成 ===")
+        elif frames_preview and encoding == 'sparse':
+            app.logger.info("=== FPGA 坐标寻址 UART 协议数据 ===")
+            for i, frame in enumerate(frames_preview[:10]):
+                frame_hex = ' '.join([f"{int(b):02X}" for b in frame])
+                app.logger.info(f"  帧{i+1} [坐标]: {frame_hex}")
+                app.logger.info(f"    解析: X={(frame[1] << 8) | frame[2]}, Y={(frame[3] << 8) | frame[4]}, "
+                                f"像素={frame[5]:02X}, 校验={frame[6]:02X}(计算:{sum(frame[1:6]) & 0xFF:02X})")
+            app.logger.info("=== 协议传输完成 ===")
+        elif frames_preview:
             app.logger.info(f"=== FPGA 工业级 UART 协议数据 ===")
             app.logger.info(f"图像尺寸: {width}x{height}, 总帧数: {len(frames_preview)}")
             app.logger.info(f"数据帧数: {len(frames_preview) - 1}, 元信息帧数: 1")
             
             for i, frame in enumerate(frames_preview[:10]):  # 只记录前10帧
-                frame_type = "元信息" if frame[1] == 0x00 else "数据"
+                frame_type = _frame_kind(frame, 'dense')
                 frame_hex = ' '.join([f"{int(b):02X}" for b in frame])
                 app.logger.info(f"  帧{i+1} [{frame_type}]: {frame_hex}")
                 
                 # 详细解析第一帧（元信息帧）
-                if i == 0 and frame[1] == 0x00:
+                if frame_type == "元信息":
                     w = frame[3] + (frame[4] << 8)
                     h = frame[5] + (frame[6] << 8)
                     checksum = frame[7]
@@ -464,7 +1906,7 @@ def send_to_fpga():
                     app.logger.info(f"    解析: 宽度={w}, 高度={h}, 校验={int(checksum):02X}(计算:{calc_checksum:02X})")
                 
                 # 详细解析数据帧
-                elif frame[1] == 0x01:
+                else:
                     frame_cnt = frame[2]
                     pixels = frame[3:6]
                     checksum = frame[6]
@@ -473,87 +1915,707 @@ def send_to_fpga():
             
             app.logger.info(f"=== 协议传输完成 ===")
 
-        fpga_result = simulate_fpga_communication(array, width, height)
-        if fpga_result['success']:
-            return jsonify({
-                "success": True,
-                "message": f"成功发送 {len(array)} 个像素数据到FPGA",
-                "fpga_response": fpga_result.get('response', ''),
-                "data_info": {
-                    "width": width,
-                    "height": height,
-                    "pixel_count": len(array),
-                    "min_value": min(array),
-                    "max_value": max(array),
-                    "avg_value": sum(array) / len(array)
-                },
-                "uart_frame_preview": frames_preview
-            })
-        else:
-            return jsonify({"success": False, "error": fpga_result.get('error', 'FPGA通信失败')})
+        fpga_simulation = None
+        fpga_response = f"FPGA已接收 {len(array)} 个像素数据"
+        if frames_preview and simulate:
+            # 仿真为逐帧时钟周期模型，大图耗时数秒，仅在显式请求时运行；批量对比请用 /api/fpga-simulate
+            if encoding in FPGA_SIMULATED_ENCODINGS:
+                fpga_simulation = _simulate_fpga_pipeline(frames_preview, baudrate, guard_time)
+            else:
+                fpga_simulation = _fpga_simulation_not_modelled(encoding)
+            fpga_response = _fpga_simulation_summary(fpga_simulation)
+            app.logger.info(fpga_response)
+        return jsonify({
+            "success": True,
+            "message": f"成功发送 {len(array)} 个像素数据到FPGA",
+            "fpga_response": fpga_response,
+            "fpga_simulation": fpga_simulation,
+            "data_info": {
+                "width": width,
+                "height": height,
+                "pixel_count": len(array),
+                "min_value": int(np.min(array)),
+                "max_value": int(np.max(array)),
+                "avg_value": float(np.mean(array))
+            },
+            "uart_frame_preview": frames_preview[:preview_limit] if preview_limit >= 0 else frames_preview,
+            "frame_count": len(frames_preview),
+            "encoding_stats": encoding_stats,
+            "image_id": image_id,
+            "frames_id": frames_id
+        })
+    except LookupError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": f"发送到FPGA失败: {str(e)}"})
 
 
-def simulate_fpga_communication(array, width, height):
-    import time, random
-    try:
-        time.sleep(0.1)
-        return {
-            "success": True,
-            "response": f"FPGA已接收 {len(array)} 个像素数据",
-            "processing_time": random.uniform(0.05, 0.2)
-        }
-    except Exception as e:
-        return {"success": False, "error": f"FPGA通信错误: {str(e)}"}
+# ====== FPGA UART 帧协议常量 ======
+FRAME_HEADER = 0xAA
+FRAME_TRAILER = 0x55
+FRAME_TYPE_META = 0x00
+FRAME_TYPE_DATA = 0x01
+PIXELS_PER_FRAME = 3
+META_FRAME_LEN = 9
+DATA_FRAME_LEN = 8
+SEGMENT_FRAME_LEN = 10      # 线段帧：AA 80|XH XL YH YL LH LL PIX SUM 55
+SEGMENT_FLAG = 0x80         # 坐标仅 12 位，XH 最高位置 1 表示线段帧
+MAX_SEGMENT_LEN = 0xFFFF
+FPGA_UART_BAUDRATE = 9600  # 与 uart_rx_image.v 的 BAUD_RATE 参数一致
+
+
+def _frame_kind(frame, encoding=None):
+    """
+    日志用的帧类型：按编码、帧长与线段标志判断，不能只看字节 1（X < 256 的坐标帧 XH 也为 0x00）。
+    encoding 未知时 8 字节帧按字节 1 是否为 FRAME_TYPE_DATA 猜测（X 在 256~511 的坐标帧会被当作数据帧）
+    """
+    n = len(frame)
+    if n == SEGMENT_FRAME_LEN and frame[1] & SEGMENT_FLAG:
+        return "线段"
+    if encoding in ('sparse', 'segment'):
+        return "坐标"
+    if n == META_FRAME_LEN and frame[1] == FRAME_TYPE_META:
+        return "元信息"
+    if encoding == 'dense' or (n == DATA_FRAME_LEN and frame[1] == FRAME_TYPE_DATA):
+        return "数据"
+    return "坐标"
 
 
-def _build_fpga_frames_from_grayscale(array, width, height):
+def _encode_dense_frames(array, width, height):
+    """
+    向量化生成稠密帧，一次性写入连续的 uint8 缓冲区。
+    缓冲区布局：元信息帧(9字节) + N 个数据帧(每帧8字节)，与逐帧拼接的字节完全一致。
+    返回：(buffer, frame_count) buffer 为一维 np.uint8 数组，frame_count 含元信息帧
+    """
+    pixels = np.asarray(array, dtype=np.int64).ravel() & 0xFF
+    n_data = -(-pixels.size // PIXELS_PER_FRAME)  # 向上取整
+
+    meta = np.array([FRAME_HEADER, FRAME_TYPE_META, 0x00,
+                     width & 0xFF, (width >> 8) & 0xFF,
+                     height & 0xFF, (height >> 8) & 0xFF,
+                     0x00, FRAME_TRAILER], dtype=np.uint8)
+    meta[7] = int(meta[:7].sum()) & 0xFF
+
+    buf = np.empty(META_FRAME_LEN + n_data * DATA_FRAME_LEN, dtype=np.uint8)
+    buf[:META_FRAME_LEN] = meta
+    data = buf[META_FRAME_LEN:].reshape(n_data, DATA_FRAME_LEN)
+    data[:, 0] = FRAME_HEADER
+    data[:, 1] = FRAME_TYPE_DATA
+    data[:, 2] = np.arange(1, n_data + 1, dtype=np.int64) & 0xFF  # 循环计数，避免与元信息帧冲突
+    padded = np.zeros(n_data * PIXELS_PER_FRAME, dtype=np.uint8)  # 不足补零
+    padded[:pixels.size] = pixels
+    data[:, 3:6] = padded.reshape(n_data, PIXELS_PER_FRAME)
+    data[:, 6] = data[:, :6].sum(axis=1, dtype=np.uint32) & 0xFF
+    data[:, 7] = FRAME_TRAILER
+    return buf, n_data + 1
+
+
+def _dense_frames_to_list(buf):
+    """将稠密帧缓冲区拆分为 list[list[int]]，供 JSON 接口使用"""
+    if buf.size <= META_FRAME_LEN:
+        return [buf[:META_FRAME_LEN].tolist()]
+    return [buf[:META_FRAME_LEN].tolist()] + buf[META_FRAME_LEN:].reshape(-1, DATA_FRAME_LEN).tolist()
+
+
+def _build_fpga_frames_from_grayscale(array, width, height, as_list=True):
     """
     将灰度数组按工业级 FPGA UART 帧格式序列化。
     协议设计：
     - 元信息帧：AA 00 00 W_L W_H H_L H_H SUM 55 (传输图像尺寸)
     - 数据帧：AA 01 CNT P1 P2 P3 SUM 55 (每帧3像素，行优先)
     其中 SUM = 前6字节累加和的低8位
-    返回：list[list[int]] 每帧8字节(0-255)
+    返回：as_list=True 时为 list[list[int]] 每帧8字节(0-255)；
+          as_list=False 时为连续的 np.uint8 缓冲区，可直接 bytes() 写入串口
     """
-    frames = []
-    
-    # 1. 发送元信息帧（图像尺寸）
-    w_l, w_h = width & 0xFF, (width >> 8) & 0xFF
-    h_l, h_h = height & 0xFF, (height >> 8) & 0xFF
-    meta_frame = [0xAA, 0x00, 0x00, w_l, w_h, h_l, h_h, 0x00, 0x55]
-    # 计算校验和
-    meta_frame[7] = sum(meta_frame[:7]) & 0xFF
-    frames.append(meta_frame)
-    
-    # 2. 发送数据帧（每帧3像素）
-    per_frame_pixels = 3
-    frame_count = 0
-    
     # 对于64x64图像，总像素数为4096，需要约1366帧（4096/3）
     total_pixels = width * height
-    app.logger.info(f"FPGA帧格式: {width}x{height} = {total_pixels}像素, 预计{total_pixels//per_frame_pixels + 1}帧")
-    
-    for i in range(0, len(array), per_frame_pixels):
-        frame_count = (frame_count + 1) & 0xFF  # 循环计数，避免与元信息帧冲突
-        
-        # 获取当前帧的像素数据
-        pixels = []
-        for j in range(per_frame_pixels):
-            if i + j < len(array):
-                pixels.append(int(array[i + j]) & 0xFF)
-            else:
-                pixels.append(0)  # 不足补零
-        
-        # 构建数据帧
-        data_frame = [0xAA, 0x01, frame_count] + pixels + [0x00, 0x55]
-        # 计算校验和
-        data_frame[6] = sum(data_frame[:6]) & 0xFF
-        frames.append(data_frame)
-    
-    app.logger.info(f"实际生成帧数: {len(frames)} (元信息帧: 1, 数据帧: {len(frames)-1})")
-    return frames
+    app.logger.info(f"FPGA帧格式: {width}x{height} = {total_pixels}像素, 预计{total_pixels//PIXELS_PER_FRAME + 1}帧")
+
+    buf, frame_count = _encode_dense_frames(array, width, height)
+
+    app.logger.info(f"实际生成帧数: {frame_count} (元信息帧: 1, 数据帧: {frame_count-1})")
+    if as_list:
+        return _dense_frames_to_list(buf)
+    return buf
+
+
+def _encode_sparse_frames(array, width, height, threshold=1, order=None):
+    """
+    按 uart_rx_image.v 的坐标寻址格式逐像素编码，跳过低于阈值的像素。
+    帧格式：AA XH XL YH YL PIX SUM 55，SUM = XH..PIX 五字节累加和的低8位
+    order: 可选的像素发送顺序（展平下标），由路径规划给出；缺省为行优先
+    返回：(buffer, frame_count) buffer 为一维 np.uint8 数组
+    """
+    pixels = (np.asarray(array, dtype=np.int64).ravel() & 0xFF).astype(np.uint8)
+    if order is None:
+        idx = np.flatnonzero(pixels >= threshold)
+    else:
+        idx = np.asarray(order, dtype=np.int64)
+    ys, xs = np.divmod(idx, width)
+
+    frames = np.empty((idx.size, DATA_FRAME_LEN), dtype=np.uint8)
+    frames[:, 0] = FRAME_HEADER
+    frames[:, 1] = (xs >> 8) & 0xFF
+    frames[:, 2] = xs & 0xFF
+    frames[:, 3] = (ys >> 8) & 0xFF
+    frames[:, 4] = ys & 0xFF
+    frames[:, 5] = pixels[idx]
+    frames[:, 6] = frames[:, 1:6].sum(axis=1, dtype=np.uint32) & 0xFF
+    frames[:, 7] = FRAME_TRAILER
+    return frames.ravel(), idx.size
+
+
+def _build_sparse_fpga_frames(array, width, height, threshold=1, as_list=True, order=None):
+    """
+    坐标寻址稀疏帧：每个像素一帧，低于 threshold 的像素（黑边/留白）不发送。
+    返回格式同 _build_fpga_frames_from_grayscale
+    """
+    buf, frame_count = _encode_sparse_frames(array, width, height, threshold, order)
+    app.logger.info(f"稀疏帧格式: {width}x{height}, 阈值={threshold}, "
+                    f"发送像素 {frame_count}, 跳过 {width * height - frame_count}")
+    if as_list:
+        return buf.reshape(-1, DATA_FRAME_LEN).tolist()
+    return buf
+
+
+def _find_row_runs(array, width, height, threshold=1):
+    """
+    逐行查找灰度相同的水平连续段（低于 threshold 的像素视为熄光，不成段）。
+    返回：(xs, ys, lengths, values) 均为一维数组，按行优先排列
+    """
+    pixels = (np.asarray(array, dtype=np.int64).ravel() & 0xFF).astype(np.int16).reshape(height, width)
+    pixels = np.where(pixels >= threshold, pixels, -1)
+    # 每行首像素、或与左邻值不同处为段起点
+    starts = np.ones((height, width), dtype=bool)
+    starts[:, 1:] = pixels[:, 1:] != pixels[:, :-1]
+    start_idx = np.flatnonzero(starts)
+    # 段终点：下一段起点，行末截断
+    ends = np.append(start_idx[1:], height * width)
+    ys, xs = np.divmod(start_idx, width)
+    lengths = np.minimum(ends, (ys + 1) * width) - start_idx
+    values = pixels.ravel()[start_idx]
+    keep = values >= 0
+    xs, ys, lengths, values = xs[keep], ys[keep], lengths[keep], values[keep]
+    # 超长段拆分（LEN 字段 16 位）
+    if lengths.size and lengths.max() > MAX_SEGMENT_LEN:
+        pieces = -(-lengths // MAX_SEGMENT_LEN)
+        rep_idx = np.repeat(np.arange(lengths.size), pieces)
+        k = np.arange(rep_idx.size) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        xs = xs[rep_idx] + k * MAX_SEGMENT_LEN
+        lengths = np.minimum(lengths[rep_idx] - k * MAX_SEGMENT_LEN, MAX_SEGMENT_LEN)
+        ys, values = ys[rep_idx], values[rep_idx]
+    return xs, ys, lengths, values.astype(np.uint8)
+
+
+def _order_row_runs(ys, serpentine=False):
+    """段发送顺序：行优先；serpentine 时奇数行倒序访问各段（段内仍沿 +X 扫描）"""
+    order = np.arange(ys.size)
+    if serpentine and ys.size:
+        odd = (ys & 1).astype(bool)
+        order = np.lexsort((np.where(odd, -order, order), ys))
+    return order
+
+
+def _encode_segment_frames(array, width, height, threshold=1, serpentine=False):
+    """
+    线段编码：同一行灰度相同的连续像素合并为一条线段帧，单像素仍用 8 字节坐标帧。
+    线段帧：AA 80|XH XL YH YL LH LL PIX SUM 55，SUM = 字节1..7 累加和的低8位
+    返回：(buffer, frame_lengths, runs)，runs 为按发送顺序排列的 (xs, ys, lengths, values)
+    """
+    xs, ys, lengths, values = _find_row_runs(array, width, height, threshold)
+    order = _order_row_runs(ys, serpentine)
+    xs, ys, lengths, values = xs[order], ys[order], lengths[order], values[order]
+
+    is_seg = lengths > 1
+    frame_lengths = np.where(is_seg, SEGMENT_FRAME_LEN, DATA_FRAME_LEN)
+    offsets = np.concatenate(([0], np.cumsum(frame_lengths)[:-1])).astype(np.int64)
+    buf = np.empty(int(frame_lengths.sum()), dtype=np.uint8)
+
+    # 单像素：与 _encode_sparse_frames 相同的 8 字节坐标帧
+    o = offsets[~is_seg]
+    px, py, pv = xs[~is_seg], ys[~is_seg], values[~is_seg]
+    cols = [np.full(o.size, FRAME_HEADER), (px >> 8) & 0xFF, px & 0xFF, (py >> 8) & 0xFF, py & 0xFF, pv]
+    cols.append(sum(c.astype(np.uint32) for c in cols[1:6]) & 0xFF)
+    cols.append(np.full(o.size, FRAME_TRAILER))
+    for k, col in enumerate(cols):
+        buf[o + k] = col
+
+    # 线段
+    o = offsets[is_seg]
+    sx, sy, sl, sv = xs[is_seg], ys[is_seg], lengths[is_seg], values[is_seg]
+    cols = [np.full(o.size, FRAME_HEADER), SEGMENT_FLAG | ((sx >> 8) & 0x7F), sx & 0xFF,
+            (sy >> 8) & 0xFF, sy & 0xFF, (sl >> 8) & 0xFF, sl & 0xFF, sv]
+    cols.append(sum(c.astype(np.uint32) for c in cols[1:8]) & 0xFF)
+    cols.append(np.full(o.size, FRAME_TRAILER))
+    for k, col in enumerate(cols):
+        buf[o + k] = col
+    return buf, frame_lengths, (xs, ys, lengths, values)
+
+
+def _segment_frames_to_list(buf, frame_lengths):
+    """按各帧长度切分连续缓冲区"""
+    if not buf.size:
+        return []
+    data = buf.tolist()
+    bounds = np.concatenate(([0], np.cumsum(frame_lengths))).tolist()
+    return [data[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def _iter_coordinate_frames(data):
+    """
+    逐字节复现 uart_rx_image.v 的帧解析状态机（等待 AA -> 收满 7/9 字节 -> 校验帧尾与 SUM）。
+    每收完一帧产出 (末字节下标, 命令)，命令为 (x, y, length, pixel)；校验失败的帧命令为 None。
+    data 可以是字节串，也可以是逐字节产出的迭代器（虚拟 FPGA 设备边收边解析）。
+    """
+    if isinstance(data, (list, tuple, np.ndarray)):
+        data = bytes(data)
+    buf, in_frame, last = [], False, 0
+    for i, byte in enumerate(data):
+        if not in_frame:
+            if byte == FRAME_HEADER:
+                buf, in_frame = [], True
+            continue
+        buf.append(byte)
+        if len(buf) == 1:
+            last = SEGMENT_FRAME_LEN - 1 if byte & SEGMENT_FLAG else DATA_FRAME_LEN - 1
+        if len(buf) < last:
+            continue
+        in_frame = False
+        command = None
+        if buf[0] & SEGMENT_FLAG:
+            if buf[8] == FRAME_TRAILER and buf[7] == sum(buf[:7]) & 0xFF:
+                x = ((buf[0] & 0x7F) << 8) | buf[1]
+                command = (x, (buf[2] << 8) | buf[3], (buf[4] << 8) | buf[5], buf[6])
+        elif buf[6] == FRAME_TRAILER and buf[5] == sum(buf[:5]) & 0xFF:
+            command = ((buf[0] << 8) | buf[1], (buf[2] << 8) | buf[3], 1, buf[4])
+        yield i, command
+
+
+def _decode_coordinate_frames(data):
+    """参考解码器：返回解析成功的命令列表 [(x, y, length, pixel)]，校验失败的帧与 RTL 一样被丢弃"""
+    return [command for _, command in _iter_coordinate_frames(data) if command is not None]
+
+
+def _render_frame_commands(commands, width, height):
+    """按 move_fsm.v 的语义回放命令：线段从 (x, y) 起沿 +X 连续 length 个像素（坐标取低 12 位）"""
+    canvas = np.zeros((height, width), dtype=np.uint8)
+    for x, y, length, pixel in commands:
+        x, y = x & 0xFFF, y & 0xFFF
+        if y < height:
+            canvas[y, x:min(x + max(length, 1), width)] = pixel
+    return canvas
+
+
+def _estimate_segment_job_time(runs, frame_lengths, baudrate=FPGA_UART_BAUDRATE, start=(0, 0)):
+    """
+    估算线段帧雕刻耗时：每条命令先移动到段起点，之后段内每像素 1 步 + 曝光。
+    每帧耗时 = max(帧线上传输时间, 该帧执行时间)，返回 (总移动步数, 机械耗时秒, 总耗时秒)
+    """
+    xs, ys, lengths, _ = runs
+    lengths = np.asarray(lengths, dtype=np.int64)
+    # 上一段的终点 -> 本段起点
+    end_x = np.concatenate(([start[0]], xs + lengths - 1))[:-1]
+    end_y = np.concatenate(([start[1]], ys))[:-1]
+    travel = np.maximum(np.abs(xs - end_x), np.abs(ys - end_y))
+    exec_ticks = (travel * STEPPER_SPEED_DIV + STEPPER_OVERHEAD_TICKS + MOVE_DWELL_TICKS
+                  + (lengths - 1) * (STEPPER_SPEED_DIV + STEPPER_OVERHEAD_TICKS + MOVE_DWELL_TICKS))
+    exec_time = exec_ticks / FPGA_CLK_HZ
+    wire_time = _estimate_wire_time(np.asarray(frame_lengths), baudrate)
+    steps = int(travel.sum() + (lengths - 1).sum())
+    return steps, float(exec_time.sum()), float(np.maximum(exec_time, wire_time).sum())
+
+
+def _estimate_wire_time(n_bytes, baudrate=FPGA_UART_BAUDRATE, bits_per_byte=10):
+    """估算 UART 线上传输时间（秒），默认 8N1 每字节 10 位"""
+    return n_bytes * bits_per_byte / float(baudrate)
+
+
+def _encoding_stats(encoding, n_bytes, frame_count, pixel_count, baudrate=FPGA_UART_BAUDRATE):
+    """对比稠密编码统计字节节省与预计线上耗时"""
+    dense_bytes = META_FRAME_LEN + -(-pixel_count // PIXELS_PER_FRAME) * DATA_FRAME_LEN
+    wire_time = _estimate_wire_time(n_bytes, baudrate)
+    dense_wire_time = _estimate_wire_time(dense_bytes, baudrate)
+    return {
+        "encoding": encoding,
+        "frame_count": frame_count,
+        "bytes": n_bytes,
+        "dense_bytes": dense_bytes,
+        "bytes_saved": dense_bytes - n_bytes,
+        "saved_ratio": round(1 - n_bytes / dense_bytes, 4) if dense_bytes else 0.0,
+        "baudrate": baudrate,
+        "wire_time_s": round(wire_time, 3),
+        "dense_wire_time_s": round(dense_wire_time, 3),
+    }
+
+
+# ====== 雕刻路径规划（仅对坐标寻址帧有意义）======
+FPGA_CLK_HZ = 50_000_000
+STEPPER_SPEED_DIV = 500        # stepper_ctrl.v SPEED_DIV：每步时钟数
+STEPPER_OVERHEAD_TICKS = 35    # stepper_ctrl.v ENABLE(11)+SETUP(1)+MOVE 判定+DISABLE(21)
+MOVE_DWELL_TICKS = 50000       # move_fsm.v DWELL_TICKS：每像素曝光时钟数
+PATH_STRATEGIES = ('row_major', 'serpentine', 'greedy', 'two_opt')
+GREEDY_MAX_POINTS = 20000      # 最近邻为 O(n^2)，超过该点数跳过
+TWO_OPT_MAX_POINTS = 1500      # 2-opt 仅用于稀疏图像
+FPGA_SIMULATED_ENCODINGS = ('sparse', 'segment')  # 流水线仿真覆盖的编码（坐标寻址帧）
+
+
+def _path_points(array, width, threshold):
+    """返回需要雕刻的像素展平下标（行优先）"""
+    pixels = np.asarray(array, dtype=np.int64).ravel() & 0xFF
+    return np.flatnonzero(pixels >= threshold)
+
+
+def _chebyshev_steps(xs, ys, start=(0, 0)):
+    """逐段移动步数：Bresenham 插补下每段步数为 max(|dx|, |dy|)"""
+    px = np.concatenate(([start[0]], xs))
+    py = np.concatenate(([start[1]], ys))
+    return np.maximum(np.abs(np.diff(px)), np.abs(np.diff(py)))
+
+
+def _plan_row_major(idx, width):
+    return idx
+
+
+def _plan_serpentine(idx, width):
+    """蛇形扫描：奇数行反向，消除每行末尾的长回程"""
+    ys, xs = np.divmod(idx, width)
+    key = ys * width + np.where(ys % 2 == 1, width - 1 - xs, xs)
+    return idx[np.argsort(key, kind='stable')]
+
+
+def _plan_greedy(idx, width, start=(0, 0)):
+    """最近邻贪心：每次移动到 Chebyshev 距离最近的未访问像素"""
+    ys, xs = np.divmod(idx, width)
+    n = idx.size
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=np.int64)
+    cx, cy = start
+    for k in range(n):
+        d = np.maximum(np.abs(xs - cx), np.abs(ys - cy))
+        d[visited] = np.iinfo(np.int64).max
+        j = int(np.argmin(d))
+        visited[j] = True
+        order[k] = j
+        cx, cy = xs[j], ys[j]
+    return idx[order]
+
+
+def _plan_two_opt(idx, width, start=(0, 0), max_passes=20, time_budget=5.0):
+    """在最近邻结果上做 2-opt 局部优化（开放路径，起点固定为当前位置）"""
+    path = _plan_greedy(idx, width, start)
+    ys, xs = np.divmod(path, width)
+    px = np.concatenate(([start[0]], xs))
+    py = np.concatenate(([start[1]], ys))
+    n = px.size
+    deadline = time.monotonic() + time_budget
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 2):
+            # 边 (i, i+1) 与 (j, j+1) 交换为 (i, j) 与 (i+1, j+1)；j 为末点时没有后继边
+            j = np.arange(i + 2, n)
+            d_ab = max(abs(px[i] - px[i + 1]), abs(py[i] - py[i + 1]))
+            d_ac = np.maximum(np.abs(px[i] - px[j]), np.abs(py[i] - py[j]))
+            jn = np.minimum(j + 1, n - 1)
+            has_next = j < n - 1
+            d_cd = np.where(has_next, np.maximum(np.abs(px[j] - px[jn]), np.abs(py[j] - py[jn])), 0)
+            d_bd = np.where(has_next, np.maximum(np.abs(px[i + 1] - px[jn]), np.abs(py[i + 1] - py[jn])), 0)
+            delta = d_ac + d_bd - d_ab - d_cd
+            k = int(np.argmin(delta))
+            if delta[k] < 0:
+                jj = int(j[k])
+                px[i + 1:jj + 1] = px[i + 1:jj + 1][::-1].copy()
+                py[i + 1:jj + 1] = py[i + 1:jj + 1][::-1].copy()
+                improved = True
+            if time.monotonic() > deadline:
+                break
+        if not improved or time.monotonic() > deadline:
+            break
+    return py[1:] * width + px[1:]
+
+
+def _estimate_job_time(order, width, baudrate=FPGA_UART_BAUDRATE, start=(0, 0)):
+    """
+    估算雕刻耗时：每帧耗时 = max(帧线上传输时间, 移动 + 曝光时间)。
+    假设上位机按帧节奏发送（不在 move_fsm busy 时丢帧）。
+    返回：(总移动步数, 机械耗时秒, 总耗时秒)
+    """
+    ys, xs = np.divmod(np.asarray(order, dtype=np.int64), width)
+    steps = _chebyshev_steps(xs, ys, start)
+    exec_ticks = steps * STEPPER_SPEED_DIV + STEPPER_OVERHEAD_TICKS + MOVE_DWELL_TICKS
+    frame_wire = _estimate_wire_time(DATA_FRAME_LEN, baudrate)
+    exec_time = exec_ticks / FPGA_CLK_HZ
+    per_frame = np.maximum(exec_time, frame_wire)
+    return int(steps.sum()), float(exec_time.sum()), float(per_frame.sum())
+
+
+def _plan_engrave_path(array, width, height, strategy='serpentine', threshold=1):
+    """按指定策略给出像素发送顺序（展平下标）"""
+    idx = _path_points(array, width, threshold)
+    if strategy == 'row_major':
+        return _plan_row_major(idx, width)
+    if strategy == 'serpentine':
+        return _plan_serpentine(idx, width)
+    if strategy == 'greedy':
+        if idx.size > GREEDY_MAX_POINTS:
+            raise ValueError(f"像素点过多({idx.size})，最近邻规划上限为 {GREEDY_MAX_POINTS}")
+        return _plan_greedy(idx, width)
+    if strategy == 'two_opt':
+        if idx.size > TWO_OPT_MAX_POINTS:
+            raise ValueError(f"像素点过多({idx.size})，2-opt 仅适用于不超过 {TWO_OPT_MAX_POINTS} 点的稀疏图像")
+        return _plan_two_opt(idx, width)
+    raise ValueError(f"不支持的路径策略: {strategy}")
+
+
+def _auto_path_strategies(n_points):
+    """
+    path_strategy='auto' 实际比较的策略：2-opt 以最近邻结果为起点且只会更短，不再单独跑 greedy；
+    超过 TWO_OPT_MAX_POINTS 点时只比较线性复杂度的 row_major / serpentine，避免发送请求卡在 O(n^2) 规划上
+    """
+    if n_points > TWO_OPT_MAX_POINTS:
+        return ('row_major', 'serpentine')
+    return ('row_major', 'serpentine', 'two_opt')
+
+
+def _compare_path_plans(array, width, height, strategies=PATH_STRATEGIES, threshold=1,
+                        baudrate=FPGA_UART_BAUDRATE):
+    """逐个策略规划并统计移动距离与预计耗时，返回 (plans, best_strategy)"""
+    plans = []
+    for strategy in strategies:
+        t0 = time.perf_counter()
+        try:
+            order = _plan_engrave_path(array, width, height, strategy, threshold)
+        except ValueError as e:
+            plans.append({"strategy": strategy, "skipped": True, "reason": str(e)})
+            continue
+        travel_steps, machine_time, job_time = _estimate_job_time(order, width, baudrate)
+        plans.append({
+            "strategy": strategy,
+            "skipped": False,
+            "points": int(order.size),
+            "travel_steps": travel_steps,
+            "machine_time_s": round(machine_time, 3),
+            "estimated_job_time_s": round(job_time, 3),
+            "plan_time_ms": round((time.perf_counter() - t0) * 1000, 1),
+        })
+    candidates = [p for p in plans if not p["skipped"]]
+    # 低波特率下线上传输往往是瓶颈，耗时相同时取移动距离更短者
+    best = min(candidates, key=lambda p: (p["estimated_job_time_s"], p["travel_steps"]))["strategy"] \
+        if candidates else None
+    return plans, best
+
+
+@app.route('/api/plan-path', methods=['POST'])
+@login_required
+def plan_path():
+    """对比各路径规划策略的移动距离与预计雕刻时间"""
+    try:
+        data, array, width, height, _ = _load_request_image()
+        threshold = int(data.get('threshold', 1))
+        baudrate = int(data.get('baudrate', FPGA_UART_BAUDRATE))
+        strategies = data.get('strategies') or list(PATH_STRATEGIES)
+        if isinstance(strategies, str):
+            strategies = strategies.split(',')
+        if len(array) == 0 or width <= 0 or height <= 0 or len(array) != width * height:
+            return jsonify({"success": False, "error": "无效的数据格式"}), 400
+        unknown = [s for s in strategies if s not in PATH_STRATEGIES]
+        if unknown:
+            return jsonify({"success": False, "error": f"不支持的路径策略: {unknown}"}), 400
+        plans, best = _compare_path_plans(array, width, height, strategies, threshold, baudrate)
+        app.logger.info(f"路径规划: {width}x{height}, 最优策略={best}")
+        return jsonify({"success": True, "plans": plans, "best": best})
+    except LookupError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except Exception as e:
+        app.logger.error(f"/api/plan-path 失败: {e}")
+        return jsonify({"success": False, "error": f"路径规划失败: {str(e)}"}), 500
+
+
+# ====== FPGA 接收/执行流水线时序仿真（周期级模型，常数经 RTL 仿真标定）======
+UART_RX_ACCEPT_TICKS = 9       # 末字节停止位采样后：字节输出 -> 帧校验 -> frame_valid -> move_fsm 锁存
+MOVE_CMD_OVERHEAD_TICKS = 18   # 每像素 move_fsm LATCH/MOVE/FIRE 切换 + stepper_ctrl ENABLE/SETUP（DISABLE 与曝光重叠）
+STEPPER_FIRST_STEP_TICKS = 1   # 有移动时 stepper_ctrl 首步前多 1 周期
+SIM_DROPPED_SAMPLE = 100       # 报告中最多列出的丢帧序号
+
+
+def _uart_accept_ticks(baudrate=FPGA_UART_BAUDRATE, clk_hz=FPGA_CLK_HZ):
+    """末字节起始位下降沿 -> move_fsm 锁存该帧的时钟数：半位对齐 + 8 数据位 + 停止位 + 固定流水延迟"""
+    baud_cnt_max = clk_hz // baudrate  # 与 uart_rx_image.v 的 BAUD_CNT_MAX 一致（整除）
+    return 9 * baud_cnt_max + baud_cnt_max // 2 + UART_RX_ACCEPT_TICKS
+
+
+def _pixel_exec_ticks(steps, dwell_ticks=MOVE_DWELL_TICKS, speed_div=STEPPER_SPEED_DIV):
+    """单个像素的执行时钟数：移动 steps 步（切比雪夫距离）+ 曝光 dwell_ticks"""
+    return (MOVE_CMD_OVERHEAD_TICKS + steps * speed_div + (STEPPER_FIRST_STEP_TICKS if steps else 0)
+            + dwell_ticks)
+
+
+def _command_exec_ticks(command, position, dwell_ticks=MOVE_DWELL_TICKS, speed_div=STEPPER_SPEED_DIV):
+    """
+    一条命令（坐标帧或线段帧）在 move_fsm 中的执行时序：先移动到起点，线段内每多一个像素再沿 +X 走 1 步并曝光。
+    返回 (busy 时钟数, 出光时钟数, 移动步数, 像素数, 执行后的位置)
+    """
+    x, y, length, _ = command
+    x, y, length = x & 0xFFF, y & 0xFFF, max(length, 1)
+    steps = max(abs(x - position[0]), abs(y - position[1]))
+    seg_pixel_ticks = _pixel_exec_ticks(1, dwell_ticks, speed_div)
+    busy = _pixel_exec_ticks(steps, dwell_ticks, speed_div) + (length - 1) * seg_pixel_ticks
+    # 线段内激光保持开启，段末像素曝光结束才关光
+    laser = dwell_ticks + 1 + (length - 1) * seg_pixel_ticks
+    return busy, laser, steps + length - 1, length, (x + length - 1, y)
+
+
+def _simulate_fpga_pipeline(frames, baudrate=FPGA_UART_BAUDRATE, guard_time=0.0,
+                            dwell_ticks=MOVE_DWELL_TICKS, speed_div=STEPPER_SPEED_DIV,
+                            clk_hz=FPGA_CLK_HZ, bits_per_byte=10, start=(0, 0)):
+    """
+    模拟 上位机串口发送 -> uart_rx_image 解析 -> move_fsm/stepper_ctrl 执行 的完整流水线（时钟周期精度）。
+    上位机连续发送，每字节 bits_per_byte 位，每帧后空闲 guard_time 秒（与串口传输任务的保护间隔一致）；
+    帧在末字节到达后固定延迟提交给 move_fsm，此时 busy 则该帧被丢弃（RTL 不缓存命令）。
+    返回时序报告：总耗时、丢帧/校验失败数、FSM 利用率、出光时间与不丢帧所需的最小保护间隔。
+    """
+    t_start = time.perf_counter()
+    lengths = [len(f) for f in frames]
+    data = bytes(itertools.chain.from_iterable(frames))
+    byte_ticks = bits_per_byte * clk_hz / float(baudrate)
+    guard_ticks = guard_time * clk_hz
+    frame_of_byte = np.repeat(np.arange(len(lengths)), lengths)
+    byte_start = (np.arange(len(data)) * byte_ticks + frame_of_byte * guard_ticks).tolist()
+    frame_of_byte = frame_of_byte.tolist()
+    accept_delay = _uart_accept_ticks(baudrate, clk_hz)
+
+    position = ideal_position = start
+    busy_until = float('-inf')
+    busy_ticks = laser_ticks = 0
+    travel_steps = pixels = accepted = rejected = dropped = 0
+    dropped_sample = []
+    required_guard = 0.0
+    prev_exec = None
+    for last, command in _iter_coordinate_frames(data):
+        if command is None:
+            rejected += 1
+            continue
+        # 理想情况（不丢帧）下相邻命令所需的保护间隔：上一命令执行时间 - 本帧线上时间
+        ideal_exec, _, _, _, ideal_position = _command_exec_ticks(command, ideal_position, dwell_ticks, speed_div)
+        if prev_exec is not None:
+            required_guard = max(required_guard, prev_exec - lengths[frame_of_byte[last]] * byte_ticks + 1)
+        prev_exec = ideal_exec
+
+        t = byte_start[last] + accept_delay
+        if t <= busy_until:
+            dropped += 1
+            if len(dropped_sample) < SIM_DROPPED_SAMPLE:
+                dropped_sample.append(frame_of_byte[last])
+            continue
+        exec_ticks, laser, steps, length, position = _command_exec_ticks(command, position, dwell_ticks, speed_div)
+        busy_until = t + exec_ticks
+        busy_ticks += exec_ticks
+        laser_ticks += laser
+        travel_steps += steps
+        pixels += length
+        accepted += 1
+
+    wire_end = (byte_start[-1] + byte_ticks) if data else 0.0
+    total_ticks = max(wire_end, busy_until)
+    return {
+        "modelled": True,
+        "frames_sent": len(lengths),
+        "bytes": len(data),
+        "accepted_frames": accepted,
+        "dropped_frames": dropped,
+        "checksum_errors": rejected,
+        "dropped_frame_indices": dropped_sample,
+        "pixels_burned": pixels,
+        "travel_steps": travel_steps,
+        "baudrate": baudrate,
+        "guard_time_s": guard_time,
+        "dwell_ticks": dwell_ticks,
+        "wire_time_s": round(wire_end / clk_hz, 6),
+        "job_time_s": round(total_ticks / clk_hz, 6),
+        "busy_time_s": round(busy_ticks / clk_hz, 6),
+        "laser_on_time_s": round(laser_ticks / clk_hz, 6),
+        "utilisation": round(busy_ticks / total_ticks, 4) if total_ticks > 0 else 0.0,
+        "required_guard_time_s": round(max(required_guard, 0.0) / clk_hz, 6),
+        "clk_hz": clk_hz,
+        "job_ticks": int(round(total_ticks)),
+        "busy_ticks": int(busy_ticks),
+        "laser_on_ticks": int(laser_ticks),
+        "sim_time_ms": round((time.perf_counter() - t_start) * 1000, 1),
+    }
+
+
+def _fpga_simulation_not_modelled(encoding):
+    """dense 帧走 uart_rx_image 的整图缓冲协议，move_fsm 模型不覆盖，如实标注而不是按校验失败计"""
+    return {"modelled": False, "encoding": encoding,
+            "note": f"{encoding} 编码不在 uart_rx_image/move_fsm 仿真模型范围内"}
+
+
+def _fpga_simulation_summary(report):
+    if not report.get("modelled", True):
+        return f"仿真: {report['note']}"
+    return (f"仿真: 接收 {report['accepted_frames']} 帧, 丢弃 {report['dropped_frames']} 帧 (busy), "
+            f"校验失败 {report['checksum_errors']} 帧, 预计耗时 {report['job_time_s']:.2f}s, "
+            f"利用率 {report['utilisation']:.0%}")
+
+
+@app.route('/api/fpga-simulate', methods=['POST'])
+@login_required
+def fpga_simulate():
+    """离线对比不同编码与保护间隔下的 FPGA 流水线耗时与丢帧情况"""
+    try:
+        data, array, width, height, image_id = _load_request_image()
+        path_strategy = data.get('path_strategy', '')
+        threshold = int(data.get('threshold', 1))
+        baudrate = int(data.get('baudrate', FPGA_UART_BAUDRATE))
+        dwell_ticks = int(data.get('dwell_ticks', MOVE_DWELL_TICKS))
+        dither = _parse_dither_option(data)
+        encodings = data.get('encodings') or [data.get('encoding', 'sparse')]
+        guard_times = data.get('guard_times')
+        if guard_times is None:
+            guard_times = [data.get('guard_time', 0)]
+        if isinstance(encodings, str):
+            encodings = encodings.split(',')
+        if len(array) == 0 or width <= 0 or height <= 0 or len(array) != width * height:
+            return jsonify({"success": False, "error": "无效的数据格式"}), 400
+        unknown = [e for e in encodings if e not in ('dense', 'sparse', 'segment')]
+        if unknown:
+            return jsonify({"success": False, "error": f"不支持的编码方式: {unknown}"}), 400
+        if baudrate <= 0 or dwell_ticks < 0:
+            return jsonify({"success": False, "error": "baudrate 必须为正数且 dwell_ticks 不能为负"}), 400
+        if image_id is None:
+            image_id = _store_image_array(array, width, height)
+        if dither != 'none':
+            array, image_id = _dither_stored_image(image_id, array, width, height, dither)
+
+        results = []
+        for encoding in encodings:
+            frames, _, frames_id = _encode_fpga_frames(
+                image_id, array, width, height, encoding, path_strategy, threshold, baudrate)
+            if encoding not in FPGA_SIMULATED_ENCODINGS:
+                report = _fpga_simulation_not_modelled(encoding)
+                report["frames_id"] = frames_id
+                results.append(report)
+                continue
+            for guard_time in guard_times:
+                report = _simulate_fpga_pipeline(frames, baudrate, float(guard_time), dwell_ticks)
+                report.update({"encoding": encoding, "frames_id": frames_id})
+                results.append(report)
+        modelled = [r for r in results if r.get("modelled", True)]
+        best = None
+        if modelled:
+            best = min(modelled, key=lambda r: (r["dropped_frames"] + r["checksum_errors"] > 0, r["job_time_s"]))
+            app.logger.info(f"流水线仿真: {width}x{height}, {len(modelled)} 组配置, "
+                            f"最优 {best['encoding']} / guard={best['guard_time_s']}s -> {best['job_time_s']:.2f}s")
+            best = {"encoding": best["encoding"], "guard_time_s": best["guard_time_s"]}
+        return jsonify({"success": True, "image_id": image_id, "results": results, "best": best})
+    except LookupError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"/api/fpga-simulate 失败: {e}")
+        return jsonify({"success": False, "error": f"流水线仿真失败: {str(e)}"}), 500
 
 
 @app.route('/api/serial-ports', methods=['GET'])
@@ -571,6 +2633,17 @@ def get_serial_ports():
                 "product": port.product,
                 "serial_number": port.serial_number
             })
+        device = virtual_fpga
+        if device is not None:
+            # pty 不在系统串口枚举结果中，单独列出
+            ports.append({
+                "device": device.port,
+                "description": "虚拟 FPGA（pty）",
+                "hwid": "virtual",
+                "manufacturer": None,
+                "product": None,
+                "serial_number": None
+            })
         
         app.logger.info(f"检测到 {len(ports)} 个串口设备")
         for port in ports:
@@ -590,9 +2663,7 @@ def get_serial_ports():
 @app.route('/api/serial-connect', methods=['POST'])
 @login_required
 def connect_serial():
-    """连接串口"""
-    global serial_connection
-    
+    """连接串口（加入设备注册表；只会重新打开同一端口，不影响已连接的其他设备）"""
     try:
         data = request.get_json()
         port = data.get('port', 'COM3')
@@ -611,28 +2682,14 @@ def connect_serial():
         else:
             parity = serial.PARITY_NONE
         
-        # 关闭现有连接
-        if serial_connection and serial_connection.is_open:
-            serial_connection.close()
-        
-        # 建立新连接
-        serial_connection = serial.Serial(
-            port=port,
-            baudrate=baudrate,
-            bytesize=data_bits,
-            parity=parity,
-            stopbits=stop_bits,
-            timeout=1,
-            write_timeout=1
-        )
-        
-        app.logger.info(f"串口连接成功: {port} @ {baudrate} bps")
+        device = _connect_serial_device(port, baudrate, data_bits, parity, stop_bits)
         
         return jsonify({
             "success": True,
             "message": f"串口连接成功: {port} @ {baudrate} bps",
             "port": port,
-            "baudrate": baudrate
+            "baudrate": baudrate,
+            "device": device.to_dict()
         })
         
     except Exception as e:
@@ -645,16 +2702,15 @@ def connect_serial():
 @app.route('/api/serial-disconnect', methods=['POST'])
 @login_required
 def disconnect_serial():
-    """断开串口连接"""
-    global serial_connection
-    
+    """断开串口连接（请求体 port 指定设备，缺省为最近连接的设备）"""
     try:
-        if serial_connection and serial_connection.is_open:
-            serial_connection.close()
-            app.logger.info("串口连接已断开")
+        data = request.get_json(silent=True) or {}
+        device = _resolve_serial_device(data.get('port') or request.args.get('port'))
+        if device is not None and device.connected:
+            _disconnect_serial_device(device)
             return jsonify({
                 "success": True,
-                "message": "串口连接已断开"
+                "message": f"串口连接已断开: {device.port}"
             })
         else:
             return jsonify({
@@ -671,59 +2727,1024 @@ def disconnect_serial():
 @app.route('/api/serial-status', methods=['GET'])
 @login_required
 def get_serial_status():
-    """获取串口状态"""
-    global serial_connection
+    """获取串口状态（?port= 指定设备，缺省为最近连接的设备），并附带全部设备列表"""
+    device = _resolve_serial_device(request.args.get('port'))
+    devices = [d.to_dict() for d in _list_serial_devices()]
     
-    if serial_connection and serial_connection.is_open:
+    if device is not None and device.connected:
         return jsonify({
             "success": True,
             "connected": True,
-            "port": serial_connection.port,
-            "baudrate": serial_connection.baudrate,
-            "message": "串口已连接"
+            "port": device.port,
+            "baudrate": device.conn.baudrate,
+            "message": "串口已连接",
+            "devices": devices
         })
     else:
         return jsonify({
             "success": True,
             "connected": False,
-            "message": "串口未连接"
+            "message": "串口未连接",
+            "devices": devices
         })
 
+# ====== 虚拟 FPGA 设备（pty 伪终端，无硬件的端到端串口测试）======
+VIRTUAL_FPGA_RECORD_CAPACITY = int(os.getenv("VIRTUAL_FPGA_RECORD_CAPACITY", "100000"))
+VIRTUAL_FPGA_READ_SIZE = 4096
+VIRTUAL_FPGA_RECENT_LIMIT = 20  # 状态接口返回的最近帧记录数
+
+
+class VirtualFPGADevice:
+    """
+    基于 pty 的虚拟 FPGA：应用像打开普通串口一样打开 self.port（pty 从设备端），
+    后台线程从主设备端读取字节，按 uart_rx_image.v 的状态机逐字节解析帧。
+    pty 本身没有波特率，一次 write 的数据会瞬间到达；line_rate=True 时按应用在该端口上设置的
+    波特率/数据位/校验/停止位把到达的字节重新排成串行时序，帧到达时刻与真实 UART 一致。
+    processing_delay 模拟接收端处理耗时：None 不模拟；数值为每条命令固定秒数；
+    'fpga' 按 move_fsm / stepper_ctrl 时序模型计算每条命令的执行时间。
+    处理期间收齐的帧与 RTL 一样直接丢弃，记为 rejected；校验失败的帧记为 checksum_failed。
+    """
+
+    def __init__(self, processing_delay=None, dwell_ticks=MOVE_DWELL_TICKS, line_rate=True):
+        if not hasattr(os, 'openpty'):
+            raise RuntimeError("虚拟 FPGA 设备需要 pty 支持（仅限 Linux / macOS）")
+        import tty
+        self.processing_delay = processing_delay
+        self.dwell_ticks = dwell_ticks
+        self.line_rate = line_rate
+        self._line_time = 0.0  # 最近一个字节（按串行时序）收完的时刻
+        self._master, self._slave = os.openpty()
+        # 从设备端保持打开：应用断开串口后主设备端不会读到 EIO
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # 逐帧记录：(收齐时刻 time.time(), 帧序号, 状态, 命令)
+        self.records = collections.deque(maxlen=VIRTUAL_FPGA_RECORD_CAPACITY)
+        self._reset_counters()
+        self._thread = threading.Thread(target=self._run, name='virtual-fpga', daemon=True)
+        self._thread.start()
+
+    def _reset_counters(self):
+        self.bytes_received = 0
+        self.frames_total = 0
+        self.frames_received = 0
+        self.frames_rejected = 0
+        self.checksum_errors = 0
+        self.first_frame_at = None
+        self.last_frame_at = None
+
+    def reset(self):
+        """清空计数与帧记录，帧序号从 0 重新开始"""
+        with self._lock:
+            self.records.clear()
+            self._reset_counters()
+
+    def _char_time(self):
+        """按从设备端当前的 termios 设置（即应用打开串口时的参数）计算单字符线上时间（秒）"""
+        import termios
+        _, _, cflag, _, _, ospeed, _ = termios.tcgetattr(self._slave)
+        baudrate = _TERMIOS_BAUDRATES.get(ospeed, 0)
+        if not baudrate:
+            return 0.0
+        data_bits = {termios.CS5: 5, termios.CS6: 6, termios.CS7: 7}.get(cflag & termios.CSIZE, 8)
+        bits = 1 + data_bits + (1 if cflag & termios.PARENB else 0) + (2 if cflag & termios.CSTOPB else 1)
+        return bits / baudrate
+
+    def _byte_stream(self):
+        """逐字节产出收到的数据，同时把 self._line_time 推进到该字节收完的时刻"""
+        while not self._stop_event.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                chunk = os.read(self._master, VIRTUAL_FPGA_READ_SIZE)
+            except OSError:
+                return
+            now = time.time()
+            with self._lock:
+                self.bytes_received += len(chunk)
+            char_time = self._char_time() if self.line_rate else 0.0
+            if not char_time:
+                self._line_time = now
+                yield from chunk
+                continue
+            # 与真实 UART 一样，写入的数据从写入时刻（或上一字节发完后）起逐字节串行发出
+            start = max(now, self._line_time)
+            for k, byte in enumerate(chunk, 1):
+                self._line_time = start + k * char_time
+                yield byte
+
+    def _command_delay(self, command, position):
+        """返回 (处理耗时秒, 执行后的位置)"""
+        if self.processing_delay == 'fpga':
+            busy, _, _, _, position = _command_exec_ticks(command, position, self.dwell_ticks)
+            return busy / FPGA_CLK_HZ, position
+        return float(self.processing_delay or 0.0), position
+
+    def _run(self):
+        busy_until, position = 0.0, (0, 0)
+        for _, command in _iter_coordinate_frames(self._byte_stream()):
+            now = self._line_time
+            if command is None:
+                status = 'checksum_failed'
+            elif now < busy_until:
+                status = 'rejected'
+            else:
+                status = 'received'
+                delay, position = self._command_delay(command, position)
+                busy_until = now + delay
+            with self._lock:
+                self.records.append((now, self.frames_total, status, command))
+                self.frames_total += 1
+                if status == 'received':
+                    self.frames_received += 1
+                elif status == 'rejected':
+                    self.frames_rejected += 1
+                else:
+                    self.checksum_errors += 1
+                if self.first_frame_at is None:
+                    self.first_frame_at = now
+                self.last_frame_at = now
+
+    def stats(self):
+        with self._lock:
+            elapsed = (self.last_frame_at - self.first_frame_at) if self.frames_total > 1 else 0.0
+            recent = list(itertools.islice(reversed(self.records), VIRTUAL_FPGA_RECENT_LIMIT))
+            return {
+                "port": self.port,
+                "running": self._thread.is_alive(),
+                "processing_delay": self.processing_delay,
+                "dwell_ticks": self.dwell_ticks,
+                "line_rate": self.line_rate,
+                "bytes_received": self.bytes_received,
+                "frames_total": self.frames_total,
+                "frames_received": self.frames_received,
+                "frames_rejected": self.frames_rejected,
+                "checksum_errors": self.checksum_errors,
+                "first_frame_at": self.first_frame_at,
+                "last_frame_at": self.last_frame_at,
+                "frames_per_s": round((self.frames_total - 1) / elapsed, 1) if elapsed > 0 else 0.0,
+                "recent_frames": [{"index": i, "timestamp": ts, "status": status, "command": command}
+                                  for ts, i, status, command in reversed(recent)],
+            }
+
+    def close(self):
+        self._stop_event.set()
+        self._thread.join(timeout=1)
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def _termios_baudrates():
+    """termios 速率常量 -> 波特率（B115200 -> 115200）"""
+    try:
+        import termios
+    except ImportError:
+        return {}
+    return {getattr(termios, name): int(name[1:]) for name in dir(termios)
+            if name[:1] == 'B' and name[1:].isdigit()}
+
+
+_TERMIOS_BAUDRATES = _termios_baudrates()
+virtual_fpga = None
+_virtual_fpga_lock = threading.Lock()
+
+
+def _parse_processing_delay(value):
+    """processing_delay: null / 秒数 / 'fpga'"""
+    if value in (None, '', 'none'):
+        return None
+    if value == 'fpga':
+        return 'fpga'
+    delay = float(value)
+    if delay < 0:
+        raise ValueError("processing_delay 不能为负")
+    return delay
+
+
+def _start_virtual_fpga(processing_delay=None, dwell_ticks=MOVE_DWELL_TICKS, line_rate=True):
+    """启动（或重启）全局虚拟 FPGA 设备，返回设备对象"""
+    global virtual_fpga
+    with _virtual_fpga_lock:
+        if virtual_fpga is not None:
+            virtual_fpga.close()
+        virtual_fpga = VirtualFPGADevice(processing_delay, dwell_ticks, line_rate)
+    app.logger.info(f"虚拟 FPGA 已启动: {virtual_fpga.port}, 处理延迟={processing_delay}")
+    return virtual_fpga
+
+
+def _stop_virtual_fpga():
+    """停止虚拟 FPGA；若应用正连接着它，一并断开串口"""
+    global virtual_fpga
+    with _virtual_fpga_lock:
+        device, virtual_fpga = virtual_fpga, None
+    if device is None:
+        return None
+    connected = _get_serial_device(device.port)
+    if connected is not None and connected.connected:
+        _disconnect_serial_device(connected)
+    device.close()
+    app.logger.info(f"虚拟 FPGA 已停止: {device.port}")
+    return device
+
+
+@app.route('/api/virtual-fpga', methods=['GET'])
+@login_required
+def virtual_fpga_status():
+    """虚拟 FPGA 设备状态与收帧统计"""
+    device = virtual_fpga
+    if device is None:
+        return jsonify({"success": True, "running": False})
+    return jsonify({"success": True, "running": True, "device": device.stats()})
+
+
+@app.route('/api/virtual-fpga', methods=['POST'])
+@login_required
+def virtual_fpga_start():
+    """启动虚拟 FPGA 设备（已在运行则重启），返回可供 /api/serial-connect 打开的端口"""
+    try:
+        data = request.get_json(silent=True) or {}
+        processing_delay = _parse_processing_delay(data.get('processing_delay'))
+        dwell_ticks = int(data.get('dwell_ticks', MOVE_DWELL_TICKS))
+        line_rate = _as_bool(data.get('line_rate'))
+        device = _start_virtual_fpga(processing_delay, dwell_ticks, line_rate)
+        return jsonify({"success": True, "port": device.port, "device": device.stats()})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"启动虚拟 FPGA 失败: {e}")
+        return jsonify({"success": False, "error": f"启动虚拟 FPGA 失败: {str(e)}"}), 500
+
+
+@app.route('/api/virtual-fpga/reset', methods=['POST'])
+@login_required
+def virtual_fpga_reset():
+    """清空虚拟 FPGA 的收帧统计"""
+    device = virtual_fpga
+    if device is None:
+        return jsonify({"success": False, "error": "虚拟 FPGA 未启动"}), 404
+    device.reset()
+    return jsonify({"success": True, "device": device.stats()})
+
+
+@app.route('/api/virtual-fpga', methods=['DELETE'])
+@login_required
+def virtual_fpga_stop():
+    """停止虚拟 FPGA 设备"""
+    device = _stop_virtual_fpga()
+    if device is None:
+        return jsonify({"success": False, "error": "虚拟 FPGA 未启动"}), 404
+    return jsonify({"success": True, "device": device.stats()})
+
+
+# ====== 实时事件推送（SSE）======
+SSE_HEARTBEAT_SECONDS = 15
+SSE_SUBSCRIBER_QUEUE_SIZE = 256
+PROGRESS_EVENT_INTERVAL = 0.2  # 传输进度事件的最小推送间隔（秒）
+
+
+class EventBroker:
+    """进程内事件总线：每个 SSE 连接一个有界队列，队列满时丢弃该订阅者的旧事件"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=SSE_SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event_type, data):
+        with self._lock:
+            if not self._subscribers:
+                return
+            self._seq += 1
+            message = _sse_message(event_type, data, self._seq)
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # 慢客户端：丢弃最旧的一条再放入，保证最新状态可达
+                try:
+                    q.get_nowait()
+                    q.put_nowait(message)
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+event_broker = EventBroker()
+
+
+@app.route('/api/events', methods=['GET'])
+@login_required
+def event_stream():
+    """SSE 推送：传输任务状态/进度、吞吐量、错误及串口连接事件"""
+    q = event_broker.subscribe()
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    yield q.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+        finally:
+            event_broker.unsubscribe(q)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ====== 串口传输日志（定长环形缓冲）======
+TRANSMISSION_LOG_CAPACITY = int(os.getenv("TRANSMISSION_LOG_CAPACITY", "5000"))
+TRANSMISSION_LOG_FETCH_LIMIT = 2000
+
+
+class TransmissionLog:
+    """
+    定长环形缓冲区保存传输日志，每条记录为紧凑元组，带单调递增序号。
+    十六进制等格式化只在查询时针对返回的记录进行，轮询开销与任务长度无关。
+    """
+    # 记录字段：(seq, 时间戳, 帧序号, 帧字节, 写入字节数, 是否成功, 错误信息)
+
+    def __init__(self, capacity=TRANSMISSION_LOG_CAPACITY):
+        self._entries = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.encoding = None  # 当前任务帧集的编码，决定日志中的帧类型
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.total = 0
+        self.success = 0
+        self.failed = 0
+        self.errors = 0
+        self.bytes_written = 0
+
+    def append(self, frame_number, frame, bytes_written, ok, error=''):
+        with self._lock:
+            self._seq += 1
+            self._entries.append((self._seq, time.time(), frame_number, frame, bytes_written, ok, error))
+            self.total += 1
+            self.bytes_written += bytes_written
+            if error:
+                self.errors += 1
+            elif ok:
+                self.success += 1
+            else:
+                self.failed += 1
+
+    def clear(self, encoding=None):
+        """清空记录和计数（新任务开始时）；序号继续递增，客户端的 since 游标仍然有效"""
+        with self._lock:
+            self._entries.clear()
+            self._reset_counters()
+            self.encoding = encoding
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def counters(self):
+        return {
+            "total": self.total,
+            "success": self.success,
+            "failed": self.failed,
+            "errors": self.errors,
+            "bytes_written": self.bytes_written,
+        }
+
+    def since(self, seq=0, limit=TRANSMISSION_LOG_FETCH_LIMIT):
+        """返回 (序号大于 seq 的记录[最多 limit 条], 被环形缓冲覆盖而丢失的条数)"""
+        with self._lock:
+            if not self._entries:
+                return [], 0
+            first_seq = self._entries[0][0]
+            start = max(seq + 1 - first_seq, 0)
+            dropped = max(first_seq - seq - 1, 0) if seq else 0
+            records = list(itertools.islice(self._entries, start, start + limit))
+            encoding = self.encoding
+        return [self._format(r, encoding) for r in records], dropped
+
+    @staticmethod
+    def _format(record, encoding=None):
+        seq, ts, frame_number, frame, bytes_written, ok, error = record
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)) + f".{int(ts * 1000) % 1000:03d}"
+        if error:
+            return {
+                "seq": seq,
+                "timestamp": timestamp,
+                "frame_number": frame_number,
+                "frame_type": "错误",
+                "frame_hex": "传输失败",
+                "bytes_written": 0,
+                "status": f"错误: {error}"
+            }
+        return {
+            "seq": seq,
+            "timestamp": timestamp,
+            "frame_number": frame_number,
+            "frame_type": _frame_kind(frame, encoding),
+            "frame_hex": frame.hex(' ').upper(),
+            "bytes_written": bytes_written,
+            "status": "成功" if ok else "失败"
+        }
+
+
+# ====== 串口设备注册表（多台雕刻机并行）======
+class SerialDevice:
+    """
+    一台激光雕刻机（一个串口）：独立的连接参数、传输任务队列、工作线程与传输日志。
+    断开后仍保留在注册表中，传输日志与历史任务可继续查询；再次连接同一端口时复用。
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+        self.queue = queue.Queue()
+        self.log = TransmissionLog()
+        self.current_job = None
+        self.connected_at = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self):
+        conn = self.conn
+        return conn is not None and conn.is_open
+
+    @property
+    def idle(self):
+        return self.connected and self.current_job is None and self.queue.empty()
+
+    @property
+    def line_rate(self):
+        return _serial_line_rate(self.conn) if self.connected else 0.0
+
+    def open(self, baudrate, data_bits, parity, stop_bits):
+        """以新参数（重新）打开串口；同一端口已连接时先关闭"""
+        with self._lock:
+            if self.connected:
+                self.conn.close()
+            self.conn = serial.Serial(
+                port=self.port,
+                baudrate=baudrate,
+                bytesize=data_bits,
+                parity=parity,
+                stopbits=stop_bits,
+                timeout=1,
+                write_timeout=1
+            )
+            self.connected_at = time.time()
+
+    def close(self):
+        with self._lock:
+            if self.connected:
+                self.conn.close()
+
+    def ensure_worker(self):
+        """按需启动本设备的传输工作线程（每台设备一个）"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=_serial_worker_loop, args=(self,),
+                                                name=f'serial-tx-{self.port}', daemon=True)
+                self._worker.start()
+
+    def backlog_seconds(self):
+        """排队与正在执行的任务按线速率估算的剩余线路时间（秒）"""
+        rate = self.line_rate
+        if not rate:
+            return 0.0
+        with self.queue.mutex:
+            pending = list(self.queue.queue)
+        job = self.current_job
+        if job is not None:
+            pending.append(job)
+        return sum(max(j.estimated_bytes(rate) - j.bytes_sent, 0) for j in pending
+                   if j.status in ('queued', 'running', 'paused')) / rate
+
+    def to_dict(self):
+        conn = self.conn if self.connected else None
+        job = self.current_job
+        return {
+            "port": self.port,
+            "connected": conn is not None,
+            "baudrate": conn.baudrate if conn else None,
+            "data_bits": int(conn.bytesize) if conn else None,
+            "parity": conn.parity if conn else None,
+            "stop_bits": float(conn.stopbits) if conn else None,
+            "line_rate_bytes_per_s": round(self.line_rate, 1),
+            "idle": self.idle,
+            "current_job": job.job_id if job is not None else None,
+            "queue_depth": self.queue.qsize(),
+            "backlog_seconds": round(self.backlog_seconds(), 3),
+            "log_entries": len(self.log),
+            "connected_at": self.connected_at,
+        }
+
+
+serial_devices = {}  # 端口 -> SerialDevice
+_devices_lock = threading.Lock()
+default_serial_port = None  # 未指定 port 的请求作用于最近连接的设备，兼容单设备时代的接口
+
+
+def _get_serial_device(port, create=False):
+    with _devices_lock:
+        device = serial_devices.get(port)
+        if device is None and create:
+            device = serial_devices[port] = SerialDevice(port)
+        return device
+
+
+def _resolve_serial_device(port=None):
+    """按端口取设备；port 为空时取最近连接的设备"""
+    return _get_serial_device(port or default_serial_port)
+
+
+def _list_serial_devices():
+    with _devices_lock:
+        return list(serial_devices.values())
+
+
+def _connect_serial_device(port, baudrate=115200, data_bits=8, parity=serial.PARITY_NONE, stop_bits=1):
+    """打开（或以新参数重新打开）指定端口并设为默认设备，其他设备的连接不受影响"""
+    global default_serial_port
+    device = _get_serial_device(port, create=True)
+    try:
+        device.open(baudrate, data_bits, parity, stop_bits)
+    except Exception:
+        if device.connected_at is None:
+            # 从未连上的端口不留在注册表里
+            with _devices_lock:
+                serial_devices.pop(port, None)
+        raise
+    default_serial_port = port
+    app.logger.info(f"串口连接成功: {port} @ {baudrate} bps，已连接设备 "
+                    f"{sum(d.connected for d in _list_serial_devices())} 台")
+    event_broker.publish('serial', {"event": "connected", "port": port, "baudrate": baudrate})
+    return device
+
+
+def _disconnect_serial_device(device):
+    device.close()
+    app.logger.info(f"串口连接已断开: {device.port}")
+    event_broker.publish('serial', {"event": "disconnected", "port": device.port})
+
+
+# ====== 串口传输后台任务 ======
+class TransmissionJob:
+    """一次串口传输任务：由目标设备的后台工作线程从该设备队列取出后顺序执行"""
+
+    def __init__(self, frames, guard_time=0.0, port=None, encoding=None):
+        self.job_id = secrets.token_hex(8)
+        self.frames = frames
+        self.encoding = encoding  # dense / sparse / segment；直接上传的帧未指定时为 None
+        self.guard_time = guard_time
+        self.port = port
+        self.batch_id = None
+        self.status = 'queued'  # queued / running / paused / completed / cancelled / failed
+        self.sent_frames = 0
+        self.error_count = 0
+        self.bytes_sent = 0
+        self.line_rate = 0.0
+        self.error = ''
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.cancel_event = threading.Event()
+        self._status_lock = threading.Lock()
+        self._last_progress_ts = 0.0
+        self._last_progress_frames = 0
+        self._frame_bytes = None
+
+    def estimated_bytes(self, line_rate):
+        """整个任务占用的线路字节数：帧字节 + 保护间隔折算的等效字节"""
+        if self._frame_bytes is None:
+            self._frame_bytes = sum(len(frame) for frame in self.frames)
+        return _line_bytes(self._frame_bytes, len(self.frames), self.guard_time, line_rate)
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'cancelled', 'failed')
+
+    def set_status(self, status, error=''):
+        """更新任务状态并推送 job_status 事件；已结束的任务不再改变状态，返回 False"""
+        with self._status_lock:
+            if self.finished:
+                return False
+            self.status = status
+            if error:
+                self.error = error
+            if self.finished:
+                self.finished_at = time.time()
+                SERIAL_JOBS_TOTAL.inc(1, status)
+        event_broker.publish('job_status', self.to_dict())
+        return True
+
+    def publish_progress(self, force=False):
+        """推送进度增量（限频），包含本次新增帧数与实时吞吐"""
+        now = time.time()
+        if not force and now - self._last_progress_ts < PROGRESS_EVENT_INTERVAL:
+            return
+        processed = self.sent_frames + self.error_count
+        data = self.to_dict()
+        data["delta_frames"] = processed - self._last_progress_frames
+        self._last_progress_ts = now
+        self._last_progress_frames = processed
+        event_broker.publish('job_progress', data)
+
+    def to_dict(self):
+        processed = self.sent_frames + self.error_count
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        if self.line_rate:
+            # write() 返回时字节可能还在驱动缓冲区里（令牌桶开头的突发、尚未发出的尾部），
+            # 线路上至少要 bytes_sent / line_rate 秒才能发完，吞吐不会超过线速率
+            elapsed = max(elapsed, self.bytes_sent / self.line_rate)
+        achieved = self.bytes_sent / elapsed if elapsed > 0 else 0.0
+        return {
+            "job_id": self.job_id,
+            "port": self.port,
+            "batch_id": self.batch_id,
+            "encoding": self.encoding,
+            "status": self.status,
+            "total_frames": len(self.frames),
+            "sent_frames": self.sent_frames,
+            "error_count": self.error_count,
+            "progress": round(processed / len(self.frames), 4) if self.frames else 0.0,
+            "guard_time": self.guard_time,
+            "bytes_sent": self.bytes_sent,
+            "achieved_bytes_per_s": round(achieved, 1),
+            "line_rate_bytes_per_s": round(self.line_rate, 1),
+            "line_utilization": round(achieved / self.line_rate, 4) if self.line_rate else 0.0,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+MAX_FINISHED_JOBS = 50
+transmission_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _submit_transmission_job(device, frames, guard_time=0.0, batch_id=None, encoding=None):
+    """创建任务并放入目标设备的队列，立即返回任务对象"""
+    job = TransmissionJob(frames, guard_time, device.port, encoding)
+    job.batch_id = batch_id
+    with _jobs_lock:
+        transmission_jobs[job.job_id] = job
+        # 只保留最近 MAX_FINISHED_JOBS 个已结束任务
+        finished = sorted((j for j in transmission_jobs.values()
+                           if j.status in ('completed', 'cancelled', 'failed')), key=lambda j: j.created_at)
+        for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            transmission_jobs.pop(old.job_id, None)
+    device.queue.put(job)
+    event_broker.publish('job_status', job.to_dict())
+    device.ensure_worker()
+    app.logger.info(f"串口传输任务已入队: {job.job_id} -> {device.port}, {len(frames)} 帧, "
+                    f"队列深度 {device.queue.qsize()}")
+    return job
+
+
+def _serial_worker_loop(device):
+    """设备工作线程：依次执行该设备队列中的传输任务，各设备之间互不阻塞"""
+    while True:
+        job = device.queue.get()
+        device.current_job = job
+        try:
+            if job.finished:
+                continue  # 排队时已被取消，取消接口已更新过状态
+            if job.cancel_event.is_set():
+                job.set_status('cancelled')
+                continue
+            _run_transmission_job(job, device)
+        except Exception as e:
+            job.set_status('failed', str(e))
+            event_broker.publish('transmit_error', {"job_id": job.job_id, "port": device.port, "error": str(e)})
+            app.logger.error(f"串口传输任务 {job.job_id} ({device.port}) 异常: {e}")
+        finally:
+            device.current_job = None
+            device.queue.task_done()
+
+
+def _line_bytes(frame_bytes, frame_count, guard_time, line_rate):
+    """任务占用的线路字节数：帧字节 + 保护间隔折算的等效字节"""
+    return frame_bytes + guard_time * line_rate * frame_count
+
+
+def _dispatch_batch(items, ports=None, guard_time=0.0, encodings=None):
+    """
+    把一批帧集分配到多台空闲设备：按各设备线速率估算每个任务的线路时间，
+    最长任务优先、分给预计最早完成的设备（LPT 调度），整批完成时间接近最优。
+    items 为 [帧列表]，encodings 为与之同序的编码（可省略），ports 非空时只在这些端口中选设备。
+    选设备与入队在 _devices_lock 内完成，并发的批量请求不会选中同一批空闲设备。
+    返回 (batch_id, 与 items 同序的任务列表, 各设备预计完成时间, 设备列表)；没有空闲设备时返回 None。
+    """
+    sizes = [sum(len(frame) for frame in frames) for frames in items]
+    order = sorted(range(len(items)), key=lambda i: -_line_bytes(sizes[i], len(items[i]), guard_time, 1.0))
+    with _devices_lock:
+        devices = [d for d in serial_devices.values() if (not ports or d.port in ports) and d.idle]
+        if not devices:
+            return None
+        batch_id = secrets.token_hex(6)
+        rates = {d.port: d.line_rate for d in devices}
+        finish = {d.port: d.backlog_seconds() for d in devices}
+
+        def seconds_on(i, device):
+            rate = rates[device.port]
+            return _line_bytes(sizes[i], len(items[i]), guard_time, rate) / rate
+
+        jobs = [None] * len(items)
+        for i in order:
+            device = min(devices, key=lambda d: finish[d.port] + seconds_on(i, d))
+            finish[device.port] += seconds_on(i, device)
+            jobs[i] = _submit_transmission_job(device, items[i], guard_time, batch_id,
+                                               encodings[i] if encodings else None)
+    app.logger.info(f"批量分发 {batch_id}: {len(items)} 个任务 -> {len(devices)} 台设备, "
+                    f"预计 {max(finish.values()):.2f}s 完成")
+    return batch_id, jobs, finish, devices
+
+
+SERIAL_CHUNK_SECONDS = 0.05  # 每次 write 的数据量约为 50ms 线路时间，兼顾吞吐与暂停/取消响应
+
+
+class _TokenBucket:
+    """令牌桶限速：rate 为每秒令牌数（字节），capacity 为突发上限；允许欠账，欠多少等多少"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def acquire(self, n, wait):
+        """扣除 n 个令牌，不足时调用 wait(秒) 等待；wait 返回 True 表示已取消"""
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.last) * self.rate, self.capacity)
+        self.last = now
+        self.tokens -= n
+        if self.tokens < 0:
+            return not wait(-self.tokens / self.rate)
+        return True
+
+
+def _serial_char_bits(conn):
+    """单个字符在线路上的位数：起始位 + 数据位 + 校验位 + 停止位"""
+    parity_bits = 0 if conn.parity == serial.PARITY_NONE else 1
+    return 1 + int(conn.bytesize) + parity_bits + float(conn.stopbits)
+
+
+def _serial_line_rate(conn):
+    """按串口参数计算理论线速率（字节/秒）"""
+    return conn.baudrate / _serial_char_bits(conn)
+
+
+def _frame_payloads(frames):
+    """将帧转换为 bytes，返回 [(帧序号, bytes 或 None, 错误信息)]"""
+    payloads = []
+    for i, frame in enumerate(frames):
+        try:
+            payloads.append((i, bytes(frame), ''))
+        except (ValueError, TypeError) as e:
+            payloads.append((i, None, str(e)))
+    return payloads
+
+
+def _chunk_payloads(payloads, chunk_bytes):
+    """按帧边界切分为不超过 chunk_bytes 的写入块（至少一帧）"""
+    chunk, size = [], 0
+    for item in payloads:
+        if chunk and size + len(item[1]) > chunk_bytes:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += len(item[1])
+    if chunk:
+        yield chunk
+
+
+def _wait_if_paused(job):
+    """暂停时阻塞，返回 False 表示任务已取消"""
+    if not job.resume_event.is_set():
+        job.set_status('paused')
+        while not job.resume_event.wait(0.2):
+            if job.cancel_event.is_set():
+                break
+        if not job.cancel_event.is_set():
+            job.set_status('running')
+    return not job.cancel_event.is_set()
+
+
+def _run_transmission_job(job, device):
+    """
+    批量写入串口：整批帧预先组装，按帧边界切块写入，
+    以串口参数推算的线速率做令牌桶限速，另可附加每帧保护间隔（guard_time）。
+    传输日志与指标按设备（端口）分开记录。
+    """
+    conn = device.conn
+    log = device.log
+    port = device.port
+    if not conn or not conn.is_open:
+        job.set_status('failed', '串口未连接')
+        return
+
+    job.started_at = time.time()
+    job.line_rate = _serial_line_rate(conn)
+    if not job.set_status('running'):
+        job.started_at = None  # 出队后、开始前已被取消
+        return
+    # 清空本设备的传输日志
+    log.clear(job.encoding)
+    app.logger.info(f"开始串口传输: 任务 {job.job_id} ({port}), {len(job.frames)} 帧数据, "
+                    f"线速率 {job.line_rate:.0f} B/s, 每帧保护间隔 {job.guard_time}s")
+    job_trace.info("任务 %s 开始: %d 帧, 端口 %s, 线速率 %.0f B/s, 保护间隔 %ss",
+                   job.job_id, len(job.frames), port, job.line_rate, job.guard_time)
+
+    payloads = []
+    for i, payload, error in _frame_payloads(job.frames):
+        if payload is None:
+            job.error_count += 1
+            SERIAL_FRAMES_TOTAL.inc(1, port, 'failed')
+            app.logger.error(f"{port} 帧{i+1}格式错误: {error}")
+            job_trace.error("任务 %s 帧%d 格式错误: %s", job.job_id, i + 1, error)
+            log.append(i + 1, None, 0, False, error)
+        else:
+            payloads.append((i, payload))
+
+    # 保护间隔折算为等效字节，一并计入令牌桶
+    guard_bytes = job.guard_time * job.line_rate
+    if guard_bytes > 0:
+        # 有保护间隔时逐帧写入，令牌桶容量为 0（不攒突发余量，等待超时也不会让下一帧提前）：
+        # 相邻两帧的写入时刻至少相隔 帧线路时间 + guard_time，线路上每帧之后真正空闲 guard_time，
+        # 与 _simulate_fpga_pipeline 的假设一致，move_fsm 忙时不会收到紧挨着的帧
+        chunk_bytes = 1
+        bucket = _TokenBucket(job.line_rate, 0)
+    else:
+        chunk_bytes = max(int(job.line_rate * SERIAL_CHUNK_SECONDS), 1)
+        bucket = _TokenBucket(job.line_rate, chunk_bytes)
+
+    for chunk in _chunk_payloads(payloads, chunk_bytes):
+        if not _wait_if_paused(job):
+            break
+        data = b''.join(p for _, p in chunk)
+        if not bucket.acquire(len(data) + guard_bytes * len(chunk), job.cancel_event.wait):
+            break
+        try:
+            bytes_written = conn.write(data) or 0
+        except Exception as e:
+            app.logger.error(f"{port} 传输帧{chunk[0][0]+1}-{chunk[-1][0]+1}失败: {str(e)}")
+            job_trace.error("任务 %s 帧%d-%d 写入失败: %s", job.job_id, chunk[0][0] + 1, chunk[-1][0] + 1, e)
+            for i, payload in chunk:
+                job.error_count += 1
+                log.append(i + 1, payload, 0, False, str(e))
+            SERIAL_FRAMES_TOTAL.inc(len(chunk), port, 'failed')
+            event_broker.publish('transmit_error', {
+                "job_id": job.job_id,
+                "port": port,
+                "frames": [chunk[0][0] + 1, chunk[-1][0] + 1],
+                "error": str(e)
+            })
+            job.publish_progress()
+            continue
+
+        job.bytes_sent += bytes_written
+        sent_before = job.sent_frames
+        offset = 0
+        for i, payload in chunk:
+            ok = offset + len(payload) <= bytes_written
+            offset += len(payload)
+            log.append(i + 1, payload, len(payload) if ok else 0, ok)
+            if ok:
+                job.sent_frames += 1
+            else:
+                job.error_count += 1
+        # 指标按写入块汇总更新，不进入逐帧循环
+        sent = job.sent_frames - sent_before
+        SERIAL_BYTES_TOTAL.inc(bytes_written, port)
+        SERIAL_FRAMES_TOTAL.inc(sent, port, 'sent')
+        if sent < len(chunk):
+            SERIAL_FRAMES_TOTAL.inc(len(chunk) - sent, port, 'failed')
+        log_sampled("serial_chunk", "%s 帧%d-%d: 写入 %d/%d 字节",
+                    port, chunk[0][0] + 1, chunk[-1][0] + 1, bytes_written, len(data))
+        job_trace.info("任务 %s 帧%d-%d: 写入 %d/%d 字节", job.job_id,
+                       chunk[0][0] + 1, chunk[-1][0] + 1, bytes_written, len(data))
+        job_trace.debug("任务 %s 帧%d-%d 数据: %s", job.job_id, chunk[0][0] + 1, chunk[-1][0] + 1, LazyHex(data))
+        job.publish_progress()
+
+    try:
+        conn.flush()  # 等驱动缓冲区发完再记结束时间，实际吞吐按线路上真正发出的时刻计
+    except Exception as e:
+        app.logger.warning(f"{port} 等待发送缓冲区清空失败: {e}")
+    job.publish_progress(force=True)
+    job.set_status('cancelled' if job.cancel_event.is_set() else 'completed')
+    stats = job.to_dict()
+    app.logger.info(f"串口传输{'已取消' if job.status == 'cancelled' else '完成'}: "
+                    f"任务 {job.job_id} ({port}), 成功 {job.sent_frames} 帧, 失败 {job.error_count} 帧, "
+                    f"实际 {stats['achieved_bytes_per_s']} B/s / 理论 {stats['line_rate_bytes_per_s']} B/s")
+    job_trace.info("任务 %s %s: 成功 %d 帧, 失败 %d 帧, 实际 %s B/s / 理论 %s B/s", job.job_id, job.status,
+                   job.sent_frames, job.error_count, stats['achieved_bytes_per_s'], stats['line_rate_bytes_per_s'])
+
+
+def _serial_link_gauges():
+    """抓取时计算：每台设备的队列深度、连接状态、运行中任务的实时吞吐"""
+    values = {}
+    for device in _list_serial_devices():
+        job = device.current_job
+        running = job is not None and job.status in ('running', 'paused')
+        values[(device.port, "queue_depth")] = device.queue.qsize()
+        values[(device.port, "connected")] = 1 if device.connected else 0
+        values[(device.port, "busy")] = 0 if device.idle else 1
+        values[(device.port, "bytes_per_second")] = job.to_dict()["achieved_bytes_per_s"] if running else 0
+        values[(device.port, "line_rate_bytes_per_second")] = round(device.line_rate, 1)
+    return values
+
+
+metrics.register(Gauge("jarvis_serial_link", "串口设备状态（queue_depth / connected / busy / "
+                                              "bytes_per_second / line_rate_bytes_per_second）",
+                       ("port", "field"), _serial_link_gauges))
+
+
+def _get_job_or_404(job_id):
+    with _jobs_lock:
+        job = transmission_jobs.get(job_id)
+    if job is None:
+        return None, (jsonify({"success": False, "error": f"任务不存在: {job_id}"}), 404)
+    return job, None
+
+
+def _request_frames(data):
+    """
+    取请求中的帧：frames_id 引用 /api/send-to-fpga 已编码并保存在服务端的帧集，无需重新上传。
+    返回 (frames, encoding)；直接上传 frames 时编码取请求中的 encoding（可省略）
+    """
+    frames_id = data.get('frames_id', '')
+    if not frames_id:
+        return data.get('frames', []), data.get('encoding')
+    stored = artifact_store.get('frames', frames_id)
+    if stored is None:
+        raise LookupError(f"帧集 {frames_id} 不存在或已过期，请重新生成")
+    return stored[0], stored[1]['encoding_stats']['encoding']
+
+
 @app.route('/api/serial-transmit', methods=['POST'])
 @login_required
 def transmit_serial_data():
-    """通过串口传输数据"""
-    global serial_connection, transmission_log
-    
+    """通过串口传输数据（提交到目标设备的后台队列，立即返回任务ID；port 缺省为最近连接的设备）"""
     try:
         data = request.get_json()
-        frames = data.get('frames', [])
-        interval = float(data.get('interval', 0.1))  # 传输间隔（秒）
-        
-        if not serial_connection or not serial_connection.is_open:
+        try:
+            frames, encoding = _request_frames(data)
+        except LookupError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 404
+        # 每帧保护间隔（秒），兼容旧参数 interval；字节本身按波特率自动限速
+        guard_time = float(data.get('guard_time', data.get('interval', 0)))
+
+        device = _resolve_serial_device(data.get('port'))
+        if device is None or not device.connected:
             return jsonify({
                 "success": False,
                 "error": "串口未连接"
             }), 400
-        
+
         if not frames:
             return jsonify({
                 "success": False,
                 "error": "没有要传输的数据"
             }), 400
-        
-        # 清空传输日志
-        transmission_log.clear()
-        
-        app.logger.info(f"开始串口传输: {len(frames)} 帧数据")
-        
-        # 立即返回成功响应，让前端开始实时获取日志
+
+        job = _submit_transmission_job(device, frames, guard_time, encoding=encoding)
+
         return jsonify({
             "success": True,
             "message": "传输已开始，请查看实时日志",
+            "job_id": job.job_id,
+            "port": device.port,
+            "queue_position": device.queue.qsize(),
             "total_frames": len(frames)
         })
-        
+
     except Exception as e:
         app.logger.error(f"串口传输失败: {str(e)}")
         return jsonify({
@@ -731,131 +3752,173 @@ def transmit_serial_data():
             "error": f"串口传输失败: {str(e)}"
         }), 500
 
+
 @app.route('/api/start-serial-transmission', methods=['POST'])
 @login_required
 def start_serial_transmission():
-    """启动串口传输（异步）"""
-    global serial_connection, transmission_log
-    
+    """启动串口传输（异步，与 /api/serial-transmit 相同）"""
+    return transmit_serial_data()
+
+
+@app.route('/api/serial-devices', methods=['GET'])
+@login_required
+def list_serial_devices():
+    """列出注册表中的全部设备（含已断开的），以及默认设备"""
+    devices = [d.to_dict() for d in _list_serial_devices()]
+    return jsonify({
+        "success": True,
+        "devices": devices,
+        "default_port": default_serial_port,
+        "connected": sum(d["connected"] for d in devices),
+        "idle": sum(d["idle"] for d in devices)
+    })
+
+
+@app.route('/api/serial-dispatch', methods=['POST'])
+@login_required
+def dispatch_serial_batch():
+    """把一批图片的帧集分配到所有空闲设备并行传输（ports 可限定候选设备）"""
     try:
-        data = request.get_json()
-        frames = data.get('frames', [])
-        interval = float(data.get('interval', 0.1))  # 传输间隔（秒）
-        
-        if not serial_connection or not serial_connection.is_open:
-            return jsonify({
-                "success": False,
-                "error": "串口未连接"
-            }), 400
-        
-        if not frames:
+        data = request.get_json() or {}
+        items = data.get('items', [])
+        if not items:
+            return jsonify({"success": False, "error": "没有要传输的数据"}), 400
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return jsonify({"success": False, "error": "items 必须是对象列表"}), 400
+        ports = data.get('ports')
+        if ports is not None and (not isinstance(ports, list) or not all(isinstance(p, str) for p in ports)):
+            return jsonify({"success": False, "error": "ports 必须是端口名列表"}), 400
+        try:
+            batch, encodings = zip(*(_request_frames(item) for item in items))
+        except LookupError as e:
+            return jsonify({"success": False, "error": str(e)}), 404
+        if not all(batch):
+            return jsonify({"success": False, "error": "批量中存在空帧集"}), 400
+        guard_time = float(data.get('guard_time', 0))
+
+        dispatched = _dispatch_batch(list(batch), ports, guard_time, list(encodings))
+        if dispatched is None:
+            connected = [d for d in _list_serial_devices() if (not ports or d.port in ports) and d.connected]
             return jsonify({
                 "success": False,
-                "error": "没有要传输的数据"
-            }), 400
-        
-        # 清空传输日志
-        transmission_log.clear()
-        
-        app.logger.info(f"开始串口传输: {len(frames)} 帧数据")
-        
-        # 传输数据
-        transmitted_count = 0
-        error_count = 0
-        
-        for i, frame in enumerate(frames):
-            try:
-                # 调试：打印帧数据类型
-                if i == 0:
-                    app.logger.info(f"第1帧数据类型: {type(frame)}, 长度: {len(frame)}, 内容: {frame}")
-                
-                # 将帧数据转换为字节
-                frame_bytes = bytes(frame)
-                
-                # 发送数据
-                bytes_written = serial_connection.write(frame_bytes)
-                
-                # 记录传输日志
-                timestamp = time.strftime("%Y-%m-%d %H:%M:%S") + f".{int(time.time() * 1000) % 1000:03d}"
-                
-                # 安全地获取帧类型
-                try:
-                    frame_type = "元信息" if int(frame[1]) == 0x00 else "数据"
-                except (ValueError, TypeError, IndexError) as e:
-                    app.logger.error(f"获取帧类型失败: {e}, frame[1]={frame[1]}, type={type(frame[1])}")
-                    frame_type = "未知"
-                
-                # 安全地格式化帧数据
-                try:
-                    frame_hex = ' '.join([f"{int(b):02X}" for b in frame])
-                except (ValueError, TypeError) as e:
-                    app.logger.error(f"格式化帧数据失败: {e}")
-                    frame_hex = str(frame)
-                
-                log_entry = {
-                    "timestamp": timestamp,
-                    "frame_number": i + 1,
-                    "frame_type": frame_type,
-                    "frame_hex": frame_hex,
-                    "bytes_written": bytes_written,
-                    "status": "成功" if bytes_written == len(frame_bytes) else "失败"
-                }
-                transmission_log.append(log_entry)
-                
-                app.logger.info(f"帧{i+1}: {log_entry['frame_hex']} - {log_entry['status']}")
-                
-                if bytes_written == len(frame_bytes):
-                    transmitted_count += 1
-                else:
-                    error_count += 1
-                
-                # 等待指定间隔
-                if interval > 0:
-                    time.sleep(interval)
-                    
-            except Exception as e:
-                error_count += 1
-                app.logger.error(f"传输帧{i+1}失败: {str(e)}")
-                
-                # 记录错误日志
-                timestamp = time.strftime("%Y-%m-%d %H:%M:%S") + f".{int(time.time() * 1000) % 1000:03d}"
-                log_entry = {
-                    "timestamp": timestamp,
-                    "frame_number": i + 1,
-                    "frame_type": "错误",
-                    "frame_hex": "传输失败",
-                    "bytes_written": 0,
-                    "status": f"错误: {str(e)}"
-                }
-                transmission_log.append(log_entry)
-        
-        app.logger.info(f"串口传输完成: 成功 {transmitted_count} 帧, 失败 {error_count} 帧")
-        
+                "error": "没有空闲设备" if connected else "没有已连接的设备"
+            }), 409 if connected else 400
+
+        batch_id, jobs, finish, devices = dispatched
         return jsonify({
             "success": True,
-            "message": f"传输完成: 成功 {transmitted_count} 帧, 失败 {error_count} 帧",
-            "transmitted_count": transmitted_count,
-            "error_count": error_count,
-            "total_frames": len(frames)
+            "batch_id": batch_id,
+            "jobs": [{"job_id": j.job_id, "port": j.port, "total_frames": len(j.frames)} for j in jobs],
+            "devices": [d.port for d in devices],
+            "estimated_seconds": {port: round(t, 3) for port, t in finish.items()}
         })
-        
     except Exception as e:
-        app.logger.error(f"串口传输失败: {str(e)}")
-        return jsonify({
-            "success": False,
-            "error": f"串口传输失败: {str(e)}"
-        }), 500
+        app.logger.error(f"批量分发失败: {str(e)}")
+        return jsonify({"success": False, "error": f"批量分发失败: {str(e)}"}), 500
+
+
+@app.route('/api/transmission-jobs', methods=['GET'])
+@login_required
+def list_transmission_jobs():
+    """列出传输任务（?port= 只看某台设备，?batch_id= 只看某个批次）"""
+    port = request.args.get('port')
+    batch_id = request.args.get('batch_id')
+    with _jobs_lock:
+        jobs = sorted((j for j in transmission_jobs.values()
+                       if (not port or j.port == port) and (not batch_id or j.batch_id == batch_id)),
+                      key=lambda j: j.created_at)
+    devices = [d for d in _list_serial_devices() if not port or d.port == port]
+    return jsonify({
+        "success": True,
+        "jobs": [j.to_dict() for j in jobs],
+        "queue_depth": sum(d.queue.qsize() for d in devices)
+    })
+
+
+@app.route('/api/transmission-jobs/<job_id>', methods=['GET'])
+@login_required
+def get_transmission_job(job_id):
+    """查询传输任务状态"""
+    job, err = _get_job_or_404(job_id)
+    if err:
+        return err
+    return jsonify({"success": True, "job": job.to_dict()})
+
+
+@app.route('/api/transmission-jobs/<job_id>/pause', methods=['POST'])
+@login_required
+def pause_transmission_job(job_id):
+    """暂停传输任务"""
+    job, err = _get_job_or_404(job_id)
+    if err:
+        return err
+    if job.status not in ('queued', 'running', 'paused'):
+        return jsonify({"success": False, "error": f"任务已结束: {job.status}"}), 409
+    job.resume_event.clear()
+    app.logger.info(f"串口传输任务已暂停: {job_id}")
+    return jsonify({"success": True, "job": job.to_dict()})
+
+
+@app.route('/api/transmission-jobs/<job_id>/resume', methods=['POST'])
+@login_required
+def resume_transmission_job(job_id):
+    """继续传输任务"""
+    job, err = _get_job_or_404(job_id)
+    if err:
+        return err
+    if job.status not in ('queued', 'running', 'paused'):
+        return jsonify({"success": False, "error": f"任务已结束: {job.status}"}), 409
+    job.resume_event.set()
+    app.logger.info(f"串口传输任务已继续: {job_id}")
+    return jsonify({"success": True, "job": job.to_dict()})
+
+
+@app.route('/api/transmission-jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_transmission_job(job_id):
+    """取消传输任务（排队中的任务出队时直接跳过）"""
+    job, err = _get_job_or_404(job_id)
+    if err:
+        return err
+    if job.finished:
+        return jsonify({"success": False, "error": f"任务已结束: {job.status}"}), 409
+    job.cancel_event.set()
+    job.resume_event.set()
+    if job.status == 'queued':
+        job.set_status('cancelled')
+    app.logger.info(f"串口传输任务已取消: {job_id}")
+    return jsonify({"success": True, "job": job.to_dict()})
 
 @app.route('/api/transmission-log', methods=['GET'])
 @login_required
 def get_transmission_log():
-    """获取传输日志"""
-    global transmission_log
-    
+    """获取传输日志（?since=<seq> 增量获取，只返回新记录与汇总计数；?port= 指定设备，缺省为最近连接的设备）"""
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(int(request.args.get('limit', TRANSMISSION_LOG_FETCH_LIMIT)), TRANSMISSION_LOG_FETCH_LIMIT)
+        if since < 0 or limit < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"success": False, "error": "since/limit 参数无效"}), 400
+
+    device = _resolve_serial_device(request.args.get('port'))
+    if device is None:
+        if request.args.get('port'):
+            return jsonify({"success": False, "error": f"设备不存在: {request.args.get('port')}"}), 404
+        log = TransmissionLog(capacity=1)  # 尚未连接过任何设备：返回空日志
+    else:
+        log = device.log
+    entries, dropped = log.since(since, limit)
+    counters = log.counters()
     return jsonify({
         "success": True,
-        "log": transmission_log,
-        "total_entries": len(transmission_log)
+        "port": device.port if device is not None else None,
+        "log": entries,
+        "next_seq": entries[-1]["seq"] if entries else max(since, 0),
+        "last_seq": log.last_seq,
+        "dropped": dropped,
+        "counters": counters,
+        "total_entries": counters["total"]
     })
 
 @app.route('/api/fpga-status', methods=['GET'])
@@ -872,70 +3935,613 @@ def fpga_status():
         return jsonify({"success": False, "error": f"无法获取FPGA状态: {str(e)}"})
 
 
+# ====== 图片下载与预处理缓存 ======
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "")  # 为空则不启用磁盘缓存
+
+
+class ImageCache:
+    """
+    按内容哈希寻址的图片缓存：原始字节、预处理后的画布/数组、PNG 编码结果。
+    内存层按字节预算做 LRU 淘汰；可选磁盘层保存原始字节与数组，进程重启后仍可命中。
+    """
+
+    def __init__(self, max_bytes=IMAGE_CACHE_MAX_BYTES, disk_dir=IMAGE_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = collections.OrderedDict()  # key -> (value, size)
+        self._url_index = {}  # url -> 内容哈希
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = collections.defaultdict(lambda: {"hits": 0, "misses": 0, "disk_hits": 0})
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def content_hash(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        return len(value)
+
+    def _disk_path(self, kind, key):
+        name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        ext = '.npy' if kind == 'array' else '.bin'
+        return os.path.join(self.disk_dir, f"{kind}_{name}{ext}")
+
+    def _load_disk(self, kind, key):
+        path = self._disk_path(kind, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            if kind == 'array':
+                return np.load(path, allow_pickle=False)
+            with open(path, 'rb') as f:
+                return f.read()
+        except Exception as e:
+            app.logger.warning(f"读取图片磁盘缓存失败: {path}: {e}")
+            return None
+
+    def _save_disk(self, kind, key, value):
+        path = self._disk_path(kind, key)
+        tmp = path + '.tmp'
+        try:
+            if kind == 'array':
+                with open(tmp, 'wb') as f:
+                    np.save(f, value, allow_pickle=False)
+            else:
+                with open(tmp, 'wb') as f:
+                    f.write(value)
+            os.replace(tmp, path)
+        except Exception as e:
+            app.logger.warning(f"写入图片磁盘缓存失败: {path}: {e}")
+
+    def get(self, kind, key):
+        """kind: raw / array / png；未命中返回 None"""
+        full_key = (kind, key)
+        with self._lock:
+            item = self._entries.get(full_key)
+            if item is not None:
+                self._entries.move_to_end(full_key)
+                self._stats[kind]["hits"] += 1
+                return item[0]
+        if self.disk_dir and kind in ('raw', 'array'):
+            value = self._load_disk(kind, key)
+            if value is not None:
+                with self._lock:
+                    self._stats[kind]["disk_hits"] += 1
+                self._put_memory(full_key, value)
+                return value
+        with self._lock:
+            self._stats[kind]["misses"] += 1
+        return None
+
+    def put(self, kind, key, value):
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)  # 缓存中的数组为共享只读
+        self._put_memory((kind, key), value)
+        if self.disk_dir and kind in ('raw', 'array'):
+            self._save_disk(kind, key, value)
+
+    def _put_memory(self, full_key, value):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(full_key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[full_key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def lookup_url(self, url):
+        with self._lock:
+            digest = self._url_index.get(url)
+        if digest is None and self.disk_dir:
+            data = self._load_disk('url', url)
+            if data is not None:
+                digest = data.decode('ascii')
+                with self._lock:
+                    self._url_index[url] = digest
+        return digest
+
+    def remember_url(self, url, digest):
+        with self._lock:
+            self._url_index[url] = digest
+        if self.disk_dir:
+            self._save_disk('url', url, digest.encode('ascii'))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._url_index.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "urls": len(self._url_index),
+                "disk_dir": self.disk_dir or None,
+                "tiers": {k: dict(v) for k, v in self._stats.items()},
+            }
+
+
+image_cache = ImageCache()
+
+
+def _fetch_image_bytes(image_data_b64='', image_url=''):
+    """
+    获取图片原始字节：base64 直接解码，URL 优先命中缓存，未命中才下载。
+    返回：(image_bytes, 内容哈希)
+    """
+    if image_data_b64:
+        image_bytes = base64.b64decode(image_data_b64)
+        digest = ImageCache.content_hash(image_bytes)
+        return image_bytes, digest
+
+    digest = image_cache.lookup_url(image_url)
+    if digest is not None:
+        image_bytes = image_cache.get('raw', digest)
+        if image_bytes is not None:
+            return image_bytes, digest
+
+    app.logger.info(f"下载图片: {image_url}")
+    r = http_request("image_download", "GET", image_url)
+    r.raise_for_status()
+    image_bytes = r.content
+    digest = ImageCache.content_hash(image_bytes)
+    image_cache.put('raw', digest, image_bytes)
+    image_cache.remember_url(image_url, digest)
+    return image_bytes, digest
+
+
+@app.route('/api/image-cache', methods=['GET'])
+@login_required
+def image_cache_stats():
+    """图片缓存命中统计"""
+    return jsonify({"success": True, "stats": image_cache.stats()})
+
+
+@app.route('/api/image-cache', methods=['DELETE'])
+@login_required
+def image_cache_clear():
+    """清空内存中的图片缓存（磁盘层保留）"""
+    image_cache.clear()
+    return jsonify({"success": True})
+
+
+# ====== 服务端图片与帧集存储（按 ID 引用，TTL 过期）======
+ARTIFACT_TTL_SECONDS = float(os.getenv("ARTIFACT_TTL_SECONDS", "1800"))
+ARTIFACT_STORE_MAX_ITEMS = int(os.getenv("ARTIFACT_STORE_MAX_ITEMS", "256"))
+ARTIFACT_STORE_MAX_BYTES = int(os.getenv("ARTIFACT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+_POINTER_BYTES = np.dtype(np.intp).itemsize
+
+
+class ArtifactStore:
+    """
+    保存已转换的像素数组（image）和编码后的帧集（frames），后续接口通过 ID 引用，
+    避免数组与帧在浏览器和服务端之间反复往返。
+    每次访问刷新过期时间；超过 TTL、条目数上限或字节预算时按最久未使用淘汰。
+    """
+
+    def __init__(self, ttl=ARTIFACT_TTL_SECONDS, max_items=ARTIFACT_STORE_MAX_ITEMS,
+                 max_bytes=ARTIFACT_STORE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()  # (kind, id) -> [value, meta, expires_at, size]
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_id(*parts):
+        """由内容与参数生成确定性 ID，相同输入得到相同 ID（天然去重与记忆化）"""
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(part if isinstance(part, bytes) else repr(part).encode('utf-8'))
+            h.update(b'\x00')
+        return h.hexdigest()[:24]
+
+    @staticmethod
+    def _sizeof(value):
+        """
+        估算占用内存：数组按 nbytes；帧集为 list 套 list（元素是共享的小整数），
+        按外层列表 + 每帧一个列表对象 + 每字节一个指针计，不逐帧调用 getsizeof
+        """
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, list) and value and isinstance(value[0], list):
+            return (sys.getsizeof(value) + len(value) * sys.getsizeof([])
+                    + sum(map(len, value)) * _POINTER_BYTES)
+        return sys.getsizeof(value)
+
+    def _remove(self, full_key):
+        item = self._entries.pop(full_key, None)
+        if item is not None:
+            self._size -= item[3]
+        return item
+
+    def _purge_expired(self, now):
+        for full_key in [k for k, v in self._entries.items() if v[2] <= now]:
+            self._remove(full_key)
+            self.expired += 1
+
+    def put(self, kind, artifact_id, value, meta=None):
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+        size = self._sizeof(value)
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            self._remove((kind, artifact_id))
+            self._entries[(kind, artifact_id)] = [value, meta or {}, now + self.ttl, size]
+            self._size += size
+            # 刚存入的条目总是保留（调用方马上要用它的 ID），超出预算时只淘汰更早的条目
+            while len(self._entries) > 1 and (len(self._entries) > self.max_items or self._size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return artifact_id
+
+    def get(self, kind, artifact_id):
+        """返回 (value, meta)；不存在或已过期返回 None"""
+        now = time.time()
+        with self._lock:
+            item = self._entries.get((kind, artifact_id))
+            if item is None or item[2] <= now:
+                if item is not None:
+                    self._remove((kind, artifact_id))
+                    self.expired += 1
+                self.misses += 1
+                return None
+            item[2] = now + self.ttl
+            self._entries.move_to_end((kind, artifact_id))
+            self.hits += 1
+            return item[0], item[1]
+
+    def delete(self, kind, artifact_id):
+        with self._lock:
+            return self._remove((kind, artifact_id)) is not None
+
+    def stats(self):
+        with self._lock:
+            self._purge_expired(time.time())
+            kinds = collections.Counter(kind for kind, _ in self._entries)
+            return {
+                "entries": len(self._entries),
+                "by_kind": dict(kinds),
+                "max_items": self.max_items,
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+
+artifact_store = ArtifactStore()
+
+
+def _store_image_array(array, width, height, mode='L', image_id=None):
+    """保存像素数组并返回 image_id；未指定 ID 时按数组内容生成"""
+    np_array = np.ascontiguousarray(array).ravel()
+    if image_id is None:
+        image_id = ArtifactStore.make_id('image', width, height, str(np_array.dtype), np_array.tobytes())
+    artifact_store.put('image', image_id, np_array, {"width": width, "height": height, "mode": mode})
+    return image_id
+
+
+@app.route('/api/artifacts', methods=['GET'])
+@login_required
+def artifact_store_stats():
+    """服务端图片/帧集存储统计"""
+    return jsonify({"success": True, "stats": artifact_store.stats()})
+
+
+@app.route('/api/artifacts/<kind>/<artifact_id>', methods=['DELETE'])
+@login_required
+def artifact_delete(kind, artifact_id):
+    """提前释放已不再需要的图片或帧集"""
+    if kind not in ('image', 'frames'):
+        return jsonify({"success": False, "error": f"未知类型: {kind}"}), 400
+    if not artifact_store.delete(kind, artifact_id):
+        return jsonify({"success": False, "error": "不存在或已过期"}), 404
+    return jsonify({"success": True})
+
+
+# ====== 图片预处理（灰度 + 等比例缩放 + 居中画布）======
+DEFAULT_CANVAS_SIZE = 64
+MAX_CANVAS_SIZE = 4096          # move_fsm / stepper_ctrl 坐标为 12 位（0-4095）
+PREPROCESS_REDUCING_GAP = 2     # 廉价预缩小后至少保留目标尺寸的 2 倍，再做高质量重采样
+RESAMPLE_FILTERS = {
+    'nearest': Image.NEAREST,
+    'box': Image.BOX,
+    'bilinear': Image.BILINEAR,
+    'hamming': Image.HAMMING,
+    'bicubic': Image.BICUBIC,
+    'lanczos': Image.LANCZOS,
+}
+
+
+def _grayscale_png(image_bytes, digest, size=DEFAULT_CANVAS_SIZE, resample='lanczos', dither='none'):
+    """灰度画布（可选半色调）的 PNG 编码结果（缓存于 png 层）"""
+    key = (digest, 'L', size, resample) if dither == 'none' else (digest, 'L', size, resample, dither)
+    png_bytes = image_cache.get('png', key)
+    if png_bytes is None:
+        canvas = _preprocess_grayscale(image_bytes, digest, size, resample)
+        canvas = _halftone_canvas(canvas, digest, size, resample, dither)
+        buf = io.BytesIO()
+        Image.fromarray(canvas, mode='L').save(buf, format='PNG')
+        png_bytes = buf.getvalue()
+        image_cache.put('png', key, png_bytes)
+    return png_bytes
+
+
+def _image_array_id(digest, grayscale, size, resample, dither='none'):
+    """图片转数组结果在服务端存储中的 ID，与 /api/image-to-array 返回的 image_id 一致"""
+    if dither != 'none':
+        return ArtifactStore.make_id('image', digest, grayscale, size, resample, dither)
+    return ArtifactStore.make_id('image', digest, grayscale, size, resample)
+
+
+def _parse_preprocess_options(data):
+    """从请求体解析目标尺寸与重采样滤波器，非法时抛出 ValueError"""
+    size = int(data.get('size', DEFAULT_CANVAS_SIZE))
+    resample = str(data.get('resample', 'lanczos')).lower()
+    if not 1 <= size <= MAX_CANVAS_SIZE:
+        raise ValueError(f"size 超出范围: {size}（1-{MAX_CANVAS_SIZE}）")
+    if resample not in RESAMPLE_FILTERS:
+        raise ValueError(f"不支持的重采样滤波器: {resample}")
+    return size, resample
+
+
+def _preprocess_grayscale(image_bytes, digest, size=DEFAULT_CANVAS_SIZE, resample='lanczos'):
+    """
+    灰度 + 等比例缩放 + 黑底居中画布，两个图片接口共用，结果按 (内容哈希, 参数) 缓存。
+    JPEG 使用 draft 模式在解码阶段直接按 1/2~1/8 缩小并输出灰度；
+    其他格式先用 Image.reduce 做整数倍盒式缩小，最后再用指定滤波器缩放到目标尺寸。
+    """
+    key = (digest, 'L', size, resample)
+    canvas = image_cache.get('array', key)
+    if canvas is not None:
+        return canvas
+
+    started = time.perf_counter()
+    gap_size = size * PREPROCESS_REDUCING_GAP
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        src_size = img.size
+        # JPEG：解码即缩小（其余格式 draft 为空操作）
+        img.draft('L', (gap_size, gap_size))
+        # 转灰度
+        img = img.convert('L')
+
+        # 整数倍预缩小，保留目标尺寸的 PREPROCESS_REDUCING_GAP 倍
+        factor = min(img.width, img.height, max(img.width, img.height) // gap_size)
+        if factor >= 2:
+            img = img.reduce(factor)
+
+        # 等比例缩放到 size x size（保持宽高比）
+        img.thumbnail((size, size), RESAMPLE_FILTERS[resample], reducing_gap=None)
+
+        # 创建黑底画布（居中填充）
+        canvas_img = Image.new('L', (size, size), color=0)
+        x_offset = (size - img.width) // 2
+        y_offset = (size - img.height) // 2
+        canvas_img.paste(img, (x_offset, y_offset))
+
+        app.logger.info(f"图像等比例缩放: 原图 {src_size[0]}x{src_size[1]} -> {size}x{size}, "
+                        f"实际尺寸: {img.width}x{img.height}, 偏移: ({x_offset}, {y_offset}), 滤波: {resample}")
+
+    canvas = np.array(canvas_img)
+    IMAGE_CONVERSION_SECONDS.observe(time.perf_counter() - started, 'decode_resize')
+    image_cache.put('array', key, canvas)
+    return canvas
+
+
+# ====== 半色调/抖动（输出 0/255 二值位图，坐标寻址帧可整点跳过熄光像素）======
+DITHER_METHODS = ('none', 'threshold', 'bayer', 'floyd_steinberg', 'atkinson')
+DITHER_ON_LEVEL = 255           # 出光像素值，move_fsm 映射为满功率
+DITHER_ERROR_SCALE = 16         # 误差扩散以 1/16 灰度为单位做整数运算，结果与处理顺序无关
+# 误差扩散核：(dy, dx, 分子)，分母为 divisor；Atkinson 只扩散 6/8 的误差
+ERROR_DIFFUSION_KERNELS = {
+    'floyd_steinberg': (16, ((0, 1, 7), (1, -1, 3), (1, 0, 5), (1, 1, 1))),
+    'atkinson': (8, ((0, 1, 1), (0, 2, 1), (1, -1, 1), (1, 0, 1), (1, 1, 1), (2, 0, 1))),
+}
+
+
+def _bayer_matrix(order):
+    """order x order 的 Bayer 有序抖动矩阵（order 为 2 的幂），取值 0..order²-1"""
+    m = np.zeros((1, 1), dtype=np.int32)
+    while m.shape[0] < order:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return m
+
+
+def _dither_threshold(gray, level=128):
+    return np.where(gray >= level, DITHER_ON_LEVEL, 0).astype(np.uint8)
+
+
+def _dither_bayer(gray, order=8):
+    """有序抖动：与平铺的 Bayer 阈值矩阵逐元素比较，完全向量化"""
+    m = _bayer_matrix(order)
+    thresholds = ((m.astype(np.float32) + 0.5) * (256.0 / m.size)).astype(np.int32)
+    h, w = gray.shape
+    tiled = np.tile(thresholds, (-(-h // order), -(-w // order)))[:h, :w]
+    return np.where(gray.astype(np.int32) >= tiled, DITHER_ON_LEVEL, 0).astype(np.uint8)
+
+
+def _dither_error_diffusion(gray, method='floyd_steinberg'):
+    """
+    误差扩散抖动，按波前并行：像素 (y, x) 只依赖左侧与上方已处理的像素，
+    u = x + 2y 相同的像素互不依赖。先把图像错切到 (u, y) 坐标，每个波前即一行连续切片，
+    扩散目标也是相邻行的平移切片，步数为 W + 2H 而非 W×H。
+    误差以整数累加（单位 1/DITHER_ERROR_SCALE 灰度），结果与逐像素串行实现逐位一致。
+    """
+    divisor, taps = ERROR_DIFFUSION_KERNELS[method]
+    h, w = gray.shape
+    steps = w + 2 * (h - 1)
+    ys = np.arange(h)[:, None]
+    us = np.arange(w)[None, :] + 2 * ys
+    # 错切坐标系：skew[u, y] = gray[y, u - 2y]，多留几行/列容纳越界的扩散目标（随后丢弃）
+    value = np.zeros((steps + 4, h + 2), dtype=np.int64)
+    value[us, ys] = gray.astype(np.int64) * DITHER_ERROR_SCALE
+    err = np.zeros_like(value)
+    out = np.zeros_like(value, dtype=np.uint8)
+    half = 128 * DITHER_ERROR_SCALE
+    full = 255 * DITHER_ERROR_SCALE
+    numerators = sorted({num for _, _, num in taps})
+    for t in range(steps):
+        # 本波前上的像素：x = t - 2y 落在 [0, w)
+        lo = max(0, -(-(t - w + 1) // 2))
+        hi = min(h - 1, t // 2) + 1
+        v = value[t, lo:hi] + err[t, lo:hi]
+        on = v >= half
+        out[t, lo:hi] = on
+        e = v - on * full
+        shares = {num: (e * num) // divisor for num in numerators}
+        for dy, dx, num in taps:
+            err[t + dx + 2 * dy, lo + dy:hi + dy] += shares[num]
+    return out[us, ys] * np.uint8(DITHER_ON_LEVEL)
+
+
+def _halftone(gray, method='floyd_steinberg'):
+    """将 8 位灰度画布转换为 0/DITHER_ON_LEVEL 的二值位图"""
+    gray = np.asarray(gray, dtype=np.uint8)
+    started = time.perf_counter()
+    if method == 'threshold':
+        bitmap = _dither_threshold(gray)
+    elif method == 'bayer':
+        bitmap = _dither_bayer(gray)
+    elif method in ERROR_DIFFUSION_KERNELS:
+        bitmap = _dither_error_diffusion(gray, method)
+    else:
+        return gray
+    IMAGE_CONVERSION_SECONDS.observe(time.perf_counter() - started, 'halftone')
+    return bitmap
+
+
+def _parse_dither_option(data):
+    """解析 dither 参数，非法时抛出 ValueError"""
+    method = str(data.get('dither') or 'none').lower()
+    if method not in DITHER_METHODS:
+        raise ValueError(f"不支持的抖动方式: {method}（可选 {', '.join(DITHER_METHODS)}）")
+    return method
+
+
+def _halftone_canvas(canvas, digest, size, resample, dither):
+    """对灰度画布做半色调，结果与灰度画布一起缓存在 array 层"""
+    if dither == 'none':
+        return canvas
+    key = (digest, 'L', size, resample, dither)
+    bitmap = image_cache.get('array', key)
+    if bitmap is None:
+        t0 = time.perf_counter()
+        bitmap = _halftone(canvas, dither)
+        app.logger.info(f"半色调 {dither}: {size}x{size}, 出光像素 {int(np.count_nonzero(bitmap))}, "
+                        f"耗时 {(time.perf_counter() - t0) * 1e3:.1f}ms")
+        image_cache.put('array', key, bitmap)
+    return bitmap
+
+
 @app.route('/api/image-to-array', methods=['POST'])
 @login_required
 def image_to_array():
     try:
         data = request.get_json() or {}
-        app.logger.info(f"/api/image-to-array payload={json.dumps(data, ensure_ascii=False)[:800]}")
+        log_sampled("payload", "/api/image-to-array payload=%s", LazyPreview(data))
         image_data_b64 = data.get('imageData', '')
         image_url = data.get('imageUrl', '')
         to_grayscale = bool(data.get('grayscale', True))
+        output_format = data.get('format', 'json')
+        if output_format not in ('json', 'base64', 'binary'):
+            return jsonify({"success": False, "error": f"不支持的 format: {output_format}"}), 400
+        try:
+            size, resample = _parse_preprocess_options(data)
+            dither = _parse_dither_option(data) if to_grayscale else 'none'
+        except (ValueError, TypeError) as e:
+            return jsonify({"success": False, "error": str(e)}), 400
 
         if not image_data_b64 and not image_url:
             return jsonify({"success": False, "error": "缺少 imageData 或 imageUrl"}), 400
 
-        image_bytes = None
         if image_data_b64:
             try:
-                image_bytes = base64.b64decode(image_data_b64)
+                image_bytes, digest = _fetch_image_bytes(image_data_b64=image_data_b64)
             except Exception as e:
                 return jsonify({"success": False, "error": f"imageData 解析失败: {str(e)}"}), 400
         else:
             try:
-                app.logger.info(f"下载图片: {image_url}")
-                r = requests.get(image_url, timeout=20)
-                r.raise_for_status()
-                image_bytes = r.content
+                image_bytes, digest = _fetch_image_bytes(image_url=image_url)
             except Exception as e:
                 return jsonify({"success": False, "error": f"下载图片失败: {str(e)}"}), 400
 
-        with Image.open(io.BytesIO(image_bytes)) as img:
-            if to_grayscale:
-                # 转灰度
-                img = img.convert('L')
-                
-                # 等比例缩放到64x64（保持宽高比）
-                img.thumbnail((64, 64), Image.LANCZOS)
-                
-                # 创建64x64黑底画布（居中填充）
-                canvas = Image.new('L', (64, 64), color=0)
-                x_offset = (64 - img.width) // 2
-                y_offset = (64 - img.height) // 2
-                canvas.paste(img, (x_offset, y_offset))
-                
-                # 转换为numpy数组
-                np_array = np.array(canvas)
-                height, width = 64, 64
-                flat = np_array.flatten().tolist()
-                mode = 'L'
-                
-                app.logger.info(f"图像等比例缩放: 原图 -> 64x64, 实际尺寸: {img.width}x{img.height}, 偏移: ({x_offset}, {y_offset})")
-                app.logger.info(f"数组长度: {len(flat)}, 期望: {width * height}")
-            else:
-                img = img.convert('RGBA') if img.mode == 'P' else img
-                np_array = np.array(img)
-                height, width = (np_array.shape[0], np_array.shape[1])
-                # 将多通道展开为一维数组返回
-                flat = np_array.flatten().tolist()
-                mode = img.mode
+        if to_grayscale:
+            np_array = _preprocess_grayscale(image_bytes, digest, size, resample)
+            np_array = _halftone_canvas(np_array, digest, size, resample, dither)
+            height, width = np_array.shape
+            mode = 'L'
+        else:
+            key = (digest, 'native')
+            np_array = image_cache.get('array', key)
+            # 原始模式与数组一同缓存：CMYK / I;16 等无法由数组形状/类型还原（CMYK 会被误判为 RGBA）
+            cached_mode = image_cache.get('raw', key + ('mode',))
+            mode = cached_mode.decode('ascii') if cached_mode is not None else None
+            if np_array is None or mode is None:
+                with Image.open(io.BytesIO(image_bytes)) as img:
+                    mode = 'RGBA' if img.mode == 'P' else img.mode  # 仅缺模式时只解析文件头，不解码像素
+                    if np_array is None:
+                        np_array = np.array(img.convert('RGBA') if img.mode == 'P' else img)
+                        image_cache.put('array', key, np_array)
+                image_cache.put('raw', key + ('mode',), mode.encode('ascii'))
+            height, width = (np_array.shape[0], np_array.shape[1])
+
+        image_id = _store_image_array(np_array, width, height, mode,
+                                      image_id=_image_array_id(digest, to_grayscale, size, resample, dither))
 
+        if output_format == 'binary':
+            # 原始 uint8 字节直接作为响应体，尺寸等信息放在响应头
+            return Response(np.ascontiguousarray(np_array, dtype=np.uint8).tobytes(),
+                            mimetype='application/octet-stream',
+                            headers={
+                                "X-Image-Width": str(width),
+                                "X-Image-Height": str(height),
+                                "X-Image-Mode": mode,
+                                "X-Image-Shape": ",".join(str(d) for d in np_array.shape),
+                                "X-Image-Id": image_id,
+                                "X-Image-Dither": dither,
+                            })
+        if output_format == 'base64':
+            payload = _encode_pixel_payload(np_array, mode)
+            payload.update({"success": True, "width": width, "height": height, "image_id": image_id,
+                            "dither": dither})
+            return jsonify(payload)
+
+        # 将多通道展开为一维数组返回
         return jsonify({
             "success": True,
             "width": width,
             "height": height,
             "mode": mode,
-            "array": flat
+            "array": np_array.ravel().tolist(),
+            "image_id": image_id,
+            "dither": dither
         })
     except Exception as e:
         app.logger.error(f"/api/image-to-array 失败: {e}")
@@ -948,52 +4554,203 @@ def image_to_grayscale():
     """将图片转为灰白，返回base64 PNG数据，避免前端跨域画布污染问题"""
     try:
         data = request.get_json() or {}
-        app.logger.info(f"/api/image-to-grayscale payload={json.dumps(data, ensure_ascii=False)[:800]}")
+        log_sampled("payload", "/api/image-to-grayscale payload=%s", LazyPreview(data))
         image_data_b64 = data.get('imageData', '')
         image_url = data.get('imageUrl', '')
+        try:
+            size, resample = _parse_preprocess_options(data)
+            dither = _parse_dither_option(data)
+        except (ValueError, TypeError) as e:
+            return jsonify({"success": False, "error": str(e)}), 400
 
         if not image_data_b64 and not image_url:
             return jsonify({"success": False, "error": "缺少 imageData 或 imageUrl"}), 400
 
-        if image_data_b64:
-            image_bytes = base64.b64decode(image_data_b64)
-        else:
-            app.logger.info(f"下载图片: {image_url}")
-            r = requests.get(image_url, timeout=20)
-            r.raise_for_status()
-            image_bytes = r.content
-
-        with Image.open(io.BytesIO(image_bytes)) as img:
-            # 转灰度
-            img = img.convert('L')
-            
-            # 等比例缩放到64x64（保持宽高比）
-            img.thumbnail((64, 64), Image.LANCZOS)
-            
-            # 创建64x64黑底画布（居中填充）
-            canvas = Image.new('L', (64, 64), color=0)
-            x_offset = (64 - img.width) // 2
-            y_offset = (64 - img.height) // 2
-            canvas.paste(img, (x_offset, y_offset))
-            
-            # 保存为base64
-            buf = io.BytesIO()
-            canvas.save(buf, format='PNG')
-            buf.seek(0)
-            out_b64 = base64.b64encode(buf.read()).decode()
-            
-            app.logger.info(f"灰度图等比例缩放: 原图 -> 64x64, 实际尺寸: {img.width}x{img.height}, 偏移: ({x_offset}, {y_offset})")
-            
-            return jsonify({
-                "success": True,
-                "image": out_b64,
-                "width": 64,
-                "height": 64
-            })
+        image_bytes, digest = _fetch_image_bytes(image_data_b64, image_url)
+        png_bytes = _grayscale_png(image_bytes, digest, size, resample, dither)
+
+        return jsonify({
+            "success": True,
+            "image": base64.b64encode(png_bytes).decode(),
+            "width": size,
+            "height": size
+        })
     except Exception as e:
         app.logger.error(f"/api/image-to-grayscale 失败: {e}")
         return jsonify({"success": False, "error": f"灰白图转换失败: {str(e)}"}), 500
 
 
+
+# ====== 图片生成后台任务（生成 -> 下载 -> 灰度 -> 帧编码 预先完成）======
+IMAGE_JOB_MAX_CONCURRENT = int(os.getenv("IMAGE_JOB_MAX_CONCURRENT", "2"))  # 同时调用豆包的任务数
+IMAGE_JOB_MAX_PENDING = int(os.getenv("IMAGE_JOB_MAX_PENDING", "16"))       # 未完成任务上限，超出返回 429
+MAX_FINISHED_IMAGE_JOBS = 50
+
+
+class ImageGenerationJob:
+    """一次图片生成任务：生成完成后立即下载并完成灰度预处理与 UART 帧编码"""
+
+    def __init__(self, prompt, size=DEFAULT_CANVAS_SIZE, resample='lanczos', dither='none'):
+        self.job_id = secrets.token_hex(8)
+        self.prompt = prompt
+        self.size = size
+        self.resample = resample
+        self.dither = dither
+        self.status = 'queued'  # queued / generating / preprocessing / ready / failed
+        self.image_url = ''
+        self.image_data = ''    # 占位图的 base64（豆包失败回退时）
+        self.fallback = False
+        self.image_id = None
+        self.frames_id = None
+        self.frame_count = 0
+        self.encoding_stats = None
+        self.error = ''
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stage_times = {}   # 各阶段耗时（秒），queued 为排队等待时间
+        self._stage_started = self.created_at
+
+    def set_status(self, status, error=''):
+        """更新任务状态并推送 image_job 事件"""
+        now = time.time()
+        self.stage_times[self.status] = round(now - self._stage_started, 3)
+        self._stage_started = now
+        self.status = status
+        if error:
+            self.error = error
+        if status in ('ready', 'failed'):
+            self.finished_at = now
+        event_broker.publish('image_job', self.to_dict(include_image=False))
+
+    def to_dict(self, include_image=True):
+        """include_image=False 时不含 imageUrl / imageData（SSE 事件广播给所有订阅者，不携带占位图 base64）"""
+        result = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "prompt": self.prompt,
+            "fallback": self.fallback,
+            "image_id": self.image_id,
+            "frames_id": self.frames_id,
+            "frame_count": self.frame_count,
+            "width": self.size,
+            "height": self.size,
+            "dither": self.dither,
+            "encoding_stats": self.encoding_stats,
+            "error": self.error,
+            "stage_times": self.stage_times,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if include_image:
+            result.update({"imageUrl": self.image_url, "imageData": self.image_data})
+        return result
+
+
+image_jobs = {}
+_image_jobs_lock = threading.Lock()
+_image_job_executor = concurrent.futures.ThreadPoolExecutor(max_workers=IMAGE_JOB_MAX_CONCURRENT,
+                                                            thread_name_prefix="image-job")
+
+
+def _run_image_job(job):
+    """后台执行：豆包生成（失败回退占位图）-> 下载 -> 灰度画布 -> 帧编码（半色调图用稀疏帧）"""
+    job.started_at = time.time()
+    job.set_status('generating')
+    try:
+        try:
+            job.image_url = _doubao_generate_image(job.prompt)
+            image_bytes, digest = _fetch_image_bytes(image_url=job.image_url)
+        except Exception as e:
+            app.logger.warning(f"图片任务 {job.job_id} 豆包生成失败，回退占位图: {e}")
+            job.error = f"豆包API失败，已使用占位图: {str(e)}"
+            job.fallback = True
+            job.image_data = base64.b64encode(_placeholder_image_bytes()).decode()
+            job.image_url = f"data:image/jpeg;base64,{job.image_data}"
+            image_bytes, digest = _fetch_image_bytes(image_data_b64=job.image_data)
+
+        job.set_status('preprocessing')
+        canvas = _preprocess_grayscale(image_bytes, digest, job.size, job.resample)
+        canvas = _halftone_canvas(canvas, digest, job.size, job.resample, job.dither)
+        _grayscale_png(image_bytes, digest, job.size, job.resample, job.dither)
+        height, width = canvas.shape
+        job.image_id = _store_image_array(canvas, width, height, 'L', image_id=_image_array_id(
+            digest, True, job.size, job.resample, job.dither))
+        # 二值位图的熄光像素可整点跳过，预编码为坐标寻址帧
+        encoding = 'dense' if job.dither == 'none' else 'sparse'
+        frames, job.encoding_stats, job.frames_id = _encode_fpga_frames(
+            job.image_id, canvas.ravel(), width, height, encoding, '', 1, FPGA_UART_BAUDRATE)
+        job.frame_count = len(frames)
+        job.set_status('ready')
+        app.logger.info(f"图片任务 {job.job_id} 完成: {job.stage_times}")
+    except Exception as e:
+        app.logger.error(f"图片任务 {job.job_id} 失败: {e}")
+        job.set_status('failed', f"生成失败: {str(e)}")
+
+
+def _submit_image_job(prompt, size=DEFAULT_CANVAS_SIZE, resample='lanczos', dither='none'):
+    """创建图片任务并交给有界线程池；未完成任务过多时返回 None"""
+    with _image_jobs_lock:
+        unfinished = sum(1 for j in image_jobs.values() if j.status not in ('ready', 'failed'))
+        if unfinished >= IMAGE_JOB_MAX_PENDING:
+            return None
+        job = ImageGenerationJob(prompt, size, resample, dither)
+        image_jobs[job.job_id] = job
+        finished = sorted((j for j in image_jobs.values() if j.status in ('ready', 'failed')),
+                          key=lambda j: j.created_at)
+        for old in finished[:max(0, len(finished) - MAX_FINISHED_IMAGE_JOBS)]:
+            image_jobs.pop(old.job_id, None)
+    event_broker.publish('image_job', job.to_dict(include_image=False))
+    _image_job_executor.submit(_run_image_job, job)
+    return job
+
+
+def _submit_image_job_response(prompt, data):
+    """/api/generate-image 与 /chat(mode=image) 的异步模式：返回 202 与任务ID"""
+    if not prompt:
+        return jsonify({"success": False, "error": "缺少图片描述"}), 400
+    try:
+        size = int(data.get('canvas_size', DEFAULT_CANVAS_SIZE))
+        resample = str(data.get('resample', 'lanczos')).lower()
+        size, resample = _parse_preprocess_options({"size": size, "resample": resample})
+        dither = _parse_dither_option(data)
+    except (ValueError, TypeError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    job = _submit_image_job(prompt, size, resample, dither)
+    if job is None:
+        return jsonify({"success": False, "error": f"图片生成任务过多（上限 {IMAGE_JOB_MAX_PENDING}），请稍后再试"}), 429
+    return jsonify({"success": True, "job_id": job.job_id, "status": job.status}), 202
+
+
+@app.route('/api/image-jobs', methods=['GET'])
+@login_required
+def list_image_jobs():
+    """列出图片生成任务（不含占位图数据）"""
+    with _image_jobs_lock:
+        jobs = sorted(image_jobs.values(), key=lambda j: j.created_at)
+    return jsonify({
+        "success": True,
+        "jobs": [dict(j.to_dict(), imageData='') for j in jobs],
+        "max_concurrent": IMAGE_JOB_MAX_CONCURRENT
+    })
+
+
+@app.route('/api/image-jobs/<job_id>', methods=['GET'])
+@login_required
+def get_image_job(job_id):
+    """查询图片生成任务状态；ready 时 image_id / frames_id 可直接用于转数组、发送与串口传输"""
+    with _image_jobs_lock:
+        job = image_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"任务不存在: {job_id}"}), 404
+    return jsonify({"success": True, "job": job.to_dict()})
+
+
 if __name__ == '__main__':
+    # VIRTUAL_FPGA=1（或 fpga / 秒数，作为 processing_delay）：启动时创建虚拟 FPGA 串口；
+    # 调试模式下只在实际提供服务的重载子进程中创建
+    if os.getenv("VIRTUAL_FPGA") and os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        _start_virtual_fpga(_parse_processing_delay(
+            None if os.getenv("VIRTUAL_FPGA") in ('1', 'true') else os.getenv("VIRTUAL_FPGA")))
     app.run(debug=True, host='0.0.0.0')
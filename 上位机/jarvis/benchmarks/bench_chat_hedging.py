@@ -0,0 +1,79 @@
+"""
+对冲路由尾延迟对比：只调用单个服务商（改造前） vs ChatProviderRouter 对冲（provider=auto）。
+使用本地模拟服务商：大部分请求很快，少量请求卡顿（模拟免费额度排队），另有一定失败率。
+用法：python benchmarks/bench_chat_hedging.py [--requests 200] [--stall-rate 0.1]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def mock_provider(name, base, stall, stall_rate, error_rate, rng):
+    """模拟服务商：base 秒左右返回，按 stall_rate 卡顿 stall 秒，按 error_rate 抛异常"""
+    def call(message):
+        r = rng.random()
+        time.sleep(base * rng.uniform(0.8, 1.2) + (stall if r < stall_rate else 0.0))
+        if rng.random() < error_rate:
+            raise RuntimeError(f"{name} 模拟失败")
+        return f"{name}: {message}"
+    return call
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1e3  # noqa: E731
+    return pick(0.5), pick(0.95), pick(0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--stall-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    app.app.logger.setLevel(logging.ERROR)
+    app.CHAT_HEDGE_MIN_DELAY = 0.005  # 模拟服务商的延迟按毫秒缩放，对冲等待下限同比缩小
+    rng = random.Random(0)
+    providers = {
+        "fast_flaky": mock_provider("fast_flaky", 0.02, 0.5, args.stall_rate, 0.05, rng),
+        "steady": mock_provider("steady", 0.04, 0.5, args.stall_rate / 4, 0.0, rng),
+        "slow": mock_provider("slow", 0.15, 0.5, args.stall_rate, 0.0, rng),
+    }
+
+    print(f"{'方式':>12} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'失败':>5}")
+    for name, call in providers.items():
+        latencies, failures = [], 0
+        for i in range(args.requests):
+            t0 = time.perf_counter()
+            try:
+                call(str(i))
+            except RuntimeError:
+                failures += 1
+            latencies.append(time.perf_counter() - t0)
+        p50, p95, p99 = percentiles(latencies)
+        print(f"{name:>12} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {failures:>5}")
+
+    router = app.ChatProviderRouter(providers)
+    latencies, failures = [], 0
+    for i in range(args.requests):
+        t0 = time.perf_counter()
+        try:
+            router.chat(str(i), timeout=5)
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - t0)
+    p50, p95, p99 = percentiles(latencies)
+    print(f"{'hedged':>12} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {failures:>5}")
+    for name, st in router.stats().items():
+        print(f"  {name:>10}: calls={st['calls']} wins={st['wins']} hedges={st['hedges']} "
+              f"error_rate={st['error_rate']} ewma={st['ewma_latency']} score={st['score']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+半色调性能与收益：各抖动算法在 64x64 ~ 1024x1024 画布上的耗时，
+误差扩散的波前向量化实现 vs 逐像素串行参考实现（同时校验两者逐位一致），
+以及二值位图改用坐标寻址帧后的帧数与预计雕刻耗时（对比灰度图逐像素稠密发送）。
+用法：python benchmarks/bench_dither.py [--sizes 64,128,256,512,1024] [--reference-max 256]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def make_canvas(size):
+    """渐变 + 同心圆 + 轻微噪声的灰度测试画布"""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:size, 0:size] / max(size - 1, 1)
+    rings = 0.5 + 0.5 * np.cos(np.hypot(xx - 0.5, yy - 0.5) * 40)
+    gray = 255 * (0.6 * xx + 0.4 * rings) + rng.normal(0, 4, (size, size))
+    return np.clip(gray, 0, 255).astype(np.uint8)
+
+
+def reference_error_diffusion(gray, method):
+    """逐像素串行的误差扩散参考实现，整数误差运算与 app._dither_error_diffusion 相同"""
+    divisor, taps = app.ERROR_DIFFUSION_KERNELS[method]
+    scale = app.DITHER_ERROR_SCALE
+    h, w = gray.shape
+    value = gray.astype(np.int64).tolist()
+    err = [[0] * w for _ in range(h)]
+    out = np.zeros((h, w), dtype=np.uint8)
+    for y in range(h):
+        for x in range(w):
+            v = value[y][x] * scale + err[y][x]
+            on = v >= 128 * scale
+            out[y, x] = app.DITHER_ON_LEVEL if on else 0
+            e = v - (255 * scale if on else 0)
+            for dy, dx, num in taps:
+                ty, tx = y + dy, x + dx
+                if ty < h and 0 <= tx < w:
+                    err[ty][tx] += (e * num) // divisor
+    return out
+
+
+def best_of(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def engrave_estimate(bitmap):
+    """(帧数, 预计雕刻耗时秒)：蛇形顺序逐帧发送"""
+    h, w = bitmap.shape
+    idx = np.flatnonzero(bitmap.ravel() >= 1)
+    order = app._plan_serpentine(idx, w)
+    return idx.size, app._estimate_job_time(order, w)[2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='64,128,256,512,1024')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--reference-max', type=int, default=256,
+                        help='串行参考实现只跑到该尺寸（更大尺寸耗时过长）')
+    args = parser.parse_args()
+
+    app.app.logger.setLevel(logging.WARNING)
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    print(f"{'尺寸':>6} {'方法':>16} {'耗时(ms)':>10} {'串行参考(ms)':>12} {'加速比':>7} {'一致':>4} "
+          f"{'出光像素':>9} {'帧数':>9} {'雕刻耗时(s)':>11}")
+    for size in sizes:
+        gray = make_canvas(size)
+        # 灰度图按稠密方式逐像素发送：每个像素都要移动 + 曝光
+        dense_time = app._estimate_job_time(app._plan_serpentine(np.arange(size * size), size), size)[2]
+        print(f"{size:>6} {'grayscale(dense)':>16} {'-':>10} {'-':>12} {'-':>7} {'-':>4} "
+              f"{int(np.count_nonzero(gray)):>9} {size * size:>9} {dense_time:>11.1f}")
+        for method in app.DITHER_METHODS[1:]:
+            t_fast, bitmap = best_of(lambda: app._halftone(gray, method), args.repeat)
+            ref_cell, speedup, same = '-', '-', '-'
+            if method in app.ERROR_DIFFUSION_KERNELS and size <= args.reference_max:
+                t_ref, ref = best_of(lambda: reference_error_diffusion(gray, method), 1)
+                ref_cell, speedup = f"{t_ref * 1e3:.1f}", f"{t_ref / t_fast:.1f}x"
+                same = 'yes' if np.array_equal(ref, bitmap) else 'NO'
+            frames, seconds = engrave_estimate(bitmap)
+            print(f"{size:>6} {method:>16} {t_fast * 1e3:>10.1f} {ref_cell:>12} {speedup:>7} {same:>4} "
+                  f"{int(np.count_nonzero(bitmap)):>9} {frames:>9} {seconds:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+FPGA 流水线时序仿真：坐标寻址编码（sparse / segment）在不同保护间隔下的
+总耗时、丢帧数、校验失败数与 move_fsm 利用率，以及仿真相对真实时间的加速比。
+模型常数已用 RTL 周期级仿真（uart_rx_image + move_fsm + stepper_ctrl）逐周期核对；dense 帧不在模型范围内，不参与对比。
+用法：python benchmarks/bench_fpga_pipeline.py [--size 64] [--baudrate 9600] [--guard-times 0,0.001,auto]
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+from bench_segment_encoding import make_images  # noqa: E402
+
+ENCODINGS = (('sparse', 'serpentine'), ('segment', 'serpentine'))
+
+
+def simulate(img, encoding, path_strategy, baudrate, guard_times, dwell_ticks):
+    size = img.shape[0]
+    flat = img.ravel()
+    image_id = app._store_image_array(flat, size, size)
+    frames, _, _ = app._encode_fpga_frames(image_id, flat, size, size, encoding, path_strategy, 1, baudrate)
+    reports = []
+    for guard in guard_times:
+        if guard == 'auto':
+            # 先按无保护间隔仿真，取报告中不丢帧所需的最小保护间隔再仿真一次
+            guard = app._simulate_fpga_pipeline(frames, baudrate, 0.0, dwell_ticks)['required_guard_time_s']
+        reports.append(app._simulate_fpga_pipeline(frames, baudrate, float(guard), dwell_ticks))
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=64)
+    parser.add_argument('--baudrate', type=int, default=app.FPGA_UART_BAUDRATE)
+    parser.add_argument('--dwell-ticks', type=int, default=app.MOVE_DWELL_TICKS)
+    parser.add_argument('--guard-times', default='0,0.001,auto',
+                        help='逗号分隔的每帧保护间隔（秒），auto 表示按仿真得到的最小不丢帧间隔')
+    args = parser.parse_args()
+
+    app.app.logger.setLevel(logging.WARNING)
+    guard_times = [g if g == 'auto' else float(g) for g in args.guard_times.split(',')]
+
+    print(f"{'图像':>16} {'编码':>8} {'保护间隔(s)':>11} {'帧数':>6} {'接收':>6} {'丢帧':>6} {'校验失败':>8} "
+          f"{'出光像素':>8} {'耗时(s)':>8} {'利用率':>6} {'仿真(ms)':>8} {'加速比':>8}")
+    for name, img in make_images(args.size).items():
+        for encoding, path_strategy in ENCODINGS:
+            for r in simulate(img, encoding, path_strategy, args.baudrate, guard_times, args.dwell_ticks):
+                speedup = r['job_time_s'] / max(r['sim_time_ms'] / 1000, 1e-6)
+                print(f"{name:>16} {encoding:>8} {r['guard_time_s']:>11.6f} {r['frames_sent']:>6} "
+                      f"{r['accepted_frames']:>6} {r['dropped_frames']:>6} {r['checksum_errors']:>8} "
+                      f"{r['pixels_burned']:>8} {r['job_time_s']:>8.2f} {r['utilisation']:>6.0%} "
+                      f"{r['sim_time_ms']:>8.1f} {speedup:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+FPGA 帧编码性能对比：逐帧 Python 循环 vs NumPy 向量化。
+用法：python benchmarks/bench_frame_encoder.py [--repeat 5]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+SIZES = [(64, 64), (256, 256), (1024, 1024)]
+
+
+def legacy_build_frames(array, width, height):
+    """改造前的逐帧实现，仅作为基准与字节一致性校验"""
+    frames = []
+    meta_frame = [0xAA, 0x00, 0x00, width & 0xFF, (width >> 8) & 0xFF,
+                  height & 0xFF, (height >> 8) & 0xFF, 0x00, 0x55]
+    meta_frame[7] = sum(meta_frame[:7]) & 0xFF
+    frames.append(meta_frame)
+    frame_count = 0
+    for i in range(0, len(array), 3):
+        frame_count = (frame_count + 1) & 0xFF
+        pixels = []
+        for j in range(3):
+            if i + j < len(array):
+                pixels.append(int(array[i + j]) & 0xFF)
+            else:
+                pixels.append(0)
+        data_frame = [0xAA, 0x01, frame_count] + pixels + [0x00, 0x55]
+        data_frame[6] = sum(data_frame[:6]) & 0xFF
+        frames.append(data_frame)
+    return frames
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app.app.logger.setLevel(logging.WARNING)
+    rng = np.random.default_rng(0)
+
+    print(f"{'尺寸':>10} {'帧数':>8} {'legacy(ms)':>12} {'buffer(ms)':>12} {'list(ms)':>10} {'加速比':>8}")
+    for width, height in SIZES:
+        array = rng.integers(0, 256, width * height).tolist()
+        t_legacy, legacy = best_of(lambda: legacy_build_frames(array, width, height), args.repeat)
+        t_buf, buf = best_of(lambda: app._build_fpga_frames_from_grayscale(array, width, height, as_list=False),
+                             args.repeat)
+        t_list, frames = best_of(lambda: app._build_fpga_frames_from_grayscale(array, width, height), args.repeat)
+
+        assert frames == legacy, f"{width}x{height} 帧内容不一致"
+        assert bytes(buf) == b''.join(bytes(f) for f in legacy), f"{width}x{height} 缓冲区字节不一致"
+
+        print(f"{width:>4}x{height:<5} {len(legacy):>8} {t_legacy * 1e3:>12.2f} {t_buf * 1e3:>12.2f} "
+              f"{t_list * 1e3:>10.2f} {t_legacy / t_buf:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+多设备并行吞吐：在本机 pty 上启动 N 台虚拟 FPGA（VirtualFPGADevice），全部经 /api/serial-connect 接入
+设备注册表，再用 /api/serial-dispatch 把一批图片的帧集分配到所有空闲设备，统计整批耗时、
+聚合吞吐（字节/秒）与相对单台的加速比，以及各设备分到的任务数与收帧数。
+仅限 Linux / macOS。
+用法：python benchmarks/bench_multi_device.py [--devices 1,2,4] [--images 8] [--size 48] [--baudrate 115200]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def make_batch(client, n_images, size):
+    """n 张不同灰度图，经 /api/send-to-fpga 编码为服务端帧集，返回 frames_id 列表"""
+    rng = np.random.default_rng(0)
+    frames_ids = []
+    for _ in range(n_images):
+        img = (rng.random((size, size)) * 255).astype(np.uint8)
+        img[rng.random((size, size)) < rng.uniform(0.2, 0.8)] = 0  # 每张图出光像素数不同，任务长短不一
+        resp = client.post('/api/send-to-fpga', json={
+            "array": img.ravel().tolist(), "width": size, "height": size,
+            "encoding": "sparse", "path_strategy": "serpentine", "frames": True, "preview_limit": 0,
+        }).get_json()
+        if not resp["success"]:
+            raise RuntimeError(resp["error"])
+        frames_ids.append(resp["frames_id"])
+    return frames_ids
+
+
+def run_once(client, n_devices, frames_ids, baudrate):
+    devices = [app.VirtualFPGADevice() for _ in range(n_devices)]
+    try:
+        for device in devices:
+            resp = client.post('/api/serial-connect', json={"port": device.port, "baudrate": baudrate}).get_json()
+            if not resp["success"]:
+                raise RuntimeError(resp["error"])
+        started = time.perf_counter()
+        resp = client.post('/api/serial-dispatch', json={
+            "items": [{"frames_id": f} for f in frames_ids],
+            "ports": [d.port for d in devices],
+        }).get_json()
+        if not resp["success"]:
+            raise RuntimeError(resp["error"])
+        while True:
+            jobs = client.get(f'/api/transmission-jobs?batch_id={resp["batch_id"]}').get_json()["jobs"]
+            if all(j["status"] in ('completed', 'cancelled', 'failed') for j in jobs):
+                break
+            time.sleep(0.02)
+        elapsed = time.perf_counter() - started
+        per_port = {d.port: sum(j["port"] == d.port for j in jobs) for d in devices}
+        return {
+            "elapsed": elapsed,
+            "bytes": sum(j["bytes_sent"] for j in jobs),
+            "frames": sum(j["sent_frames"] for j in jobs),
+            "failed": sum(j["error_count"] for j in jobs),
+            "estimated": max(resp["estimated_seconds"].values()),
+            "jobs_per_device": list(per_port.values()),
+            "device_frames": [d.frames_total for d in devices],
+        }
+    finally:
+        for device in devices:
+            client.post('/api/serial-disconnect', json={"port": device.port})
+            app.serial_devices.pop(device.port, None)
+            device.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', default='1,2,4')
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--size', type=int, default=48)
+    parser.add_argument('--baudrate', type=int, default=115200)
+    args = parser.parse_args()
+
+    app.app.logger.setLevel(logging.WARNING)
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+    frames_ids = make_batch(client, args.images, args.size)
+    print(f"{args.images} 张 {args.size}x{args.size} 图, {args.baudrate} bps")
+    print(f"{'设备数':>6} {'耗时(s)':>8} {'预计(s)':>8} {'聚合B/s':>9} {'加速比':>6} {'帧数':>7} {'失败':>5} "
+          f"{'各设备任务数':>14} {'各设备收帧':>20}")
+    base = None
+    for n in (int(v) for v in args.devices.split(',')):
+        r = run_once(client, n, frames_ids, args.baudrate)
+        rate = r["bytes"] / r["elapsed"]
+        base = base or rate
+        print(f"{n:>6} {r['elapsed']:>8.2f} {r['estimated']:>8.2f} {rate:>9.0f} {rate / base:>6.2f} "
+              f"{r['frames']:>7} {r['failed']:>5} {str(r['jobs_per_device']):>14} {str(r['device_frames']):>20}")
+
+
+if __name__ == '__main__':
+    main()
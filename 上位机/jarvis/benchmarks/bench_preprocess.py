@@ -0,0 +1,88 @@
+"""
+图片预处理性能对比：全分辨率解码后缩放（改造前） vs draft/reduce 预缩小（_preprocess_grayscale）。
+解码缓冲为解码器输出图像的字节数，是预处理阶段峰值内存的主要来源。
+用法：python benchmarks/bench_preprocess.py [--repeat 5] [--size 64]
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+INPUTS = [((2048, 2048), 'JPEG'), ((4096, 3072), 'JPEG'), ((2048, 2048), 'PNG')]
+
+
+def make_image(dims, fmt):
+    """生成带渐变和轻微噪声的测试图，压缩率接近真实生成图"""
+    w, h = dims
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:h, 0:w]
+    base = np.stack([(xx * 255 // w), (yy * 255 // h), ((xx + yy) * 255 // (w + h))], axis=-1)
+    arr = np.clip(base + rng.integers(-4, 4, base.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr, 'RGB').save(buf, format=fmt, quality=90)
+    return buf.getvalue()
+
+
+def legacy_preprocess(image_bytes, size):
+    """改造前的实现：先整图解码转灰度，再 LANCZOS 缩放"""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = img.convert('L')
+        img.thumbnail((size, size), Image.LANCZOS)
+        canvas = Image.new('L', (size, size), color=0)
+        canvas.paste(img, ((size - img.width) // 2, (size - img.height) // 2))
+    return np.array(canvas)
+
+
+def decoded_bytes(image_bytes, size, draft):
+    """解码器输出的图像字节数"""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        if draft:
+            gap = size * app.PREPROCESS_REDUCING_GAP
+            img.draft('L', (gap, gap))
+        return img.width * img.height * len(img.getbands())
+
+
+def best_of(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--size', type=int, default=64)
+    args = parser.parse_args()
+
+    app.app.logger.setLevel(logging.WARNING)
+    size = args.size
+
+    def draft_preprocess(image_bytes):
+        app.image_cache.clear()
+        return app._preprocess_grayscale(image_bytes, 'bench', size)
+
+    print(f"{'输入':>16} {'legacy(ms)':>11} {'draft(ms)':>10} {'加速比':>7} "
+          f"{'legacy解码(KB)':>14} {'draft解码(KB)':>13} {'平均像素差':>9}")
+    for (w, h), fmt in INPUTS:
+        image_bytes = make_image((w, h), fmt)
+        t_legacy, legacy = best_of(lambda: legacy_preprocess(image_bytes, size), args.repeat)
+        t_draft, draft = best_of(lambda: draft_preprocess(image_bytes), args.repeat)
+        diff = np.abs(legacy.astype(np.int16) - draft.astype(np.int16)).mean()
+        print(f"{f'{w}x{h} {fmt}':>16} {t_legacy * 1e3:>11.1f} {t_draft * 1e3:>10.1f} "
+              f"{t_legacy / t_draft:>6.1f}x {decoded_bytes(image_bytes, size, False) // 1024:>14} "
+              f"{decoded_bytes(image_bytes, size, True) // 1024:>13} {diff:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+线段编码收益：逐像素坐标帧（sparse） vs 同行等灰度合并的线段帧（segment），
+对比帧数、字节数与预计雕刻耗时（每帧 max(线上传输, 移动 + 曝光)），并校验参考解码器逐位还原。
+另可导出 RTL 仿真向量（tb_segment.v）并比对仿真输出：
+  python benchmarks/bench_segment_encoding.py --export-vectors sim_out
+  （在 sim_out 下用 Icarus 运行 tb_segment，生成 burn.txt）
+  python benchmarks/bench_segment_encoding.py --check-burn sim_out
+用法：python benchmarks/bench_segment_encoding.py [--size 64] [--baudrate 9600]
+"""
+import argparse
+import logging
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+TB_DWELL_TICKS = 200  # 与 tb_segment.v 的 DWELL 一致
+
+
+def make_images(size):
+    """几类典型雕刻图：线稿/文字、平涂图标、阈值二值化、误差扩散抖动、连续灰度照片"""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:size, 0:size] / max(size - 1, 1)
+    images = {}
+
+    lines = np.zeros((size, size), np.uint8)
+    for k in range(4, size, max(size // 8, 2)):
+        lines[k, size // 8:size - size // 8] = 255
+        lines[size // 8:size - size // 8, k] = 255
+    images['line_art'] = lines
+
+    icon = np.zeros((size, size), np.uint8)
+    icon[np.hypot(xx - 0.5, yy - 0.5) < 0.4] = 180
+    icon[(np.abs(xx - 0.5) < 0.15) & (np.abs(yy - 0.5) < 0.3)] = 60
+    images['flat_icon'] = icon
+
+    photo = np.clip(255 * (0.6 * xx + 0.4 * (0.5 + 0.5 * np.cos(np.hypot(xx - 0.5, yy - 0.5) * 25)))
+                    + rng.normal(0, 6, (size, size)), 0, 255).astype(np.uint8)
+    images['threshold'] = app._halftone(photo, 'threshold')
+    images['floyd_steinberg'] = app._halftone(photo, 'floyd_steinberg')
+    images['grayscale_photo'] = photo
+    return images
+
+
+def compare(img, baudrate):
+    size = img.shape[0]
+    flat = img.ravel()
+    idx = app._path_points(flat, size, 1)
+    rows = []
+    for strategy, serpentine in (('row_major', False), ('serpentine', True)):
+        order = app._plan_serpentine(idx, size) if serpentine else idx
+        _, _, sparse_time = app._estimate_job_time(order, size, baudrate)
+        buf, frame_lengths, runs = app._encode_segment_frames(flat, size, size, 1, serpentine)
+        _, _, seg_time = app._estimate_segment_job_time(runs, frame_lengths, baudrate)
+        decoded = app._render_frame_commands(app._decode_coordinate_frames(buf.tobytes()), size, size)
+        rows.append((strategy, idx.size, idx.size * app.DATA_FRAME_LEN, sparse_time,
+                     frame_lengths.size, buf.size, seg_time, np.array_equal(decoded, img)))
+    return rows
+
+
+def export_vectors(out_dir):
+    """导出 tb_segment.v 的输入（frames.hex / lens.hex），含一帧校验错误的线段帧"""
+    os.makedirs(out_dir, exist_ok=True)
+    img = np.zeros((10, 24), np.uint8)
+    img[1, 2:9] = 255
+    img[2, :] = 128
+    img[4, 5] = 60
+    img[5, 3:6] = 7
+    img[7] = np.repeat([0, 100, 200, 200, 0, 100], 4)
+    img[9, ::3] = 250
+    buf, frame_lengths, _ = app._encode_segment_frames(img.ravel(), 24, 10, 1, serpentine=True)
+    bad = bytearray(buf[:app.SEGMENT_FRAME_LEN].tobytes())
+    bad[-2] ^= 0x40  # 破坏校验和，RTL 与参考解码器均应丢弃
+    data = bytes(bad) + buf.tobytes()
+    lengths = [app.SEGMENT_FRAME_LEN] + frame_lengths.tolist() + [0]
+    with open(os.path.join(out_dir, 'frames.hex'), 'w') as f:
+        f.write('\n'.join(f"{b:02X}" for b in data) + '\n')
+    with open(os.path.join(out_dir, 'lens.hex'), 'w') as f:
+        f.write('\n'.join(f"{n:02X}" for n in lengths) + '\n')
+    print(f"已导出 {len(lengths) - 1} 帧 / {len(data)} 字节到 {out_dir}")
+
+
+def check_burn(out_dir):
+    """比对仿真出光记录与参考解码器：每个像素的位置、功率一致，且曝光不少于 DWELL"""
+    with open(os.path.join(out_dir, 'frames.hex')) as f:
+        data = bytes(int(tok, 16) for tok in f.read().split())
+    commands = app._decode_coordinate_frames(data)
+    width = max(x + n for x, _, n, _ in commands)
+    height = max(y for _, y, _, _ in commands) + 1
+    ref = app._render_frame_commands(commands, width, height)
+    expected = {(int(x), int(y)): int(ref[y, x]) * 1023 // 255 for y, x in zip(*np.nonzero(ref))}
+
+    burned, cycles = {}, {}
+    with open(os.path.join(out_dir, 'burn.txt')) as f:
+        for line in f:
+            x, y, power, n = map(int, line.split())
+            burned[(x, y)] = power
+            cycles[(x, y)] = cycles.get((x, y), 0) + n
+    short = {k: n for k, n in cycles.items() if n < TB_DWELL_TICKS}
+    ok = burned == expected and not short
+    print(f"像素 {len(expected)}, 仿真出光 {len(burned)}, "
+          f"{'一致' if burned == expected else f'不一致: 多 {set(burned) - set(expected)} 少 {set(expected) - set(burned)}'}"
+          f"{'' if not short else f', 曝光不足 {short}'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=64)
+    parser.add_argument('--baudrate', type=int, default=app.FPGA_UART_BAUDRATE)
+    parser.add_argument('--export-vectors', metavar='DIR')
+    parser.add_argument('--check-burn', metavar='DIR')
+    args = parser.parse_args()
+
+    app.app.logger.setLevel(logging.WARNING)
+    if args.export_vectors:
+        return export_vectors(args.export_vectors)
+    if args.check_burn:
+        sys.exit(0 if check_burn(args.check_burn) else 1)
+
+    print(f"{'图像':>16} {'路径':>10} {'坐标帧':>7} {'字节':>7} {'耗时(s)':>8} "
+          f"{'线段帧':>7} {'字节':>7} {'耗时(s)':>8} {'帧数比':>6} {'耗时比':>6} {'还原':>4}")
+    for name, img in make_images(args.size).items():
+        for strategy, n_sparse, b_sparse, t_sparse, n_seg, b_seg, t_seg, same in compare(img, args.baudrate):
+            print(f"{name:>16} {strategy:>10} {n_sparse:>7} {b_sparse:>7} {t_sparse:>8.1f} "
+                  f"{n_seg:>7} {b_seg:>7} {t_seg:>8.1f} {n_seg / max(n_sparse, 1):>6.2f} "
+                  f"{t_seg / max(t_sparse, 1e-9):>6.2f} {'yes' if same else 'NO':>4}")
+
+
+if __name__ == '__main__':
+    main()
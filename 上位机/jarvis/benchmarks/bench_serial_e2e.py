@@ -0,0 +1,102 @@
+"""
+端到端串口吞吐：不需要 FPGA，在本机 pty 上启动虚拟 FPGA（VirtualFPGADevice），
+经 /api/serial-connect + /api/serial-transmit 走完整的后台传输任务，统计
+上位机/设备端帧率、帧到达延迟（设备收齐时刻 - 上位机写入该帧的时刻）、丢失、busy 丢弃与校验失败帧数。
+仅限 Linux / macOS。
+用法：python benchmarks/bench_serial_e2e.py [--baudrates 115200,921600] [--frames 4000]
+      [--processing-delay none|fpga|秒数] [--corrupt-every 0]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def make_frames(n, corrupt_every):
+    """n 个蛇形扫描的坐标帧；每 corrupt_every 帧破坏一次校验和"""
+    width = 64
+    ys, xs = np.divmod(np.arange(n), width)
+    xs = np.where(ys % 2 == 1, width - 1 - xs, xs)
+    frames = []
+    for i, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+        body = [x >> 8, x & 0xFF, y >> 8, y & 0xFF, 200]
+        frame = [app.FRAME_HEADER] + body + [sum(body) & 0xFF, app.FRAME_TRAILER]
+        if corrupt_every and i % corrupt_every == corrupt_every - 1:
+            frame[-2] ^= 0xFF
+        frames.append(frame)
+    return frames
+
+
+def run_once(client, device, frames, baudrate, settle=0.5):
+    device.reset()
+    resp = client.post('/api/serial-connect', json={"port": device.port, "baudrate": baudrate}).get_json()
+    if not resp["success"]:
+        raise RuntimeError(resp["error"])
+    job_id = client.post('/api/serial-transmit', json={"frames": frames}).get_json()["job_id"]
+    while True:
+        job = client.get(f'/api/transmission-jobs/{job_id}').get_json()["job"]
+        if job["status"] in ('completed', 'cancelled', 'failed'):
+            break
+        time.sleep(0.05)
+    # 等设备端把串行时序上尚未“收完”的字节处理完
+    deadline = time.time() + settle + len(frames) * len(frames[0]) * 10 / baudrate
+    while time.time() < deadline and device.frames_total < len(frames):
+        time.sleep(0.02)
+    client.post('/api/serial-disconnect', json={"port": device.port})
+
+    # 上位机写入时刻：该设备的传输日志按帧记录（帧序号从 1 开始）
+    log = app._get_serial_device(device.port).log
+    host_ts = {entry[2] - 1: entry[1] for entry in list(log._entries) if entry[5]}
+    latencies = [ts - host_ts[i] for ts, i, _, _ in list(device.records) if i in host_ts]
+    stats = device.stats()
+    host_elapsed = job["finished_at"] - job["started_at"]
+    return {
+        "baudrate": baudrate,
+        "sent": job["sent_frames"],
+        "host_fps": job["sent_frames"] / host_elapsed if host_elapsed > 0 else 0.0,
+        "device_fps": stats["frames_per_s"],
+        "line_utilization": job["line_utilization"],
+        "lost": job["sent_frames"] - stats["frames_total"],
+        "received": stats["frames_received"],
+        "rejected": stats["frames_rejected"],
+        "checksum_errors": stats["checksum_errors"],
+        "latency_ms": np.percentile(np.array(latencies) * 1000, [50, 95, 100]) if latencies else [0, 0, 0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baudrates', default='115200,460800,921600')
+    parser.add_argument('--frames', type=int, default=4000)
+    parser.add_argument('--processing-delay', default='none', help='none / fpga / 每帧秒数')
+    parser.add_argument('--corrupt-every', type=int, default=0, help='每 N 帧破坏一次校验和，0 表示不破坏')
+    args = parser.parse_args()
+
+    app.app.logger.setLevel(logging.WARNING)
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+    device = app._start_virtual_fpga(app._parse_processing_delay(args.processing_delay))
+    frames = make_frames(args.frames, args.corrupt_every)
+    print(f"虚拟 FPGA: {device.port}, 处理延迟 {args.processing_delay}, {len(frames)} 帧")
+    print(f"{'波特率':>8} {'发送':>6} {'上位机fps':>9} {'设备fps':>8} {'线路利用率':>9} {'丢失':>5} "
+          f"{'接收':>6} {'busy丢弃':>8} {'校验失败':>8} {'延迟p50(ms)':>11} {'p95':>7} {'max':>7}")
+    try:
+        for baudrate in (int(b) for b in args.baudrates.split(',')):
+            r = run_once(client, device, frames, baudrate)
+            p50, p95, pmax = r["latency_ms"]
+            print(f"{r['baudrate']:>8} {r['sent']:>6} {r['host_fps']:>9.0f} {r['device_fps']:>8.0f} "
+                  f"{r['line_utilization']:>9.1%} {r['lost']:>5} {r['received']:>6} {r['rejected']:>8} "
+                  f"{r['checksum_errors']:>8} {p50:>11.1f} {p95:>7.1f} {pmax:>7.1f}")
+    finally:
+        app._stop_virtual_fpga()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,436 @@
+"""
+性能基准套件：图片 -> 激光流水线各阶段与 HTTP 接口的可复现基准，结果与已提交的基线 benchmarks/baseline.json 比较。
+覆盖 image_to_array 的解码缩放、_build_fpga_frames_from_grayscale 帧编码、大数组 JSON 序列化、传输日志轮询、
+串口写入（虚拟 FPGA pty），以及在本机多线程 WSGI 服务上用模拟服务商并发压测 Flask 路由。
+每项报告吞吐、延迟分位（p50/p95/p99）与峰值内存（tracemalloc，另跑一轮测量，不影响计时）。
+用法：
+  python benchmarks/suite.py                      # 运行全部用例并与基线比较，退化超出容差时退出码为 1
+  python benchmarks/suite.py --only frames,http   # 只运行名称包含这些关键字的用例
+  python benchmarks/suite.py --update-baseline    # 以本次结果覆盖基线（换机器或确认性能变化后）
+  python benchmarks/suite.py --output result.json # 另存本次结果
+"""
+import argparse
+import base64
+import concurrent.futures
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import PIL
+import requests
+from PIL import Image
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TIME_TOLERANCE = 0.5      # p50 比基线慢 50% 以上视为退化（不同负载下的计时抖动较大）
+MEMORY_TOLERANCE = 0.25   # 峰值内存比基线多 25% 以上视为退化
+MEMORY_SLACK_KB = 256     # 小于该绝对差的内存变化忽略
+MOCK_PROVIDER_DELAY = 0.02
+LOAD_CONCURRENCY = 8
+CASES = []
+
+
+def case(name, repeat, memory_repeat=1):
+    """
+    注册用例：被装饰的生成器完成准备工作后 yield measure，measure(n) 执行 n 次被测操作并返回
+    {"samples": [秒], "items": 处理量, "elapsed": 秒, "unit": 单位, "errors": n}；准备与清理不计入计时和内存
+    """
+    def register(fn):
+        CASES.append((name, contextlib.contextmanager(fn), repeat, memory_repeat))
+        return fn
+    return register
+
+
+def timed(fn, items_per_call, unit):
+    """返回逐次计时的 measure(n)，首次调用前预热一次"""
+    warmed = []
+
+    def measure(repeat):
+        if not warmed:
+            fn()
+            warmed.append(True)
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+        return {"samples": samples, "items": items_per_call * repeat, "elapsed": sum(samples), "unit": unit}
+    return measure
+
+
+def make_jpeg(size, quality=90):
+    """带渐变和轻微噪声的测试图，压缩率接近真实生成图"""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:size, 0:size]
+    base = np.stack([xx * 255 // size, yy * 255 // size, (xx + yy) * 255 // (2 * size)], axis=-1)
+    arr = np.clip(base + rng.integers(-4, 4, base.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr, 'RGB').save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def gray_canvas(size):
+    yy, xx = np.mgrid[0:size, 0:size]
+    return ((xx + yy) * 255 // (2 * size - 2)).astype(np.uint8).ravel()
+
+
+# ====== 流水线各阶段 ======
+def _decode_resize(size, target):
+    image_bytes = make_jpeg(size)
+    digest = app.ImageCache.content_hash(image_bytes)
+
+    def run():
+        app.image_cache.clear()  # 每次都走完整的解码 + 缩放
+        app._preprocess_grayscale(image_bytes, digest, target)
+    return timed(run, 1, 'img/s')
+
+
+@case('image_to_array.decode_resize_jpeg2048_to_64', repeat=20)
+def bench_decode_resize_small():
+    yield _decode_resize(2048, 64)
+
+
+@case('image_to_array.decode_resize_jpeg2048_to_512', repeat=10)
+def bench_decode_resize_large():
+    yield _decode_resize(2048, 512)
+
+
+def _dense_frames(size):
+    array = gray_canvas(size)
+    frame_count = len(app._build_fpga_frames_from_grayscale(array, size, size))
+    return timed(lambda: app._build_fpga_frames_from_grayscale(array, size, size), frame_count, 'frames/s')
+
+
+@case('frames.dense_256', repeat=20)
+def bench_frames_256():
+    yield _dense_frames(256)
+
+
+@case('frames.dense_1024', repeat=5)
+def bench_frames_1024():
+    yield _dense_frames(1024)
+
+
+@case('json.array_512', repeat=10)
+def bench_json_array():
+    array = gray_canvas(512)
+
+    def run():
+        with app.app.test_request_context():
+            app.jsonify({"success": True, "array": array.tolist(), "width": 512, "height": 512}).get_data()
+    yield timed(run, array.size, 'px/s')
+
+
+@case('json.frames_preview_256', repeat=10)
+def bench_json_frames():
+    frames = app._build_fpga_frames_from_grayscale(gray_canvas(256), 256, 256)
+
+    def run():
+        with app.app.test_request_context():
+            app.jsonify({"success": True, "uart_frame_preview": frames}).get_data()
+    yield timed(run, len(frames), 'frames/s')
+
+
+BENCH_LOG_PORT = 'bench'  # 只用于填充传输日志的注册表设备，不打开串口
+
+
+@contextlib.contextmanager
+def filled_transmission_log(n):
+    log = app._get_serial_device(BENCH_LOG_PORT, create=True).log
+    log.clear()
+    frame = bytes([0xAA, 0x00, 0x01, 0x00, 0x02, 0x80, 0x83, 0x55])
+    for i in range(n):
+        log.append(i + 1, frame, len(frame), True)
+    try:
+        yield log.last_seq
+    finally:
+        app.serial_devices.pop(BENCH_LOG_PORT, None)
+
+
+def logged_in_client():
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+    return client
+
+
+@case('transmission_log.poll_incremental_50', repeat=200)
+def bench_log_incremental():
+    client = logged_in_client()
+    with filled_transmission_log(app.TRANSMISSION_LOG_CAPACITY) as last:
+        yield timed(lambda: client.get(f'/api/transmission-log?since={last - 50}&port={BENCH_LOG_PORT}'), 1, 'req/s')
+
+
+@case('transmission_log.poll_full_2000', repeat=20)
+def bench_log_full():
+    client = logged_in_client()
+    with filled_transmission_log(app.TRANSMISSION_LOG_CAPACITY):
+        yield timed(lambda: client.get(f'/api/transmission-log?since=0&port={BENCH_LOG_PORT}'), 1, 'req/s')
+
+
+@case('serial.writer_pty_921600', repeat=3)
+def bench_serial_writer():
+    """后台传输任务的写入路径：虚拟 FPGA（pty）上按 921600 bps 限速写入 2000 个坐标帧"""
+    if not hasattr(os, 'openpty'):
+        yield None
+        return
+    frames = app._build_sparse_fpga_frames(np.full(2000, 200, np.uint8), 2000, 1)
+    device = app._start_virtual_fpga(line_rate=False)
+    serial_device = app._connect_serial_device(device.port, baudrate=921600)
+    errors = []
+
+    def run():
+        job = app.TransmissionJob(frames, port=device.port)
+        app._run_transmission_job(job, serial_device)
+        if job.sent_frames != len(frames):
+            errors.append(job.error or 'incomplete')
+    measure = timed(run, len(frames), 'frames/s')
+    try:
+        yield lambda repeat: dict(measure(repeat), errors=len(errors))
+    finally:
+        app._stop_virtual_fpga()
+        app.serial_devices.pop(device.port, None)
+
+
+# ====== Flask 路由并发压测（模拟服务商）======
+@contextlib.contextmanager
+def mocked_providers():
+    """把第三方调用替换为本地模拟：固定延迟后返回，不访问网络"""
+    def slow(value):
+        def call(*args, **kwargs):
+            time.sleep(MOCK_PROVIDER_DELAY)
+            return value
+        return call
+    saved = {name: getattr(app, name) for name in ('chat_with_openrouter', '_doubao_generate_image',
+                                                   'tts_with_xunfei')}
+    app.chat_with_openrouter = slow("模拟回复")
+    app._doubao_generate_image = slow("https://example.invalid/generated.png")
+    app.tts_with_xunfei = slow(b'\x00\x00' * 1600)
+    try:
+        yield
+    finally:
+        for name, fn in saved.items():
+            setattr(app, name, fn)
+
+
+@contextlib.contextmanager
+def local_server():
+    """本机多线程 WSGI 服务，返回 base_url"""
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def load_test(method, path, make_body, concurrency=LOAD_CONCURRENCY):
+    """
+    启动本机服务与模拟服务商后 yield measure：measure(total) 由 concurrency 个已登录会话并发请求 total 次，
+    返回逐请求延迟与非 2xx 数
+    """
+    with local_server() as base_url, mocked_providers():
+        sessions = []
+        for _ in range(concurrency):
+            session = requests.Session()
+            session.post(f"{base_url}/api/login", json={"username": "admin", "password": "123456"})
+            sessions.append(session)
+        seq = iter(range(1 << 30))
+        lock = threading.Lock()
+
+        def measure(total):
+            remaining = iter(range(total))
+            samples, errors = [], [0]
+
+            def worker(session):
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                        i = next(seq)
+                    t0 = time.perf_counter()
+                    resp = session.request(method, base_url + path, json=make_body(i) if make_body else None)
+                    elapsed = time.perf_counter() - t0
+                    with lock:
+                        samples.append(elapsed)
+                        errors[0] += resp.status_code >= 300
+            t0 = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+                for f in [pool.submit(worker, s) for s in sessions]:
+                    f.result()
+            return {"samples": samples, "items": total, "elapsed": time.perf_counter() - t0,
+                    "unit": 'req/s', "errors": errors[0]}
+        measure(concurrency)  # 预热：建立连接、填充缓存
+        yield measure
+
+
+@case('http.chat', repeat=200, memory_repeat=16)
+def bench_http_chat():
+    yield from load_test('POST', '/chat', lambda i: {"message": f"你好 {i}", "provider": "openrouter"})
+
+
+@case('http.generate_image', repeat=200, memory_repeat=16)
+def bench_http_generate_image():
+    yield from load_test('POST', '/api/generate-image', lambda i: {"prompt": f"一只猫 {i}"})
+
+
+@case('http.tts', repeat=200, memory_repeat=16)
+def bench_http_tts():
+    # 每次文本不同，不命中 TTS 缓存
+    yield from load_test('POST', '/tts', lambda i: {"text": f"测试语音 {i}", "provider": "xunfei"})
+
+
+@case('http.image_to_array_jpeg1024', repeat=100, memory_repeat=16)
+def bench_http_image_to_array():
+    image_b64 = base64.b64encode(make_jpeg(1024)).decode()
+    yield from load_test('POST', '/api/image-to-array', lambda i: {"imageData": image_b64})
+
+
+@case('http.send_to_fpga_sparse_64', repeat=200, memory_repeat=16)
+def bench_http_send_to_fpga():
+    image_id = app._store_image_array(gray_canvas(64), 64, 64)
+    yield from load_test('POST', '/api/send-to-fpga',
+                         lambda i: {"image_id": image_id, "encoding": "sparse", "preview_limit": 0})
+
+
+@case('http.transmission_log_poll', repeat=400, memory_repeat=16)
+def bench_http_log():
+    with filled_transmission_log(app.TRANSMISSION_LOG_CAPACITY) as last:
+        yield from load_test('GET', f'/api/transmission-log?since={last - 50}&port={BENCH_LOG_PORT}', None)
+
+
+# ====== 运行与基线比较 ======
+def summarize(result, peak_kb):
+    samples = np.asarray(result["samples"]) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "unit": result["unit"],
+        "throughput": round(result["items"] / result["elapsed"], 1) if result["elapsed"] > 0 else 0.0,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "peak_mem_kb": round(peak_kb, 1),
+        "errors": int(result.get("errors", 0)),
+    }
+
+
+def run_case(setup, repeat, memory_repeat):
+    with setup() as measure:
+        if measure is None:
+            return None
+        result = measure(repeat)
+        tracemalloc.start()
+        try:
+            measure(memory_repeat)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return summarize(result, peak / 1024)
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+    }
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """返回退化项列表 [(用例, 描述)]"""
+    regressions = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if cur["p50_ms"] > base["p50_ms"] * (1 + time_tolerance):
+            regressions.append((name, f"p50 {base['p50_ms']}ms -> {cur['p50_ms']}ms"))
+        if (cur["peak_mem_kb"] > base["peak_mem_kb"] * (1 + memory_tolerance)
+                and cur["peak_mem_kb"] - base["peak_mem_kb"] > MEMORY_SLACK_KB):
+            regressions.append((name, f"峰值内存 {base['peak_mem_kb']}KB -> {cur['peak_mem_kb']}KB"))
+        if cur["errors"] > base.get("errors", 0):
+            regressions.append((name, f"错误数 {base.get('errors', 0)} -> {cur['errors']}"))
+    return regressions
+
+
+def ratio(cur, base):
+    return f"{(cur / base - 1) * 100:+.0f}%" if base else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', default='', help='逗号分隔的关键字，只运行名称包含任一关键字的用例')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', default='')
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE)
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args()
+
+    app.app.logger.setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    keywords = [k for k in args.only.split(',') if k]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            stored = json.load(f)
+        baseline = stored.get("results", {})
+        if stored.get("environment", {}).get("platform") != environment()["platform"]:
+            print(f"注意: 基线环境为 {stored.get('environment', {}).get('platform')}，与本机不同，计时仅供参考")
+
+    print(f"{'用例':<46} {'吞吐':>14} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} "
+          f"{'峰值内存(KB)':>12} {'错误':>4} {'p50 vs 基线':>11}")
+    results = {}
+    for name, fn, repeat, memory_repeat in CASES:
+        if keywords and not any(k in name for k in keywords):
+            continue
+        r = run_case(fn, repeat, memory_repeat)
+        if r is None:
+            print(f"{name:<46} 跳过（当前平台不支持）")
+            continue
+        results[name] = r
+        base = baseline.get(name)
+        print(f"{name:<46} {r['throughput']:>9.0f} {r['unit']:<4} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r['peak_mem_kb']:>12.0f} {r['errors']:>4} "
+              f"{ratio(r['p50_ms'], base['p50_ms']) if base else '-':>11}")
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        if keywords and baseline:
+            # 只更新本次运行的用例，其余保留
+            report["results"] = {**baseline, **results}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"基线已更新: {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    for name, detail in regressions:
+        print(f"退化: {name}: {detail}")
+    if not baseline:
+        print("没有基线，使用 --update-baseline 生成")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,8 @@ class LaserImageAssistant {
     this.hasUploadedImage = false; // 跟踪是否已上传图片
     this.uploadedImageData = null; // 存储已上传的图片数据
     this.uploadedImageFile = null; // 存储已上传的文件对象
+    this.pixelIds = new WeakMap(); // 像素数组 -> 服务端 image_id，避免重复上传
+    this.frameSetIds = new WeakMap(); // 帧数组 -> 服务端 frames_id
     
     this.initElements();
     this.initEventListeners();
@@ -464,7 +466,7 @@ class LaserImageAssistant {
 
   // 调用生成图片API
   async callGenerateImageAPI(prompt) {
-    // TODO: 替换为实际的API端点
+    // 异步生成：提交后台任务，后端生成完成后会预先完成灰度与帧编码
     const response = await fetch('/api/generate-image', {
       method: 'POST',
       headers: {
@@ -473,15 +475,66 @@ class LaserImageAssistant {
       body: JSON.stringify({
         prompt: prompt,
         style: 'realistic', // 可选参数
-        size: '1024x1024'   // 可选参数
+        size: '1024x1024',  // 可选参数
+        async: true
       })
     });
 
-    if (!response.ok) {
+    if (!response.ok && response.status !== 429) {
       throw new Error(`HTTP error! status: ${response.status}`);
     }
 
-    return await response.json();
+    const result = await response.json();
+    if (response.status !== 202 || !result.job_id) return result;
+    return this.waitForImageJob(result.job_id);
+  }
+
+  // 等待图片生成任务 ready / failed：订阅 SSE 的 image_job 事件（不含图片数据），结束时再拉取一次完整任务
+  waitForImageJob(jobId, intervalMs = 1000, timeoutMs = 180000) {
+    return new Promise((resolve) => {
+      let events = null;
+      let pollTimer = null;
+      let finished = false;
+      const finish = (result) => {
+        if (finished) return;
+        finished = true;
+        clearTimeout(timeoutTimer);
+        clearInterval(pollTimer);
+        if (events) events.close();
+        resolve(result);
+      };
+      const timeoutTimer = setTimeout(() => finish({ success: false, error: '图片生成超时' }), timeoutMs);
+
+      // 查询完整任务（含 imageUrl / imageData）；订阅建立前任务可能已经结束
+      const syncJob = async () => {
+        try {
+          const response = await fetch(`/api/image-jobs/${jobId}`);
+          if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+          const { job } = await response.json();
+          if (job.status === 'ready') {
+            finish({ success: true, imageUrl: job.imageUrl, imageData: job.imageData, fallback: job.fallback,
+                     image_id: job.image_id, frames_id: job.frames_id });
+          } else if (job.status === 'failed') {
+            finish({ success: false, error: job.error });
+          }
+        } catch (error) {
+          finish({ success: false, error: error.message });
+        }
+      };
+
+      if (window.EventSource) {
+        events = new EventSource('/api/events');
+        events.addEventListener('open', syncJob);
+        events.addEventListener('image_job', (e) => {
+          const job = JSON.parse(e.data);
+          if (job.job_id === jobId && (job.status === 'ready' || job.status === 'failed')) syncJob();
+        });
+        return;
+      }
+
+      // 不支持 SSE 的浏览器：退回定时轮询
+      pollTimer = setInterval(syncJob, intervalMs);
+    });
   }
 
   // 播放TTS语音（浏览器内置speechSynthesis）
@@ -551,8 +604,9 @@ class LaserImageAssistant {
       this.addMessage('user', message);
       this.messageInput.value = '';
 
-      // 调用聊天API
+      // 调用聊天API：优先流式输出，浏览器不支持或流式接口失败时回退为整段返回
       const provider = this.providerSelect && this.providerSelect.value ? this.providerSelect.value : 'baidu';
+      if (await this.streamChatReply(message, provider)) return;
       const response = await fetch('/chat', {
         method: 'POST',
         headers: {
@@ -587,6 +641,71 @@ class LaserImageAssistant {
     }
   }
 
+  // 流式对话：逐 token 更新同一个气泡，完成后再整段播放语音；返回 false 表示需回退到 /chat
+  async streamChatReply(message, provider) {
+    if (!window.ReadableStream || !window.TextDecoder) return false;
+    let response;
+    try {
+      response = await fetch('/chat/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: message, provider: provider })
+      });
+    } catch (error) {
+      console.warn('流式对话不可用，回退为整段返回:', error);
+      return false;
+    }
+    if (!response.ok || !response.body) return false;
+
+    this.showLoading(false);  // 内容直接在气泡中逐步出现，不再遮挡
+    const bubble = this.addMessage('ai', '', true).querySelector('.chat-bubble-ai p');
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let reply = '';
+    let reasoning = '';
+    let finished = false;
+    while (!finished) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) >= 0) {
+        const block = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach(line => {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) data += line.slice(5).trim();
+        });
+        const payload = data ? JSON.parse(data) : {};
+        if (event === 'reasoning') {
+          reasoning += payload.text;
+          if (!reply) bubble.textContent = '思考中… ' + reasoning.slice(-80);
+        } else if (event === 'token') {
+          reply += payload.text;
+          bubble.textContent = reply;
+        } else if (event === 'done') {
+          reply = payload.reply || reply;
+          bubble.textContent = reply;
+          finished = true;
+        } else if (event === 'error') {
+          reply = reply || payload.error;
+          bubble.textContent = reply;
+          finished = true;
+        }
+        this.scrollToBottom();
+      }
+    }
+    if (reply.trim()) {
+      this.playTTS(reply);
+    } else {
+      bubble.textContent = '抱歉，没有收到回复';
+    }
+    return true;
+  }
+
   // 添加消息到聊天区域
   addMessage(role, content, isImage = false) {
     const messageDiv = document.createElement('div');
@@ -627,6 +746,7 @@ class LaserImageAssistant {
     if (role === 'ai' && !isImage && content.trim()) {
       this.playTTS(content);
     }
+    return messageDiv;
   }
 
   // 添加图片消息
@@ -1048,12 +1168,15 @@ class LaserImageAssistant {
         body: JSON.stringify({
           imageUrl: imageUrl && !imageUrl.startsWith('data:') ? imageUrl : '',
           imageData: imageDataAttr || (imageUrl.startsWith('data:') ? imageUrl.split(',')[1] : ''),
-          grayscale: true
+          grayscale: true,
+          format: 'base64'
         })
       });
       const result = await resp.json();
       if (!result.success) throw new Error(result.error || '后端转换失败');
-      this.showArrayModal(result.array, result.width, result.height);
+      const pixels = this.decodePixelPayload(result);
+      if (result.image_id) this.pixelIds.set(pixels, result.image_id);
+      this.showArrayModal(pixels, result.width, result.height);
     } catch (e) {
       console.error('后端转数组失败:', e);
       this.showToast('转数组失败: ' + e.message, 'error');
@@ -1062,6 +1185,52 @@ class LaserImageAssistant {
     }
   }
 
+  // 解码后端返回的像素载荷（base64 原始 uint8，兼容旧的 JSON 整数列表）
+  decodePixelPayload(result) {
+    if (result.encoding !== 'base64') return result.array;
+    const binary = atob(result.data);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return bytes;
+  }
+
+  // 将像素数组编码为 base64（原始 uint8），替代 JSON 整数列表上传
+  encodePixelPayload(array) {
+    const bytes = array instanceof Uint8Array ? array : Uint8Array.from(array);
+    let binary = '';
+    const chunk = 0x8000;  // 分块拼接，避免 apply 参数过多导致调用栈溢出
+    for (let i = 0; i < bytes.length; i += chunk) {
+      binary += String.fromCharCode.apply(null, bytes.subarray(i, i + chunk));
+    }
+    return btoa(binary);
+  }
+
+  // 提交像素相关请求：优先引用服务端 image_id，已过期(404)时回退为上传 base64 载荷
+  async postPixelRequest(url, array, width, height, params = {}) {
+    const post = (body) => fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ ...params, ...body })
+    });
+    const imageId = this.pixelIds.get(array);
+    if (imageId) {
+      const response = await post({ image_id: imageId });
+      if (response.status !== 404) return response.json();
+      this.pixelIds.delete(array);
+    }
+    const result = await (await post({ width: width, height: height, array_b64: this.encodePixelPayload(array) })).json();
+    if (result.image_id) this.pixelIds.set(array, result.image_id);
+    return result;
+  }
+
+  // 记录服务端帧集ID，串口传输时只需提交 frames_id
+  rememberFrameSet(result) {
+    if (result.success && result.frames_id && result.uart_frame_preview) {
+      this.frameSetIds.set(result.uart_frame_preview, result.frames_id);
+    }
+    return result;
+  }
+
   // 转换canvas为数组的核心函数
   convertCanvasToArray(canvas) {
     const ctx = canvas.getContext('2d');
@@ -1149,7 +1318,7 @@ class LaserImageAssistant {
     });
 
     modal.querySelector('.copy-array').addEventListener('click', () => {
-      navigator.clipboard.writeText(JSON.stringify(array)).then(() => {
+      navigator.clipboard.writeText(JSON.stringify(Array.from(array))).then(() => {
         this.showToast('数组已复制到剪贴板', 'success');
       });
     });
@@ -1190,7 +1359,7 @@ class LaserImageAssistant {
     const data = {
       width: width,
       height: height,
-      array: array,
+      array: Array.from(array),
       timestamp: new Date().toISOString()
     };
     
@@ -1211,19 +1380,7 @@ class LaserImageAssistant {
     this.showLoading(true);
     
     try {
-      const response = await fetch('/api/send-to-fpga', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          width: width,
-          height: height,
-          array: array
-        })
-      });
-
-      const result = await response.json();
+      const result = await this.postPixelRequest('/api/send-to-fpga', array, width, height, { frames: false });
       
       if (result.success) {
         this.showToast('数据已发送到FPGA', 'success');
@@ -1243,20 +1400,8 @@ class LaserImageAssistant {
     this.showLoading(true);
     
     try {
-      const response = await fetch('/api/send-to-fpga', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          width: width,
-          height: height,
-          array: array,
-          frames: true
-        })
-      });
-
-      const result = await response.json();
+      const result = this.rememberFrameSet(
+        await this.postPixelRequest('/api/send-to-fpga', array, width, height, { frames: true }));
       
       if (result.success) {
         this.showToast(`FPGA帧格式数据已发送，共${result.uart_frame_preview.length}帧`, 'success');
@@ -1278,20 +1423,8 @@ class LaserImageAssistant {
     this.showLoading(true);
     
     try {
-      const response = await fetch('/api/send-to-fpga', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          width: width,
-          height: height,
-          array: array,
-          frames: true
-        })
-      });
-
-      const result = await response.json();
+      const result = this.rememberFrameSet(
+        await this.postPixelRequest('/api/send-to-fpga', array, width, height, { frames: true }));
       
       if (result.success) {
         // 显示FPGA格式数据预览
@@ -1601,6 +1734,8 @@ class LaserImageAssistant {
     let currentFrameIndex = 0;
     let isTransmitting = false;
     let isPaused = false;
+    let currentJobId = null;
+    let connectedPort = null;
 
     const startBtn = modal.querySelector('#start-transmission');
     const pauseBtn = modal.querySelector('#pause-transmission');
@@ -1705,6 +1840,40 @@ class LaserImageAssistant {
     // 刷新串口列表
     modal.querySelector('#refresh-ports').addEventListener('click', detectSerialPorts);
 
+    // 串口断开后的界面状态（本页断开，或服务端推送的 serial 事件）
+    const markSerialDisconnected = (message) => {
+      isSerialConnected = false;
+      connectedPort = null;
+      serialConnectBtn.innerHTML = '<i class="fa fa-plug"></i> 打开串口';
+      serialConnectBtn.className = 'flex-1 px-3 py-2 bg-green-500 text-white rounded-lg hover:bg-green-600 transition-colors flex items-center justify-center gap-2';
+      serialStatus.textContent = '未连接';
+      serialStatus.className = 'font-medium text-red-600';
+      
+      // 添加断开日志
+      const logEntry = document.createElement('div');
+      logEntry.className = 'mb-1 text-red-400';
+      logEntry.innerHTML = `
+        <span class="text-gray-500">[${new Date().toLocaleString('zh-CN')}]</span>
+        <span class="text-red-300">[系统]</span>
+        <span class="text-white">${message}</span>
+      `;
+      displayArea.appendChild(logEntry);
+    };
+    
+    // 订阅服务端 serial 事件：本页连接的端口在别处被断开（其他标签页、虚拟 FPGA 停止等）时同步状态
+    const serialEvents = window.EventSource ? new EventSource('/api/events') : null;
+    if (serialEvents) {
+      serialEvents.addEventListener('serial', (e) => {
+        const data = JSON.parse(e.data);
+        if (data.event === 'disconnected' && isSerialConnected && data.port === connectedPort) {
+          markSerialDisconnected(`串口已断开 - ${data.port}`);
+        }
+      });
+    }
+    const closeSerialEvents = () => {
+      if (serialEvents) serialEvents.close();
+    };
+
     // 串口连接/断开
     serialConnectBtn.addEventListener('click', async () => {
       if (!isSerialConnected) {
@@ -1739,6 +1908,7 @@ class LaserImageAssistant {
           
           if (result.success) {
             isSerialConnected = true;
+            connectedPort = port;
             serialConnectBtn.innerHTML = '<i class="fa fa-unlink"></i> 关闭串口';
             serialConnectBtn.className = 'flex-1 px-3 py-2 bg-red-500 text-white rounded-lg hover:bg-red-600 transition-colors flex items-center justify-center gap-2';
             serialStatus.textContent = '已连接';
@@ -1766,27 +1936,16 @@ class LaserImageAssistant {
         // 真实串口断开
         try {
           const response = await fetch('/api/serial-disconnect', {
-            method: 'POST'
+            method: 'POST',
+            headers: {
+              'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ port: connectedPort })
           });
           
           const result = await response.json();
           
-          isSerialConnected = false;
-          serialConnectBtn.innerHTML = '<i class="fa fa-plug"></i> 打开串口';
-          serialConnectBtn.className = 'flex-1 px-3 py-2 bg-green-500 text-white rounded-lg hover:bg-green-600 transition-colors flex items-center justify-center gap-2';
-          serialStatus.textContent = '未连接';
-          serialStatus.className = 'font-medium text-red-600';
-          
-          // 添加断开日志
-          const logEntry = document.createElement('div');
-          logEntry.className = 'mb-1 text-red-400';
-          logEntry.innerHTML = `
-            <span class="text-gray-500">[${new Date().toLocaleString('zh-CN')}]</span>
-            <span class="text-red-300">[系统]</span>
-            <span class="text-white">串口已断开</span>
-          `;
-          displayArea.appendChild(logEntry);
-          
+          markSerialDisconnected('串口已断开');
           this.showToast('串口已断开', 'success');
         } catch (error) {
           console.error('串口断开失败:', error);
@@ -1837,24 +1996,27 @@ class LaserImageAssistant {
         
         const speed = calculateTransmissionTime();
         
-        // 立即开始实时日志更新
-        this.startRealTimeLogUpdate(displayArea, txCount, errorCount, transmittedFrames, progressBar, progressText);
-        
-        // 启动异步传输
-        fetch('/api/serial-transmit', {
+        // 启动异步传输：帧集已在服务端时只提交 frames_id，过期(404)再上传完整帧
+        const postTransmit = (body) => fetch('/api/serial-transmit', {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
           },
           body: JSON.stringify({
-            frames: frames,
+            ...body,
             interval: speed / 1000  // 转换为秒
           })
-        }).then(response => response.json())
+        });
+        const framesId = this.frameSetIds.get(frames);
+        (framesId ? postTransmit({ frames_id: framesId }) : Promise.resolve(null))
+        .then(response => (response && response.status !== 404) ? response : postTransmit({ frames: frames }))
+        .then(response => response.json())
         .then(result => {
           if (result.success) {
-            // 启动实际的传输
-            this.startActualTransmission(frames, speed / 1000);
+            // 后端已将任务放入后台队列，记录任务ID供暂停/取消使用，并只跟踪本任务的进度与日志
+            currentJobId = result.job_id;
+            this.startRealTimeLogUpdate(displayArea, txCount, errorCount, transmittedFrames, progressBar, progressText,
+                                        { jobId: result.job_id, port: result.port });
           } else {
             this.showToast(`传输启动失败: ${result.error}`, 'error');
           }
@@ -1869,6 +2031,10 @@ class LaserImageAssistant {
     pauseBtn.addEventListener('click', () => {
       if (isTransmitting) {
         isPaused = !isPaused;
+        if (currentJobId) {
+          fetch(`/api/transmission-jobs/${currentJobId}/${isPaused ? 'pause' : 'resume'}`, { method: 'POST' })
+            .catch(error => console.error('暂停/继续传输失败:', error));
+        }
         pauseBtn.innerHTML = isPaused ? '<i class="fa fa-play"></i>' : '<i class="fa fa-pause"></i>';
         pauseBtn.className = isPaused ? 
           'px-3 py-2 bg-green-500 text-white rounded-lg hover:bg-green-600 transition-colors' :
@@ -1883,6 +2049,11 @@ class LaserImageAssistant {
 
     // 停止传输函数
     this.stopTransmission = () => {
+      if (currentJobId) {
+        fetch(`/api/transmission-jobs/${currentJobId}/cancel`, { method: 'POST' })
+          .catch(error => console.error('取消传输失败:', error));
+        currentJobId = null;
+      }
       if (transmissionInterval) {
         clearInterval(transmissionInterval);
         transmissionInterval = null;
@@ -1916,6 +2087,7 @@ class LaserImageAssistant {
     modal.querySelectorAll('.close-fpga-assistant').forEach(btn => {
       btn.addEventListener('click', () => {
         this.stopTransmission();
+        closeSerialEvents();
         document.body.removeChild(modal);
       });
     });
@@ -1924,6 +2096,7 @@ class LaserImageAssistant {
     modal.addEventListener('click', (e) => {
       if (e.target === modal) {
         this.stopTransmission();
+        closeSerialEvents();
         document.body.removeChild(modal);
       }
     });
@@ -2359,22 +2532,36 @@ LaserImageAssistant.prototype.startActualTransmission = function(frames, interva
   });
 };
 
-// 实时日志更新函数
-LaserImageAssistant.prototype.startRealTimeLogUpdate = function(displayArea, txCount, errorCount, transmittedFrames, progressBar, progressText) {
+// 实时日志更新函数：target 为 { jobId, port }，只跟踪该任务的事件与该设备的传输日志
+LaserImageAssistant.prototype.startRealTimeLogUpdate = function(displayArea, txCount, errorCount, transmittedFrames, progressBar, progressText, target) {
+  const portQuery = target.port ? `&port=${encodeURIComponent(target.port)}` : '';
   let logUpdateInterval = null;
-  let lastLogCount = 0;
-  let isTransmissionComplete = false;
+  let eventSource = null;
+  let lastSeq = 0;
+  let isFetching = false;
   
-  // 开始实时更新
-  logUpdateInterval = setInterval(async () => {
+  const stopUpdates = () => {
+    if (logUpdateInterval) {
+      clearInterval(logUpdateInterval);
+      logUpdateInterval = null;
+    }
+    if (eventSource) {
+      eventSource.close();
+      eventSource = null;
+    }
+  };
+  
+  // 按序号增量获取新的日志条目
+  const fetchNewLogEntries = async () => {
+    if (isFetching) return null;
+    isFetching = true;
     try {
-      const response = await fetch('/api/transmission-log');
+      const response = await fetch(`/api/transmission-log?since=${lastSeq}${portQuery}`);
       const result = await response.json();
       
-      if (result.success && result.log.length > lastLogCount) {
+      if (result.success && result.log.length > 0) {
         // 显示新的日志条目
-        for (let i = lastLogCount; i < result.log.length; i++) {
-          const logEntry = result.log[i];
+        result.log.forEach(logEntry => {
           const logElement = document.createElement('div');
           logElement.className = 'mb-1';
           
@@ -2401,46 +2588,76 @@ LaserImageAssistant.prototype.startRealTimeLogUpdate = function(displayArea, txC
           `;
           
           displayArea.appendChild(logElement);
-        }
-        
-        // 更新计数器
-        const transmittedCount = result.log.filter(log => log.status === '成功').length;
-        const errorCount = result.log.filter(log => log.status !== '成功').length;
-        
-        txCount.textContent = transmittedCount;
-        errorCount.textContent = errorCount;
-        transmittedFrames.textContent = transmittedCount;
-        
-        // 更新进度条
-        const totalFrames = result.log.length;
-        const progress = totalFrames > 0 ? (transmittedCount / totalFrames) * 100 : 0;
-        progressBar.style.width = `${progress}%`;
-        progressText.textContent = `${progress.toFixed(1)}%`;
+        });
         
         // 自动滚动到底部
         displayArea.scrollTop = displayArea.scrollHeight;
         
-        lastLogCount = result.log.length;
-        
-        // 检查是否传输完成（假设总帧数为1367）
-        if (totalFrames >= 1367) {
-          isTransmissionComplete = true;
-          if (logUpdateInterval) {
-            clearInterval(logUpdateInterval);
-          }
-        }
+        lastSeq = result.next_seq;
       }
+      return result;
     } catch (error) {
       console.error('获取传输日志失败:', error);
+      return null;
+    } finally {
+      isFetching = false;
     }
-  }, 50); // 每50ms更新一次，更频繁
+  };
   
-  // 10秒后强制停止更新
-  setTimeout(() => {
-    if (logUpdateInterval) {
-      clearInterval(logUpdateInterval);
+  // 更新计数器与进度条
+  const updateProgress = (transmittedCount, failedCount, totalFrames) => {
+    txCount.textContent = transmittedCount;
+    errorCount.textContent = failedCount;
+    transmittedFrames.textContent = transmittedCount;
+    
+    const progress = totalFrames > 0 ? (transmittedCount / totalFrames) * 100 : 0;
+    progressBar.style.width = `${progress}%`;
+    progressText.textContent = `${progress.toFixed(1)}%`;
+  };
+  
+  // 其他任务（其他标签页、排队中的任务、其他端口上的任务）的事件一律忽略
+  const isTargetJob = (job) => job.job_id === target.jobId && (!target.port || job.port === target.port);
+  
+  const handleJob = (job) => {
+    if (!isTargetJob(job)) return;
+    updateProgress(job.sent_frames, job.error_count, job.total_frames);
+    fetchNewLogEntries();
+    if (['completed', 'cancelled', 'failed'].includes(job.status)) {
+      stopUpdates();
+      // 收尾：取完剩余日志
+      setTimeout(fetchNewLogEntries, 100);
     }
-  }, 10000);
+  };
+  
+  // 主动查询一次任务状态（订阅建立前任务可能已经结束）
+  const syncJob = async () => {
+    try {
+      const response = await fetch(`/api/transmission-jobs/${target.jobId}`);
+      const result = await response.json();
+      if (result.success) handleJob(result.job);
+    } catch (error) {
+      console.error('查询传输任务失败:', error);
+    }
+  };
+  
+  if (window.EventSource) {
+    // 服务端推送：进度事件到达时再增量拉取日志，不再定时轮询
+    eventSource = new EventSource('/api/events');
+    const onJobEvent = (e) => handleJob(JSON.parse(e.data));
+    eventSource.addEventListener('open', syncJob);
+    eventSource.addEventListener('job_progress', onJobEvent);
+    eventSource.addEventListener('job_status', onJobEvent);
+    eventSource.addEventListener('transmit_error', (e) => {
+      const data = JSON.parse(e.data);
+      if (data.job_id === target.jobId) {
+        console.error('串口传输错误:', data.error);
+      }
+    });
+    return;
+  }
+  
+  // 不支持 SSE 的浏览器：退回定时轮询本任务的状态
+  logUpdateInterval = setInterval(syncJob, 500);
 };
 
 // 导出给全局使用